@@ -3,17 +3,35 @@ import json
 import csv
 import io
 import logging
-import random
 import re
 import time
+import uuid
+import zlib
+from collections import deque
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, send_file, flash, redirect, url_for
+from flask import Flask, Response, g, render_template, request, jsonify, flash, redirect, url_for, stream_with_context
 import pandas as pd
 import resend
-from email_validator import validate_email, EmailNotValidError
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+import send_queue
+import async_sender
+import transports
+import config_cache
+import rate_limiter
+import storage
+import log_journal
+import template_engine
+import template_registry
+import experiments
+import message_spool
+import campaign_scheduler
+import email_validation
+import log_config
+import metrics
+
+# Configure logging: LOG_LEVEL, LOG_FORMAT=json and per-recipient sampling (see log_config.py)
+log_config.configure_logging()
+# Per-recipient messages go here so they can be sampled on large sends
+recipient_log = logging.getLogger(log_config.RECIPIENT_LOGGER)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
@@ -24,22 +42,45 @@ resend.api_key = os.environ.get("RESEND_API_KEY", "re_default_key")
 # Ensure data directory exists
 os.makedirs('data', exist_ok=True)
 
+# Initialize the database used for schools and email logs
+storage.init_storage(app)
+
+# Maximum number of emails per Resend batch request
+BATCH_SIZE = 100
+
+# CSV uploads are spooled here and imported in chunks by the queue
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "data/uploads")
+IMPORT_CHUNK_SIZE = int(os.environ.get("IMPORT_CHUNK_SIZE", "1000"))
+IMPORT_READ_SIZE = 64 * 1024
+
+# Schools loaded from the database at a time while a send job runs
+SEND_CHUNK_SIZE = 500
+
+# Log rows read per database batch (and per streamed chunk) when exporting
+EXPORT_BATCH_SIZE = 1000
+
+# Server-Sent Events progress stream: poll interval, results per event, throughput window,
+# keep-alive interval and how long one connection is held before the browser reconnects
+SSE_POLL_INTERVAL = 0.5
+SSE_MAX_RESULTS = 200
+SSE_RATE_WINDOW = 10.0
+SSE_HEARTBEAT = 15.0
+SSE_MAX_DURATION = float(os.environ.get("SSE_MAX_DURATION", "60"))
+
+# Page sizes for the paginated school and log APIs
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
 def load_json_file(filename, default=None):
-    """Load JSON file with fallback to default value"""
-    try:
-        with open(filename, 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return default if default is not None else []
+    """Load JSON file with fallback to default value (cached; treat the result as read-only)"""
+    return config_cache.load(filename, default if default is not None else [])
 
 def save_json_file(filename, data):
-    """Save data to JSON file"""
-    with open(filename, 'w') as f:
-        json.dump(data, f, indent=2)
+    """Save data to JSON file and refresh the cached copy"""
+    config_cache.save(filename, data)
 
 def initialize_templates():
     """Initialize email templates if they don't exist"""
-    templates_file = 'data/templates.json'
     default_templates = [
         {
             "id": 1,
@@ -103,49 +144,69 @@ def initialize_templates():
         }
     ]
 
-    if not os.path.exists(templates_file):
-        save_json_file(templates_file, default_templates)
-    return load_json_file(templates_file, default_templates)
+    return template_registry.ensure_templates(default_templates)
 
 def validate_email_address(email):
-    """Validate email address format"""
-    try:
-        # Validate and get info about the email
-        validated_email = validate_email(email)
-        return True, validated_email.email
-    except EmailNotValidError:
-        return False, email
+    """Validate email address format (cached; see email_validation.py)"""
+    return email_validation.validate_address(email)
 
-def replace_placeholders(text, school_data):
+def replace_placeholders(text, school_data, template_id=None):
     """Replace placeholders in email content with school data"""
-    placeholders = {
-        '{{school_name}}': school_data.get('School Name', ''),
-        '{{contact_person}}': school_data.get('Contact Person', ''),
-        '{{city}}': school_data.get('City', ''),
-        '{{email}}': school_data.get('Email', '')
-    }
-
-    result = text
-    for placeholder, value in placeholders.items():
-        result = result.replace(placeholder, str(value))
-
-    return result
+    # Templates are compiled once and cached by id + content hash
+    return template_engine.render_text(text, school_data, template_id)
 
 def load_settings():
     """Load email settings from file"""
     return load_json_file('data/settings.json', {})
 
+def current_transport():
+    """Return the email transport picked on the settings page (or EMAIL_TRANSPORT)"""
+    return transports.get_transport(load_settings().get('transport'))
+
+@app.before_request
+def start_request_timing():
+    """Start timing the request and collecting its Server-Timing phases"""
+    g.request_started = time.perf_counter()
+    metrics.start_request()
+
+@app.after_request
+def record_request_timing(response):
+    """Observe the request's latency by route and add the Server-Timing header if enabled"""
+    elapsed = time.perf_counter() - g.request_started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.HTTP_REQUEST_SECONDS.observe(elapsed, route=route, method=request.method, status=response.status_code)
+    if metrics.SERVER_TIMING:
+        response.headers['Server-Timing'] = metrics.server_timing(metrics.request_phases(), elapsed)
+    return response
+
 @app.route('/')
 def index():
-    """Main dashboard page"""
-    schools = load_json_file('data/schools.json', [])
-    templates = load_json_file('data/templates.json', [])
-    logs = load_json_file('data/logs.json', [])
+    """Main dashboard page (school and log rows are fetched lazily from the paginated APIs)"""
+    templates = template_registry.all_templates()
+
+    # Show progress for a CSV import started by /upload, or its outcome once finished
+    import_job = None
+    job_id = request.args.get('import_job')
+    if job_id:
+        job = send_queue.get_job(job_id)
+        if job and job['kind'] == 'import_schools':
+            if job['status'] == 'done':
+                flash(job['result']['message'], job['result']['status'])
+            elif job['status'] == 'failed':
+                flash(f"Error uploading file: {job['error']}", 'error')
+            else:
+                import_job = job
 
     return render_template('index.html', 
-                         schools=schools, 
+                         school_count=storage.count_schools(), 
                          templates=templates, 
-                         logs=logs)
+                         import_job=import_job,
+                         **log_counts())
+
+def log_counts():
+    """Return the log totals shown on the dashboard, read from the pre-aggregated counters"""
+    totals = storage.log_totals()
+    return {'log_count': totals['total'], 'error_count': totals['error']}
 
 @app.route('/upload', methods=['POST'])
 def upload_csv():
@@ -164,38 +225,17 @@ def upload_csv():
             flash('Please upload a CSV file', 'error')
             return redirect(url_for('index'))
 
-        # Read CSV file
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        csv_input = csv.DictReader(stream)
-
-        schools = []
-        invalid_emails = []
-        for row in csv_input:
-            # Clean and validate row data
-            school = {key.strip(): value.strip() for key, value in row.items() if value.strip()}
-            if school.get('School Name') and school.get('Email'):
-                # Validate email format
-                is_valid, clean_email = validate_email_address(school['Email'])
-                if is_valid:
-                    school['Email'] = clean_email  # Use cleaned email
-                    schools.append(school)
-                else:
-                    invalid_emails.append({'school': school.get('School Name', 'Unknown'), 'email': school.get('Email', '')})
-                    logging.warning(f"Invalid email for {school.get('School Name', 'Unknown')}: {school.get('Email', '')}")
-
-        if not schools:
-            flash('No valid school records found in CSV. Make sure you have School Name and Email columns.', 'error')
-            return redirect(url_for('index'))
+        # Spool the upload to disk in chunks; the import job streams it from there
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}.csv")
+        file.save(path, buffer_size=IMPORT_READ_SIZE)
 
-        # Save schools data
-        save_json_file('data/schools.json', schools)
-        
-        # Report results with validation info
-        success_msg = f'Successfully uploaded {len(schools)} schools'
-        if invalid_emails:
-            success_msg += f' ({len(invalid_emails)} schools skipped due to invalid emails)'
-            logging.info(f"Skipped schools with invalid emails: {invalid_emails}")
-        flash(success_msg, 'success')
+        job_id = send_queue.enqueue('import_schools', {
+            'path': path,
+            'filename': file.filename
+        }, total=os.path.getsize(path))
+        flash(f'Importing {file.filename}...', 'success')
+        return redirect(url_for('index', import_job=job_id))
 
     except Exception as e:
         logging.error(f"Error uploading CSV: {str(e)}")
@@ -203,35 +243,110 @@ def upload_csv():
 
     return redirect(url_for('index'))
 
+def clean_school_row(row):
+    """Strip a CSV row and drop empty values"""
+    return {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+
+def run_import_job(job_id, payload):
+    """Stream an uploaded CSV into the school list in chunks, reporting progress as bytes read"""
+    path = payload['path']
+    size = os.path.getsize(path)
+    counts = {'inserted': 0, 'updated': 0, 'contacted': 0, 'duplicates': 0}
+    invalid_emails = []
+    invalid_count = 0
+
+    try:
+        with open(path, 'rb') as raw:
+            # Decode incrementally; utf-8-sig also strips the BOM Excel adds
+            stream = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+            for chunk in read_school_chunks(stream, IMPORT_CHUNK_SIZE):
+                valid, invalid = validate_school_chunk(chunk)
+                # Merge on normalized email so re-uploads update rows instead of duplicating them
+                for key, value in storage.merge_schools(valid, upload_id=job_id).items():
+                    counts[key] += value
+                invalid_count += len(invalid)
+                # Keep only a sample of invalid rows for the summary
+                invalid_emails.extend(invalid[:max(0, 100 - len(invalid_emails))])
+                send_queue.set_progress(job_id, raw.tell())
+    finally:
+        os.remove(path)
+
+    imported = counts['inserted'] + counts['updated']
+    if not imported:
+        return {
+            'status': 'error',
+            'message': 'No valid school records found in CSV. Make sure you have School Name and Email columns.',
+            'imported': 0,
+            'invalid': invalid_count
+        }
+
+    send_queue.set_progress(job_id, size)
+
+    message = f"Successfully uploaded {imported} schools ({counts['inserted']} new, {counts['updated']} updated)"
+    if counts['duplicates']:
+        message += f", {counts['duplicates']} duplicate rows merged"
+    if counts['contacted']:
+        message += f", {counts['contacted']} already contacted"
+    if invalid_count:
+        message += f' ({invalid_count} schools skipped due to invalid emails)'
+        logging.info("Skipped %d schools with invalid emails, e.g. %s", invalid_count, invalid_emails[:10])
+    return {
+        'status': 'success',
+        'message': message,
+        'imported': imported,
+        'invalid': invalid_count,
+        'invalid_examples': invalid_emails,
+        'upload_id': job_id,
+        **counts
+    }
+
+def read_school_chunks(stream, chunk_size):
+    """Yield lists of cleaned school rows that have a name and email"""
+    chunk = []
+    for row in csv.DictReader(stream):
+        school = clean_school_row(row)
+        if school.get('School Name') and school.get('Email'):
+            chunk.append(school)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+def validate_school_chunk(chunk):
+    """Validate the emails in a chunk of school rows; return (valid, invalid)"""
+    valid = []
+    invalid = []
+    # Validate the whole chunk at once so lookups run in parallel and hit the cache
+    results = email_validation.validate_many([school['Email'] for school in chunk])
+    for school in chunk:
+        is_valid, clean_email = results[school['Email']]
+        if is_valid:
+            school['Email'] = clean_email  # Use cleaned email
+            valid.append(school)
+        else:
+            invalid.append({'school': school.get('School Name', 'Unknown'), 'email': school.get('Email', '')})
+            recipient_log.warning("Invalid email for %s: %s", school.get('School Name', 'Unknown'), school.get('Email', ''))
+    return valid, invalid
+
+send_queue.register_handler('import_schools', run_import_job)
+
 @app.route('/preview', methods=['POST'])
 def preview_email():
     """Preview email with replaced placeholders"""
     try:
         data = request.get_json()
         template_id = data.get('template_id')
-        school_index = data.get('school_index', 0)
+        school_id = data.get('school_id')
         custom_content = data.get('custom_content')
         custom_subject = data.get('custom_subject')
         custom_html_content = data.get('custom_html_content')
 
-        schools = load_json_file('data/schools.json', [])
-        templates = load_json_file('data/templates.json', [])
-
-        if not schools:
-            return jsonify({'error': 'No schools uploaded'}), 400
-
-        if school_index >= len(schools):
-            return jsonify({'error': 'Invalid school index'}), 400
-
-        school = schools[school_index]
-
-        # Find template
-        template = None
-        for t in templates:
-            if t['id'] == template_id:
-                template = t
-                break
+        school = storage.get_school(school_id)
+        if not school:
+            return jsonify({'error': 'School not found'}), 400
 
+        template = template_registry.get_template(template_id)
         if not template:
             return jsonify({'error': 'Template not found'}), 400
 
@@ -241,9 +356,10 @@ def preview_email():
         html_content = custom_html_content if custom_html_content else template.get('content_html', '')
 
         # Replace placeholders
-        preview_subject = replace_placeholders(subject, school)
-        preview_content = replace_placeholders(content, school)
-        preview_html = replace_placeholders(html_content, school) if html_content else ''
+        with metrics.timer(metrics.RENDER_SECONDS, 'render', kind='preview'):
+            preview_subject = replace_placeholders(subject, school, template_id)
+            preview_content = replace_placeholders(content, school, template_id)
+            preview_html = replace_placeholders(html_content, school, template_id) if html_content else ''
 
         return jsonify({
             'subject': preview_subject,
@@ -256,273 +372,555 @@ def preview_email():
         logging.error(f"Error previewing email: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def append_logs(entries):
+    """Append log entries to the email log journal"""
+    log_journal.append(entries)
+
+def remove_sent_schools(school_ids):
+    """Mark successfully contacted schools so they drop off the schools list"""
+    school_ids = [school_id for school_id in school_ids if school_id is not None]
+    if school_ids:
+        storage.mark_contacted(school_ids)
+
+def run_send_job(job_id, payload):
+    """Queue handler: send template emails to the schools selected in the job payload"""
+    if payload.get('ab_testing', False):
+        # Thompson-sampling weights from per-template delivery stats (see experiments.py); the slices
+        # of a scheduled campaign share one experiment, so each carries on from the results before it
+        if payload.get('campaign_id') is not None:
+            experiment = experiments.campaign_experiment(payload['campaign_id'], job_id, template_registry.template_ids())
+        else:
+            experiment = experiments.Experiment(job_id, template_registry.template_ids())
+        assign = lambda recipients, variants: [experiment.assign(recipient, variant)
+                                               for recipient, variant in zip(recipients, variants)]
+    else:
+        assign = lambda recipients, variants: [payload.get('template_id')] * len(recipients)
+    summary = run_campaign(
+        job_id, payload,
+        lambda schools, recipients, variants: render_school_emails(schools, payload, assign(recipients, variants)),
+        batch_mode=payload.get('batch_mode', False)
+    )
+
+    successful_count = summary['states'].get(send_queue.SENT, 0)
+    error_count = summary['states'].get(send_queue.FAILED, 0)
+    error_categories = summary['error_categories']
+    total_processed = successful_count + error_count
+    summary_message = f'Batch completed: {successful_count} sent, {error_count} failed out of {total_processed} schools'
+    if error_categories:
+        error_details = ', '.join([f"{count} {category}" for category, count in error_categories.items()])
+        summary_message += f'. Errors: {error_details}'
+
+    logging.info(f"Batch summary: {summary_message}")
+
+    return {
+        'message': summary_message,
+        'summary': {
+            'total_processed': total_processed,
+            'successful': successful_count,
+            'failed': error_count,
+            'removed_schools': successful_count,
+            'error_categories': error_categories,
+            'variants': summary['variants'],
+            'timings': summary['timings']
+        }
+    }
+
+def run_campaign(job_id, payload, render, batch_mode=False):
+    """Send a job's emails with per-recipient checkpoints; return the job's recipient summary
+
+    Messages are rendered a chunk at a time into an on-disk spool (message_spool.py) just
+    ahead of sending, so the next chunk renders while the current one is in flight and an
+    A/B job's variant weights take in the results sent so far. Each recipient moves
+    pending -> sending -> sent/failed in the queue database, so a job resumed after its
+    worker died reuses a completed spool (or re-renders with the checkpointed variants),
+    skips finished recipients and re-sends the ones caught mid-send under their original
+    idempotency key, which the provider deduplicates (SMTP can't, so there a resume may repeat
+    the groups that were in flight). Sends run on the asyncio engine in
+    async_sender.py with several requests in flight.
+    """
+    # Jobs keep the provider they were queued with, so a resumed job's idempotency keys still apply
+    transport = transports.get_transport(payload.get('transport') or load_settings().get('transport'))
+    if message_spool.exists(job_id):
+        # Rendered in full before a restart
+        header, rows = message_spool.read(job_id)
+        from_address = header['from']
+        spooled = chunk_spool_rows(rows)
+    else:
+        # The sender is resolved once per campaign rather than once per message
+        from_address = sender_address()
+        spooled = spool_messages(job_id, payload, render, from_address)
+    try:
+        started = time.monotonic()
+        async_sender.run(
+            plan_sends(job_id, iter_spool_chunks(spooled, from_address), batch_mode),
+            lambda group: deliver_group(transport, group),
+            lambda outcomes: record_outcomes(job_id, outcomes),
+            # Checkpointed just before their provider calls, so after a crash only the groups that
+            # were in flight are sent again rather than a whole chunk
+            checkpoint=lambda groups: checkpoint_groups(job_id, groups)
+        )
+        send_seconds = time.monotonic() - started
+        spool_stats = message_spool.stats(job_id)
+    except Exception:
+        # A failed job isn't resumed, so its spool would never be read again
+        message_spool.remove(job_id)
+        raise
+    finally:
+        # A render cut short by a failed send discards its partial spool
+        spooled.close()
+    message_spool.remove(job_id)
+
+    # Make sure every log entry from this job is on disk and visible to the dashboard
+    log_journal.sync()
+    log_journal.compact(wait=True)
+
+    summary = send_queue.recipient_summary(job_id)
+    summary['timings'] = {
+        'render_seconds': round(spool_stats['seconds'], 3),
+        'rendered': spool_stats['messages'],
+        'spool_bytes': spool_stats['bytes'],
+        # Includes rendering the chunks after the first, which overlaps sending
+        'send_seconds': round(send_seconds, 3)
+    }
+    logging.info(f"Job {job_id} timings: {summary['timings']}")
+    return summary
+
+def spool_messages(job_id, payload, render, from_address):
+    """Render a job's pending recipients into its message spool, yielding each chunk of rows as it is written
+
+    render(schools, recipients, variants) returns a (template, subject, text, html) tuple per
+    school, where variants holds each recipient's checkpointed template id (None if new).
+    Chunks are rendered only when the send stage asks for them, so an A/B render sees the
+    results of the chunks sent before it. The spool is published once every row is written.
+    """
+    total = len(payload.get('school_ids', payload.get('schools', [])))
+    processed = 0
+    render_seconds = 0.0
+    spool = message_spool.SpoolWriter(job_id, {'from': from_address})
+    try:
+        for chunk in iter_job_chunks(payload):
+            checkpoints = send_queue.load_recipients(job_id, [recipient_key(school) for school in chunk])
+            already_sent = []
+            schools = []
+            for school in chunk:
+                processed += 1
+                recipient = recipient_key(school)
+                checkpoint = checkpoints[recipient]
+                if checkpoint['state'] == send_queue.SENT:
+                    already_sent.append(school.get('id'))
+                    continue
+                if checkpoint['state'] == send_queue.FAILED:
+                    continue
+
+                # Skip schools with missing data or invalid emails before rendering
+                outcome = check_school_data(school)
+                if outcome:
+                    outcome[1]['recipient'] = recipient
+                    record_outcomes(job_id, [outcome])
+                    continue
+                schools.append(school)
+
+            # Sent before a restart but not yet marked contacted
+            remove_sent_schools(already_sent)
+            if not schools:
+                continue
+
+            recipients = [recipient_key(school) for school in schools]
+            started = time.monotonic()
+            # A recipient checkpointed before a restart is rendered with the variant it was sent
+            rendered = render(schools, recipients, [checkpoints[recipient]['variant'] for recipient in recipients])
+            elapsed = time.monotonic() - started
+            render_seconds += elapsed
+            metrics.RENDER_SECONDS.observe(elapsed, kind='campaign')
+            rows = [
+                [recipient, school.get('id'), school['School Name'], school['Email'],
+                 template['id'], template['name'], subject, text, html]
+                for recipient, school, (template, subject, text, html) in zip(recipients, schools, rendered)
+            ]
+            spool.write(rows)
+            # A slow render mustn't let the lease lapse and another worker claim the job
+            send_queue.touch(job_id)
+            logging.debug("Rendered %d/%d recipients for job %s", processed, total, job_id)
+            yield rows
+    except BaseException:
+        # Includes GeneratorExit when sending stops before every chunk is rendered
+        spool.discard()
+        raise
+    stats = spool.commit({'seconds': render_seconds})
+    logging.info(f"Spooled {stats['messages']} messages for job {job_id} in {render_seconds:.2f}s ({stats['bytes']} bytes)")
+
+def plan_sends(job_id, chunks, batch_mode):
+    """Yield (messages, idempotency_key, is_batch) send groups from chunks of prepared messages"""
+    batch = []
+
+    for chunk in chunks:
+        checkpoints = send_queue.load_recipients(job_id, [message['recipient'] for message in chunk])
+        for message in chunk:
+            checkpoint = checkpoints[message['recipient']]
+            # Finished in an earlier run of a resumed job
+            if checkpoint['state'] in (send_queue.SENT, send_queue.FAILED):
+                continue
+            # Set when a previous run handed this recipient to the provider but didn't record the outcome
+            message['idempotency_key'] = checkpoint['idempotency_key']
+
+            if batch_mode:
+                # Recipients interrupted mid-batch go out together again under their original batch key
+                if batch and batch[-1]['idempotency_key'] != message['idempotency_key']:
+                    yield batch_group(job_id, batch)
+                    batch = []
+                batch.append(message)
+                if len(batch) >= BATCH_SIZE:
+                    yield batch_group(job_id, batch)
+                    batch = []
+            else:
+                yield [message], message['idempotency_key'] or f"{job_id}-{message['recipient']}", False
+
+    if batch:
+        yield batch_group(job_id, batch)
+
+def chunk_spool_rows(rows):
+    """Group rows read back from a completed spool into SEND_CHUNK_SIZE chunks"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= SEND_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def iter_spool_chunks(chunks, from_address):
+    """Turn chunks of spooled rows back into chunks of prepared messages"""
+    for rows in chunks:
+        yield [{
+            'recipient': recipient,
+            'school': {'id': school_id, 'School Name': school_name, 'Email': email},
+            'template': {'id': template_id, 'name': template_name},
+            'subject': subject,
+            'params': message_params(email, subject, text, html, from_address)
+        } for recipient, school_id, school_name, email, template_id, template_name, subject, text, html in rows]
+
+def batch_group(job_id, messages):
+    """Build a batch send group keyed by its first recipient (or its key from an interrupted run)"""
+    return messages, messages[0]['idempotency_key'] or f"{job_id}-batch-{messages[0]['recipient']}", True
+
+def checkpoint_groups(job_id, groups):
+    """Mark every recipient in the send groups as sending under its group's idempotency key"""
+    messages = [(message, idempotency_key) for group, idempotency_key, _ in groups for message in group]
+    send_queue.mark_sending(
+        job_id,
+        {message['recipient']: idempotency_key for message, idempotency_key in messages},
+        {message['recipient']: message['template']['id'] for message, _ in messages}
+    )
+
+def recipient_key(school):
+    """Identify a school within a job's recipient checkpoints"""
+    return str(school['id']) if school.get('id') is not None else school.get('Email', '')
+
+async def deliver_group(transport, group):
+    """Send one planned group, returning its (log_entry, result) outcomes"""
+    messages, idempotency_key, is_batch = group
+    if is_batch:
+        return await deliver_batch(transport, messages, idempotency_key)
+    return [await deliver_message(transport, messages[0], idempotency_key)]
+
+def resolve_selection(data):
+    """Turn a send request's recipients into school ids: a saved segment, a filter, or explicit ids"""
+    if data.get('segment_id') is not None:
+        segment = storage.get_segment(int(data['segment_id']))
+        if not segment:
+            raise ValueError('Segment not found')
+        return storage.select_school_ids(segment['filters'])
+    if data.get('filter') is not None:
+        if not isinstance(data['filter'], dict):
+            raise ValueError('filter must be an object')
+        return storage.select_school_ids(data['filter'])
+    return [int(school_id) for school_id in data.get('selected_schools', [])]
+
+def iter_job_chunks(payload):
+    """Yield the schools a send job targets in chunks, warming the validation cache for each"""
+    if 'schools' in payload:
+        # Jobs queued before sends switched to school ids carry full records
+        chunks = [payload['schools']]
+    else:
+        ids = payload.get('school_ids', [])
+        chunks = (storage.get_schools(ids[start:start + SEND_CHUNK_SIZE]) for start in range(0, len(ids), SEND_CHUNK_SIZE))
+    for chunk in chunks:
+        # Addresses checked at import are already cached, so this is mostly lookups
+        email_validation.validate_many([school['Email'] for school in chunk if school.get('Email', '').strip()])
+        yield chunk
+
+def record_outcomes(job_id, outcomes):
+    """Publish (log_entry, result) outcomes, checkpoint their recipients and mark sent schools contacted"""
+    # Logs are journaled before the checkpoint commits, so a crash in between can't lose them; the
+    # resumed job logs these recipients again under the same key and compaction keeps one of each
+    for log_entry, result in outcomes:
+        log_entry['dedupe_key'] = f"{job_id}:{result['recipient']}"
+    append_logs([log_entry for log_entry, _ in outcomes])
+    send_queue.add_results(job_id, [result for _, result in outcomes], [
+        (result['recipient'],
+         send_queue.SENT if result['status'] == 'success' else send_queue.FAILED,
+         log_entry.get('email_id') or None,
+         result.get('category'))
+        for log_entry, result in outcomes
+    ])
+    remove_sent_schools([result.get('school_id') for _, result in outcomes if result['status'] == 'success'])
+    sent = sum(1 for _, result in outcomes if result['status'] == 'success')
+    metrics.EMAILS.inc(sent, outcome='sent')
+    metrics.EMAILS.inc(len(outcomes) - sent, outcome='failed')
+
+def check_school_data(school):
+    """Validate a school record, returning an error outcome or None if it can be emailed"""
+    # Validate school data completeness
+    required_fields = ['School Name', 'Email']
+    missing_fields = [field for field in required_fields if not school.get(field, '').strip()]
+
+    if missing_fields:
+        log_entry = {
+            'school_name': school.get('School Name', 'Unknown'),
+            'email': school.get('Email', 'Unknown'),
+            'template_used': '',
+            'template_id': 0,
+            'status': f'Error (Missing Data): Missing required fields: {", ".join(missing_fields)}',
+            'timestamp': datetime.now().isoformat(),
+            'email_id': '',
+            'subject': '',
+            'error_category': 'Missing Data'
+        }
+        recipient_log.warning("Skipping school due to missing data: %s - Missing: %s", school.get('School Name', 'Unknown'), missing_fields)
+        return log_entry, {'status': 'error', 'school': school.get('School Name', 'Unknown'), 'email': school.get('Email', 'Unknown'), 'school_id': school.get('id'), 'error': f'Missing required fields: {", ".join(missing_fields)}', 'category': 'Missing Data'}
+
+    # Pre-validate email before attempting to send
+    is_valid, clean_email = validate_email_address(school['Email'])
+    if not is_valid:
+        log_entry = {
+            'school_name': school.get('School Name', ''),
+            'email': school['Email'],
+            'template_used': '',
+            'template_id': 0,
+            'status': 'Error (Invalid Email): Email format is invalid',
+            'timestamp': datetime.now().isoformat(),
+            'email_id': '',
+            'subject': '',
+            'error_category': 'Invalid Email'
+        }
+        recipient_log.warning("Skipping school due to invalid email: %s - %s", school.get('School Name', ''), school['Email'])
+        return log_entry, {'status': 'error', 'school': school['School Name'], 'email': school['Email'], 'school_id': school.get('id'), 'error': 'Invalid email format', 'category': 'Invalid Email'}
+
+    # Use cleaned email
+    school['Email'] = clean_email
+    return None
+
+def render_school_emails(schools, payload, template_ids):
+    """Render template emails for a chunk of schools, one vectorised pass per template used"""
+    frame = pd.DataFrame(schools, dtype=object)
+    positions = {}
+    for position, template_id in enumerate(template_ids):
+        positions.setdefault(template_id, []).append(position)
+
+    rendered = [None] * len(schools)
+    for template_id, rows in positions.items():
+        plan = template_registry.get_plan(template_id)
+        if not plan:
+            raise Exception('Template not found')
+
+        # Precompiled template parts, unless the payload overrides them with custom content
+        custom_subject = payload.get('custom_subject')
+        custom_content = payload.get('custom_content')
+        custom_html_content = payload.get('custom_html_content')
+        subject = template_engine.get_compiled(custom_subject, template_id) if custom_subject else plan.subject
+        text = template_engine.get_compiled(custom_content, template_id) if custom_content else plan.text
+        html = template_engine.get_compiled(custom_html_content, template_id) if custom_html_content else plan.html
+
+        for position, message in zip(rows, render_messages(frame.iloc[rows], subject, text, html)):
+            rendered[position] = (plan.template, *message)
+    return rendered
+
+def render_custom_emails(schools, payload):
+    """Render a custom email job's content for a chunk of schools"""
+    subject = template_engine.get_compiled(payload.get('subject', ''))
+    text = template_engine.get_compiled(payload.get('content', ''))
+    html = template_engine.get_compiled(payload['html_content']) if payload.get('html_content') else None
+    template = {'id': 0, 'name': 'Custom Email'}
+    return [(template, *message) for message in render_messages(pd.DataFrame(schools, dtype=object), subject, text, html)]
+
+def render_messages(frame, subject, text, html):
+    """Render compiled subject/text/HTML (html may be None) for every school in a DataFrame"""
+    subjects = template_engine.render_frame(subject, frame)
+    texts = template_engine.render_frame(text, frame)
+    htmls = template_engine.render_frame(html, frame) if html else [''] * len(frame)
+    return zip(subjects, texts, htmls)
+
+def sender_address():
+    """Return the From address built from the configured sender"""
+    settings = load_settings()
+    sender_email = settings.get('sender_email', 'hello@maximally.in')
+    sender_name = settings.get('sender_name', 'Maximally Team')
+    return f"{sender_name} <{sender_email}>" if sender_name else sender_email
+
+def message_params(to_email, subject, text, html, from_address=None):
+    """Build Resend send params, from the configured sender unless from_address is given"""
+    params = {
+        "from": from_address or sender_address(),
+        "to": [to_email],
+        "subject": subject,
+    }
+
+    if html:
+        params["html"] = html
+        if text:
+            params["text"] = text
+    else:
+        params["text"] = text
+    return params
+
+async def deliver_message(transport, message, idempotency_key):
+    """Send one prepared message, returning (log_entry, result)"""
+    school = message['school']
+    try:
+        # Retries (here or after a restart) reuse the key, so the provider sends at most once
+        email = await async_sender.send_with_retries(
+            lambda: transport.send(message['params'], idempotency_key),
+            school['Email'],
+            transport.bucket
+        )
+        return sent_outcome(message, email.get('id', ''))
+    except Exception as email_error:
+        return error_outcome(message, str(email_error))
+
+async def deliver_batch(transport, messages, idempotency_key):
+    """Send prepared messages in one provider batch call, returning an outcome per message"""
+    params_list = [message['params'] for message in messages]
+    try:
+        response = await async_sender.send_with_retries(
+            lambda: transport.send_batch(params_list, idempotency_key),
+            f"batch of {len(messages)}",
+            transport.bucket
+        )
+    except Exception as batch_error:
+        return [error_outcome(message, str(batch_error)) for message in messages]
+
+    rejected = {error.get('index'): error.get('message', 'Rejected by provider') for error in response.get('errors') or []}
+    # The provider returns ids for accepted messages in request order
+    accepted = iter(response.get('data') or [])
+
+    outcomes = []
+    for index, message in enumerate(messages):
+        if index in rejected:
+            outcomes.append(error_outcome(message, rejected[index]))
+        else:
+            email = next(accepted, None) or {}
+            outcomes.append(sent_outcome(message, email.get('id', '')))
+    return outcomes
+
+def sent_outcome(message, email_id):
+    """Build the (log_entry, result) pair for a delivered message"""
+    school = message['school']
+    log_entry = {
+        'school_name': school.get('School Name', ''),
+        'email': school['Email'],
+        'template_used': message['template']['name'],
+        'template_id': message['template']['id'],
+        'status': 'Sent',
+        'timestamp': datetime.now().isoformat(),
+        'email_id': email_id,
+        'subject': message['subject']
+    }
+    return log_entry, {'status': 'success', 'school': school['School Name'], 'email': school['Email'], 'school_id': school.get('id'), 'recipient': message.get('recipient')}
+
+def error_outcome(message, error_message):
+    """Build the (log_entry, result) pair for a message the provider did not accept"""
+    school = message['school']
+    current_template = message['template']
+
+    # Enhanced error categorization and logging
+    error_category = categorize_error(error_message)
+    recipient_log.error("Error sending email to %s: %s", school['Email'], error_message,
+                        extra={'email': school['Email'], 'category': error_category})
+
+    # Always create log entry for any error
+    log_entry = {
+        'school_name': school.get('School Name', ''),
+        'email': school['Email'],
+        'template_used': current_template.get('name', 'Unknown') if current_template else 'Unknown',
+        'template_id': current_template.get('id', 0) if current_template else 0,
+        'status': f'Error ({error_category}): {error_message[:200]}',  # Truncate very long errors
+        'timestamp': datetime.now().isoformat(),
+        'email_id': '',
+        'subject': message['subject'],
+        'error_category': error_category
+    }
+
+    # For critical system errors, log additional context
+    if error_category in ["System Error", "Network Error"]:
+        recipient_log.error("Critical error for %s: %s", school.get('School Name', ''), error_message)
+        # Continue processing other schools instead of stopping
+
+    return log_entry, {'status': 'error', 'school': school['School Name'], 'email': school['Email'], 'school_id': school.get('id'), 'recipient': message.get('recipient'), 'error': error_message, 'category': error_category}
+
+def categorize_error(error_message):
+    """Map a provider error message to a dashboard error category"""
+    if "rate limit" in error_message.lower() or "too many requests" in error_message:
+        return "Rate Limit"
+    elif "invalid" in error_message.lower() and "email" in error_message.lower():
+        return "Invalid Email"
+    elif "authentication" in error_message.lower() or "unauthorized" in error_message.lower():
+        return "Authentication Error"
+    elif "network" in error_message.lower() or "connection" in error_message.lower() or "ssl" in error_message.lower():
+        return "Network Error"
+    elif "timeout" in error_message.lower():
+        return "Timeout Error"
+    elif "systemexit" in error_message.lower():
+        return "System Error"
+    return "Unknown Error"
+
+send_queue.register_handler('send_emails', run_send_job)
+
 @app.route('/send', methods=['POST'])
 def send_emails():
-    """Send emails to selected schools"""
+    """Queue emails to selected schools and return the job id"""
     try:
         data = request.get_json()
-        logging.info(f"Received data: {data}")
         
         if not data:
             return jsonify({'error': 'No data received'}), 400
             
         template_id = data.get('template_id')
-        selected_schools = data.get('selected_schools', [])
         ab_testing = data.get('ab_testing', False)
-        custom_content = data.get('custom_content')
-        custom_subject = data.get('custom_subject')
-        custom_html_content = data.get('custom_html_content')
 
-        schools = load_json_file('data/schools.json', [])
-        templates = load_json_file('data/templates.json', [])
-        logs = load_json_file('data/logs.json', [])
-
-        if not selected_schools:
+        try:
+            school_ids = resolve_selection(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if not school_ids:
             return jsonify({'error': 'No schools selected'}), 400
 
-        # For large-scale sending, use smaller batches to prevent timeouts
-        if len(selected_schools) > 50:
-            return jsonify({'error': 'Please select 50 or fewer schools at a time to prevent rate limits and timeouts'}), 400
-            
-        logging.info(f"Template ID: {template_id}, AB Testing: {ab_testing}, Selected schools: {len(selected_schools)}")
+        if ab_testing:
+            if not template_registry.template_ids():
+                return jsonify({'error': 'No templates available for A/B testing'}), 400
+        elif not template_registry.get_template(template_id):
+            return jsonify({'error': 'Template not found'}), 400
 
-        results = []
+        logging.info("Template ID: %s, AB Testing: %s, Selected schools: %d", template_id, ab_testing, len(school_ids))
 
-        for i, school_index in enumerate(selected_schools):
-            if school_index >= len(schools):
-                continue
+        # The job loads school records in chunks when it runs; only ids travel in the payload
+        job_id = send_queue.enqueue('send_emails', {
+            'template_id': template_id,
+            'ab_testing': ab_testing,
+            'custom_content': data.get('custom_content'),
+            'custom_subject': data.get('custom_subject'),
+            'custom_html_content': data.get('custom_html_content'),
+            'batch_mode': data.get('batch_mode', False),
+            'transport': current_transport().name,
+            'school_ids': school_ids
+        }, total=len(school_ids))
 
-            school = schools[school_index]
-            
-            # Validate school data completeness
-            required_fields = ['School Name', 'Email']
-            missing_fields = [field for field in required_fields if not school.get(field, '').strip()]
-            
-            if missing_fields:
-                log_entry = {
-                    'school_name': school.get('School Name', 'Unknown'),
-                    'email': school.get('Email', 'Unknown'),
-                    'template_used': '',
-                    'template_id': 0,
-                    'status': f'Error (Missing Data): Missing required fields: {", ".join(missing_fields)}',
-                    'timestamp': datetime.now().isoformat(),
-                    'email_id': '',
-                    'subject': '',
-                    'error_category': 'Missing Data'
-                }
-                results.append({'status': 'error', 'school': school.get('School Name', 'Unknown'), 'email': school.get('Email', 'Unknown'), 'error': f'Missing required fields: {", ".join(missing_fields)}', 'category': 'Missing Data'})
-                logging.warning(f"Skipping school due to missing data: {school.get('School Name', 'Unknown')} - Missing: {missing_fields}")
-                logs.append(log_entry)
-                continue
-            
-            # Pre-validate email before attempting to send
-            is_valid, clean_email = validate_email_address(school['Email'])
-            if not is_valid:
-                log_entry = {
-                    'school_name': school.get('School Name', ''),
-                    'email': school['Email'],
-                    'template_used': '',
-                    'template_id': 0,
-                    'status': 'Error (Invalid Email): Email format is invalid',
-                    'timestamp': datetime.now().isoformat(),
-                    'email_id': '',
-                    'subject': '',
-                    'error_category': 'Invalid Email'
-                }
-                results.append({'status': 'error', 'school': school['School Name'], 'email': school['Email'], 'error': 'Invalid email format', 'category': 'Invalid Email'})
-                logging.warning(f"Skipping school due to invalid email: {school.get('School Name', '')} - {school['Email']}")
-                logs.append(log_entry)
-                continue
-            
-            # Use cleaned email
-            school['Email'] = clean_email
-
-            # Determine which template to use
-            if ab_testing:
-                # Random template selection for A/B testing
-                current_template = random.choice(templates)
-            else:
-                # Use specified template
-                current_template = None
-                for t in templates:
-                    if t['id'] == template_id:
-                        current_template = t
-                        break
-
-                if not current_template:
-                    return jsonify({'error': 'Template not found'}), 400
-
-            # Use custom content if provided
-            subject = custom_subject if custom_subject else current_template['subject']
-            content = custom_content if custom_content else current_template.get('content_text', current_template['content'])
-            html_content = custom_html_content if custom_html_content else current_template.get('content_html', '')
-
-            # Replace placeholders
-            email_subject = replace_placeholders(subject, school)
-            email_content = replace_placeholders(content, school)
-            email_html = replace_placeholders(html_content, school) if html_content else ''
-
-            # Conservative rate limiting to avoid hitting limits
-            # Resend allows 2 requests/second, so we use 0.6s delay to be safe
-            if i > 0:
-                time.sleep(0.6)  # Less than 2 emails per second, within limits
-                
-            # Progress logging for large batches
-            if i > 0 and i % 100 == 0:
-                logging.info(f"Progress: {i}/{len(selected_schools)} emails processed")
-
-            # Send email via Resend with timeout handling
-            try:
-                settings = load_settings()
-                sender_email = settings.get('sender_email', 'hello@maximally.in')
-                sender_name = settings.get('sender_name', 'Maximally Team')
-                from_address = f"{sender_name} <{sender_email}>" if sender_name else sender_email
-
-                params = {
-                    "from": from_address,
-                    "to": [school['Email']],
-                    "subject": email_subject,
-                }
-
-                if email_html:
-                    params["html"] = email_html
-                    if email_content:
-                        params["text"] = email_content
-                else:
-                    params["text"] = email_content
-
-                # Enhanced retry logic for production use
-                max_retries = 3
-                base_retry_delay = 1
-                
-                for attempt in range(max_retries):
-                    try:
-                        # Robust error handling for all types of failures
-                        email = resend.Emails.send(params)
-                        break  # Success, exit retry loop
-                    except (SystemExit, KeyboardInterrupt) as system_error:
-                        # Handle system-level interruptions
-                        raise Exception(f"Email sending was interrupted by system: {str(system_error)}")
-                    except Exception as retry_error:
-                        retry_error_str = str(retry_error)
-                        
-                        # Handle specific error types
-                        if "rate limit" in retry_error_str.lower() or "too many requests" in retry_error_str:
-                            # Short delay for rate limits to avoid worker timeout
-                            wait_time = 2 + (attempt * 1)  # 2s, 3s, 4s delays
-                            logging.warning(f"Rate limit hit on attempt {attempt + 1} for {school['Email']}, waiting {wait_time}s")
-                            time.sleep(wait_time)
-                        elif "invalid" in retry_error_str.lower() and "email" in retry_error_str.lower():
-                            # Don't retry invalid emails
-                            logging.error(f"Invalid email address {school['Email']}: {retry_error_str}")
-                            raise retry_error
-                        else:
-                            # Short retry delay for other errors to avoid worker timeout
-                            wait_time = 1 + attempt  # 1s, 2s, 3s delays
-                            logging.warning(f"Attempt {attempt + 1} failed for {school['Email']}: {retry_error_str}")
-                            if attempt < max_retries - 1:
-                                time.sleep(wait_time)
-                        
-                        if attempt == max_retries - 1:
-                            raise retry_error  # Re-raise on final attempt
-
-                log_entry = {
-                    'school_name': school.get('School Name', ''),
-                    'email': school['Email'],
-                    'template_used': current_template['name'],
-                    'template_id': current_template['id'],
-                    'status': 'Sent',
-                    'timestamp': datetime.now().isoformat(),
-                    'email_id': email.get('id', ''),
-                    'subject': email_subject
-                }
-
-                results.append({'status': 'success', 'school': school['School Name'], 'email': school['Email']})
-
-            except Exception as email_error:
-                error_message = str(email_error)
-                logging.error(f"Error sending email to {school['Email']}: {error_message}")
-                
-                # Enhanced error categorization and logging
-                error_category = "Unknown Error"
-                
-                if "rate limit" in error_message.lower() or "too many requests" in error_message:
-                    error_category = "Rate Limit"
-                elif "invalid" in error_message.lower() and "email" in error_message.lower():
-                    error_category = "Invalid Email"
-                elif "authentication" in error_message.lower() or "unauthorized" in error_message.lower():
-                    error_category = "Authentication Error"
-                elif "network" in error_message.lower() or "connection" in error_message.lower() or "ssl" in error_message.lower():
-                    error_category = "Network Error"
-                elif "timeout" in error_message.lower():
-                    error_category = "Timeout Error"
-                elif "systemexit" in error_message.lower():
-                    error_category = "System Error"
-                
-                # Always create log entry for any error
-                log_entry = {
-                    'school_name': school.get('School Name', ''),
-                    'email': school['Email'],
-                    'template_used': current_template.get('name', 'Unknown') if current_template else 'Unknown',
-                    'template_id': current_template.get('id', 0) if current_template else 0,
-                    'status': f'Error ({error_category}): {error_message[:200]}',  # Truncate very long errors
-                    'timestamp': datetime.now().isoformat(),
-                    'email_id': '',
-                    'subject': email_subject,
-                    'error_category': error_category
-                }
-                results.append({'status': 'error', 'school': school['School Name'], 'email': school['Email'], 'error': error_message, 'category': error_category})
-                
-                # For critical system errors, log additional context
-                if error_category in ["System Error", "Network Error"]:
-                    logging.error(f"Critical error for {school.get('School Name', '')}: {error_message}")
-                    # Continue processing other schools instead of stopping
-
-            # Ensure log_entry is always added (defined in both success and error cases)
-            if 'log_entry' in locals():
-                logs.append(log_entry)
-
-        # Save updated logs
-        save_json_file('data/logs.json', logs)
-
-        # Remove successfully sent schools from the schools list
-        successful_emails = [result['school'] for result in results if result['status'] == 'success']
-        if successful_emails:
-            schools = load_json_file('data/schools.json')
-            # Keep only schools that were not successfully sent emails
-            remaining_schools = [school for school in schools if school.get('School Name', '') not in successful_emails]
-            save_json_file('data/schools.json', remaining_schools)
-
-        # Calculate summary statistics
-        total_processed = len(results)
-        successful_count = len([r for r in results if r['status'] == 'success'])
-        error_count = len([r for r in results if r['status'] == 'error'])
-        
-        # Group errors by category for better reporting
-        error_categories = {}
-        for result in results:
-            if result['status'] == 'error':
-                category = result.get('category', 'Unknown')
-                error_categories[category] = error_categories.get(category, 0) + 1
-        
-        summary_message = f'Batch completed: {successful_count} sent, {error_count} failed out of {total_processed} schools'
-        if error_categories:
-            error_details = ', '.join([f"{count} {category}" for category, count in error_categories.items()])
-            summary_message += f'. Errors: {error_details}'
-        
-        logging.info(f"Batch summary: {summary_message}")
-        
         return jsonify({
-            'message': summary_message,
-            'results': results,
-            'summary': {
-                'total_processed': total_processed,
-                'successful': successful_count,
-                'failed': error_count,
-                'removed_schools': len(successful_emails),
-                'error_categories': error_categories
-            }
-        })
+            'message': f'Queued {len(school_ids)} emails for sending',
+            'job_id': job_id,
+            'status': 'queued',
+            'total': len(school_ids)
+        }), 202
 
     except Exception as e:
         # Log the critical error to both logs and file
@@ -530,8 +928,7 @@ def send_emails():
         logging.error(f"Critical error in send_emails: {error_message}")
         
         # Create error log entry for critical failures
-        logs = load_json_file('data/logs.json', [])
-        log_entry = {
+        append_logs([{
             'school_name': 'System Error',
             'email': 'N/A',
             'template_used': 'N/A',
@@ -541,108 +938,139 @@ def send_emails():
             'email_id': '',
             'subject': 'N/A',
             'error_category': 'System Error'
-        }
-        logs.append(log_entry)
-        save_json_file('data/logs.json', logs)
+        }])
         
         return jsonify({
             'error': f'System error occurred: {error_message}',
-            'message': 'Error logged to dashboard for analysis',
-            'results': [],
-            'summary': {
-                'total_processed': 0,
-                'successful': 0,
-                'failed': 1,
-                'removed_schools': 0,
-                'error_categories': {'System Error': 1}
-            }
+            'message': 'Error logged to dashboard for analysis'
         }), 500
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Return the status, progress and new results of a queued send job"""
+    job = send_queue.get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    after = request.args.get('after', 0, type=int)
+    results = send_queue.get_results(job_id, after=after)
+    job['results'] = [result for _, result in results]
+    job['next'] = results[-1][0] if results else after
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Stream a job's per-recipient results, throughput and ETA as Server-Sent Events"""
+    if not send_queue.get_job(job_id):
+        return jsonify({'error': 'Job not found'}), 404
+    # EventSource resends the last seen result sequence number when it reconnects
+    after = request.headers.get('Last-Event-ID', request.args.get('after', 0), type=int)
+    return Response(
+        stream_with_context(job_event_stream(job_id, after)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def sse_event(event, data, event_id=None):
+    """Format one Server-Sent Event"""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+def job_event_stream(job_id, after):
+    """Yield result, progress and done events for a job until it finishes or the stream times out"""
+    started = time.monotonic()
+    samples = deque()
+    last_sent = None
+    last_heartbeat = started
+
+    while True:
+        job = send_queue.get_job(job_id)
+        results = send_queue.get_results(job_id, after=after, limit=SSE_MAX_RESULTS)
+        if results:
+            after = results[-1][0]
+            yield sse_event('results', [result for _, result in results], event_id=after)
+
+        # Throughput over a sliding window, so the ETA follows the current rate
+        now = time.monotonic()
+        samples.append((now, job['processed']))
+        while len(samples) > 2 and now - samples[0][0] > SSE_RATE_WINDOW:
+            samples.popleft()
+        elapsed = now - samples[0][0]
+        rate = (job['processed'] - samples[0][1]) / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, job['total'] - job['processed'])
+        progress = {
+            'status': job['status'],
+            'processed': job['processed'],
+            'total': job['total'],
+            'rate': round(rate, 2),
+            'eta_seconds': round(remaining / rate) if rate > 0 else None
+        }
+        if progress != last_sent or now - last_heartbeat >= SSE_HEARTBEAT:
+            yield sse_event('progress', progress)
+            last_sent = progress
+            last_heartbeat = now
+
+        if job['status'] in ('done', 'failed') and len(results) < SSE_MAX_RESULTS:
+            yield sse_event('done', job)
+            return
+        if now - started >= SSE_MAX_DURATION:
+            # Free the worker; the browser reconnects and resumes from Last-Event-ID
+            yield 'retry: 500\n\n'
+            return
+        if len(results) < SSE_MAX_RESULTS:
+            time.sleep(SSE_POLL_INTERVAL)
+
 @app.route('/error_dashboard')
 def error_dashboard():
     """Error Logging Dashboard for Email Campaigns"""
     try:
-        logs = load_json_file('data/logs.json', [])
-        
-        # Filter and analyze error logs
-        error_logs = [log for log in logs if 'Error' in log.get('status', '')]
-        success_logs = [log for log in logs if log.get('status') == 'Sent' or 'Sent (Retry)' in log.get('status', '')]
-        
-        # Calculate error statistics
-        total_emails = len(logs)
-        total_errors = len(error_logs)
-        total_success = len(success_logs)
+        # Calculate error statistics from the counters maintained as logs are written
+        totals = storage.log_totals()
+        total_emails = totals['total']
+        total_errors = totals['error']
+        total_success = totals['sent']
         error_rate = (total_errors / total_emails * 100) if total_emails > 0 else 0
         
-        # Group errors by category
+        # Group errors by category, keeping up to 5 examples each
         error_categories = {}
-        for log in error_logs:
-            category = log.get('error_category', 'Unknown')
-            if category not in error_categories:
-                error_categories[category] = {
-                    'count': 0,
-                    'examples': []
-                }
-            error_categories[category]['count'] += 1
-            if len(error_categories[category]['examples']) < 5:  # Keep up to 5 examples
-                error_categories[category]['examples'].append(log)
-        
-        # Group errors by template
-        template_errors = {}
-        for log in error_logs:
-            template_name = log.get('template_used', 'Unknown Template')
-            template_errors[template_name] = template_errors.get(template_name, 0) + 1
-        
-        # Recent errors (last 24 hours)
-        from datetime import datetime, timedelta
-        now = datetime.now()
-        recent_cutoff = now - timedelta(hours=24)
+        for category, count in storage.error_category_counts().items():
+            error_categories[category] = {
+                'count': count,
+                'examples': storage.error_examples(category, limit=5)
+            }
         
-        recent_errors = []
-        for log in error_logs:
-            try:
-                log_time = datetime.fromisoformat(log.get('timestamp', ''))
-                if log_time >= recent_cutoff:
-                    recent_errors.append(log)
-            except:
-                continue
+        # Group errors by template, with sends per template for error rates
+        template_counts = storage.template_outcome_counts()
+        template_errors = {template: counts['errors'] for template, counts in template_counts.items() if counts['errors']}
+        template_totals = {template: counts['errors'] + counts['success'] for template, counts in template_counts.items()}
         
         # Timeline data for charts (group by hour for last 24 hours)
+        hourly_counts = storage.hourly_outcome_counts(24)
         timeline_data = {}
-        for i in range(24):
-            hour_start = now - timedelta(hours=i+1)
-            hour_end = now - timedelta(hours=i)
-            hour_key = hour_start.strftime('%H:00')
-            
-            hour_errors = 0
-            hour_success = 0
-            
-            for log in logs:
-                try:
-                    log_time = datetime.fromisoformat(log.get('timestamp', ''))
-                    if hour_start <= log_time < hour_end:
-                        if 'Error' in log.get('status', ''):
-                            hour_errors += 1
-                        elif log.get('status') == 'Sent' or 'Sent (Retry)' in log.get('status', ''):
-                            hour_success += 1
-                except:
-                    continue
-            
-            timeline_data[hour_key] = {
+        for hour_start, hour_errors, hour_success in hourly_counts:
+            timeline_data[hour_start.strftime('%H:00')] = {
                 'errors': hour_errors,
                 'success': hour_success
             }
         
+        # Recent errors (last 24 hours)
+        recent_cutoff = hourly_counts[-1][0]
+        recent_errors = storage.logs_since(recent_cutoff, outcome='error', limit=50)
+        recent_error_count = sum(hour_errors for _, hour_errors, _ in hourly_counts)
+        
         return render_template('error_dashboard.html',
-                             error_logs=error_logs,
-                             success_logs=success_logs,
                              total_emails=total_emails,
                              total_errors=total_errors,
                              total_success=total_success,
                              error_rate=error_rate,
                              error_categories=error_categories,
                              template_errors=template_errors,
+                             template_totals=template_totals,
                              recent_errors=recent_errors,
+                             recent_error_count=recent_error_count,
                              timeline_data=timeline_data)
     
     except Exception as e:
@@ -654,40 +1082,273 @@ def error_dashboard():
 def get_error_stats():
     """API endpoint for error statistics"""
     try:
-        logs = load_json_file('data/logs.json', [])
-        
-        # Calculate basic stats
-        total_emails = len(logs)
-        error_logs = [log for log in logs if 'Error' in log.get('status', '')]
-        success_logs = [log for log in logs if log.get('status') == 'Sent' or 'Sent (Retry)' in log.get('status', '')]
-        
-        # Group errors by category
-        error_categories = {}
-        for log in error_logs:
-            category = log.get('error_category', 'Unknown')
-            error_categories[category] = error_categories.get(category, 0) + 1
+        # Calculate basic stats from the pre-aggregated counters
+        totals = storage.log_totals()
+        total_emails = totals['total']
+        total_errors = totals['error']
         
         return jsonify({
             'total_emails': total_emails,
-            'total_errors': len(error_logs),
-            'total_success': len(success_logs),
-            'error_rate': (len(error_logs) / total_emails * 100) if total_emails > 0 else 0,
-            'error_categories': error_categories
+            'total_errors': total_errors,
+            'total_success': totals['sent'],
+            'error_rate': (total_errors / total_emails * 100) if total_emails > 0 else 0,
+            'error_categories': storage.error_category_counts()
         })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def school_filters_from_args():
+    """Read the school filters supported by storage from the query string"""
+    return {key: request.args[key] for key in storage.SCHOOL_FILTERS if request.args.get(key)}
+
+def page_limit():
+    """Read the page size from the query string, capped at MAX_PAGE_SIZE"""
+    return max(1, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+
+@app.route('/api/schools')
+def get_schools_page():
+    """API endpoint for a cursor-paginated page of schools not yet contacted"""
+    try:
+        filters = school_filters_from_args()
+        cursor = request.args.get('cursor')
+        schools, next_cursor = storage.page_schools(
+            limit=page_limit(),
+            cursor=cursor,
+            sort=request.args.get('sort', 'id'),
+            descending=request.args.get('order') == 'desc',
+            filters=filters
+        )
+        page = {'schools': schools, 'next_cursor': next_cursor}
+        # Count matches once per filter, on the first page
+        if not cursor:
+            page['total'] = storage.count_schools(filters)
+        return jsonify(page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/segments', methods=['GET', 'POST'])
+def segments():
+    """List saved segments, or save the posted filter as a new segment"""
+    try:
+        if request.method == 'GET':
+            return jsonify({'segments': storage.list_segments()})
+
+        data = request.get_json() or {}
+        name = (data.get('name') or '').strip()
+        if not name:
+            return jsonify({'error': 'Segment name is required'}), 400
+        segment = storage.create_segment(name, data.get('filters') or {})
+        segment['count'] = storage.count_schools(segment['filters'])
+        return jsonify(segment), 201
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/segments/<int:segment_id>', methods=['DELETE'])
+def delete_segment(segment_id):
+    """Delete a saved segment"""
+    if not storage.delete_segment(segment_id):
+        return jsonify({'error': 'Segment not found'}), 404
+    return jsonify({'message': 'Segment deleted'})
+
+@app.route('/api/campaigns', methods=['GET', 'POST'])
+def campaigns():
+    """List scheduled campaigns, or schedule a new one"""
+    try:
+        if request.method == 'GET':
+            return jsonify({'campaigns': storage.list_campaigns()})
+
+        data = request.get_json() or {}
+        name = (data.get('name') or '').strip()
+        if not name:
+            return jsonify({'error': 'Campaign name is required'}), 400
+        campaign = storage.create_campaign(name, **parse_campaign(data))
+        campaign_scheduler.wake()
+        return jsonify(campaign), 201
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/campaigns/<int:campaign_id>')
+def campaign_status(campaign_id):
+    """Return a campaign with its dispatch progress"""
+    campaign = storage.get_campaign(campaign_id)
+    if not campaign:
+        return jsonify({'error': 'Campaign not found'}), 404
+    return jsonify(campaign)
+
+@app.route('/api/campaigns/<int:campaign_id>/<action>', methods=['POST'])
+def campaign_action(campaign_id, action):
+    """Pause, resume or cancel a campaign; a slice already queued still finishes"""
+    campaign = storage.get_campaign(campaign_id)
+    if not campaign:
+        return jsonify({'error': 'Campaign not found'}), 404
+    allowed = {
+        'pause': ('scheduled', 'running'),
+        'resume': ('paused',),
+        'cancel': ('scheduled', 'running', 'paused'),
+    }
+    if action not in allowed:
+        return jsonify({'error': f"Unknown campaign action '{action}'"}), 404
+    if campaign['status'] not in allowed[action]:
+        return jsonify({'error': f"Cannot {action} a {campaign['status']} campaign"}), 400
+    if action == 'resume':
+        # Campaigns that never started resolve their recipients on the next tick
+        status = 'running' if campaign['recipients'] else 'scheduled'
+    else:
+        status = {'pause': 'paused', 'cancel': 'cancelled'}[action]
+    storage.update_campaign(campaign_id, status=status)
+    campaign_scheduler.wake()
+    return jsonify(storage.get_campaign(campaign_id))
+
+def parse_campaign(data):
+    """Validate a campaign request into create_campaign arguments; raises ValueError"""
+    ab_testing = bool(data.get('ab_testing', False))
+    template_id = data.get('template_id')
+    if ab_testing:
+        if not template_registry.template_ids():
+            raise ValueError('No templates available for A/B testing')
+    elif not template_registry.get_template(template_id):
+        raise ValueError('Template not found')
+
+    # Segments and filters are resolved when the campaign starts, so later uploads are included
+    if data.get('segment_id') is not None:
+        segment = storage.get_segment(int(data['segment_id']))
+        if not segment:
+            raise ValueError('Segment not found')
+        selection = {'filter': segment['filters']}
+    elif data.get('filter') is not None:
+        if not isinstance(data['filter'], dict):
+            raise ValueError('filter must be an object')
+        storage.count_schools(data['filter'])
+        selection = {'filter': data['filter']}
+    elif data.get('selected_schools'):
+        selection = {'school_ids': [int(school_id) for school_id in data['selected_schools']]}
+    else:
+        raise ValueError('No schools selected')
+
+    start_at = datetime.now()
+    if data.get('start_at'):
+        start_at = datetime.fromisoformat(data['start_at'])
+        if start_at.tzinfo:
+            # Stored in server local time like every other timestamp
+            start_at = start_at.astimezone().replace(tzinfo=None)
+
+    ceilings = {}
+    for field in ('per_hour', 'per_day'):
+        value = data.get(field)
+        if value in (None, ''):
+            ceilings[field] = None
+        elif int(value) < 1:
+            raise ValueError(f'{field} must be a positive number')
+        else:
+            ceilings[field] = int(value)
+
+    quiet_hours = data.get('quiet_hours') or None
+    if quiet_hours:
+        if not isinstance(quiet_hours, dict):
+            raise ValueError('quiet_hours must be an object')
+        if not quiet_hours.get('start') or not quiet_hours.get('end'):
+            raise ValueError('Quiet hours need a start and an end')
+        for value in (quiet_hours['start'], quiet_hours['end']):
+            if not isinstance(value, str):
+                raise ValueError('Quiet hours must be HH:MM times')
+            campaign_scheduler.parse_clock(value)
+        quiet_hours = {'start': quiet_hours['start'], 'end': quiet_hours['end']}
+
+    timezone = data.get('timezone') or 'UTC'
+    if not campaign_scheduler.valid_timezone(timezone):
+        raise ValueError(f"Unknown timezone '{timezone}'")
+
+    return {
+        'settings': {
+            'template_id': template_id,
+            'ab_testing': ab_testing,
+            'custom_content': data.get('custom_content'),
+            'custom_subject': data.get('custom_subject'),
+            'custom_html_content': data.get('custom_html_content'),
+            'batch_mode': data.get('batch_mode', False),
+            'transport': current_transport().name
+        },
+        'selection': selection,
+        'start_at': start_at,
+        'quiet_hours': quiet_hours,
+        'timezone': timezone,
+        **ceilings
+    }
+
+def enqueue_campaign_job(campaign, school_ids):
+    """Queue one slice of a scheduled campaign as a send job and return its id"""
+    return send_queue.enqueue('send_emails', {
+        **campaign['settings'],
+        'campaign_id': campaign['id'],
+        'school_ids': school_ids
+    }, total=len(school_ids))
+
+def campaign_job_finished(job):
+    """Wake the scheduler when a campaign slice finishes so the next one is queued right away"""
+    if job['payload'].get('campaign_id'):
+        campaign_scheduler.wake()
+
+@app.route('/api/logs')
+def get_logs_page():
+    """API endpoint for a cursor-paginated page of email logs, newest first by default"""
+    try:
+        logs, next_cursor = storage.page_logs(
+            limit=page_limit(),
+            cursor=request.args.get('cursor'),
+            descending=request.args.get('order', 'desc') == 'desc',
+            outcome=request.args.get('outcome'),
+            category=request.args.get('category'),
+            template_id=request.args.get('template_id', type=int),
+            email=request.args.get('email')
+        )
+        return jsonify({'logs': logs, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/rate_limit')
+def get_rate_limit():
+    """API endpoint for the shared send rate limiter fill level"""
+    try:
+        return jsonify(rate_limiter.fill_level(current_transport().bucket))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics for this process: request, provider, render and storage timings and queue depth"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def collect_queue_metrics():
+    """Refresh the queue depth gauges from the queue database before a scrape"""
+    counts = send_queue.job_counts()
+    metrics.QUEUE_JOBS.clear()
+    metrics.QUEUE_REMAINING.clear()
+    remaining = {}
+    for (kind, status), (jobs, left) in counts.items():
+        metrics.QUEUE_JOBS.set(jobs, kind=kind, status=status)
+        if status in ('queued', 'running'):
+            remaining[kind] = remaining.get(kind, 0) + left
+    for kind, left in remaining.items():
+        metrics.QUEUE_REMAINING.set(left, kind=kind)
+
 @app.route('/clear_errors', methods=['POST'])
 def clear_errors():
     """Clear all error logs"""
     try:
-        logs = load_json_file('data/logs.json', [])
         # Keep only successful sends
-        success_logs = [log for log in logs if log.get('status') == 'Sent' or 'Sent (Retry)' in log.get('status', '')]
-        save_json_file('data/logs.json', success_logs)
+        log_journal.compact(wait=True)
+        removed = storage.clear_error_logs()
         
-        flash(f'Cleared {len(logs) - len(success_logs)} error logs', 'success')
+        flash(f'Cleared {removed} error logs', 'success')
         return redirect(url_for('error_dashboard'))
     
     except Exception as e:
@@ -697,54 +1358,89 @@ def clear_errors():
 
 @app.route('/export')
 def export_logs():
-    """Export email logs as CSV"""
+    """Export email logs as CSV, streamed from the database"""
+    # Optional filters: start/end (ISO dates, end exclusive), outcome, category; gzip=1 compresses
     try:
-        logs = load_json_file('data/logs.json', [])
+        filters = export_filters_from_args()
+    except ValueError as e:
+        flash(f'Error exporting logs: {str(e)}', 'error')
+        return redirect(url_for('index'))
 
-        if not logs:
+    try:
+        # Include entries still waiting in the journal
+        log_journal.compact(wait=True)
+        if not storage.count_logs():
             flash('No email logs to export', 'error')
             return redirect(url_for('index'))
-
-        # Create CSV content
-        output = io.StringIO()
-        fieldnames = ['school_name', 'email', 'template_used', 'status', 'timestamp', 'subject']
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
-
-        writer.writeheader()
-        for log in logs:
-            writer.writerow({
-                'school_name': log.get('school_name', ''),
-                'email': log.get('email', ''),
-                'template_used': log.get('template_used', ''),
-                'status': log.get('status', ''),
-                'timestamp': log.get('timestamp', ''),
-                'subject': log.get('subject', '')
-            })
-
-        # Create file-like object
-        output.seek(0)
-        file_data = io.BytesIO()
-        file_data.write(output.getvalue().encode('utf-8'))
-        file_data.seek(0)
-
-        return send_file(
-            file_data,
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'email_logs_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        )
-
     except Exception as e:
         logging.error(f"Error exporting logs: {str(e)}")
         flash(f'Error exporting logs: {str(e)}', 'error')
         return redirect(url_for('index'))
 
+    compress = request.args.get('gzip') == '1'
+    rows = stream_log_csv(filters)
+    if compress:
+        rows = gzip_stream(rows)
+
+    download_name = f'email_logs_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv' + ('.gz' if compress else '')
+    return Response(
+        stream_with_context(rows),
+        mimetype='application/gzip' if compress else 'text/csv',
+        headers={'Content-Disposition': f'attachment; filename={download_name}'}
+    )
+
+def export_filters_from_args():
+    """Read export filters from the query string; raises ValueError for bad values"""
+    filters = {}
+    for key in ('start', 'end'):
+        if request.args.get(key):
+            try:
+                filters[key] = datetime.fromisoformat(request.args[key])
+            except ValueError:
+                raise ValueError(f"{key} must be an ISO date, e.g. 2025-07-01")
+    outcome = request.args.get('outcome')
+    if outcome:
+        if outcome not in ('sent', 'error', 'other'):
+            raise ValueError("outcome must be one of sent, error, other")
+        filters['outcome'] = outcome
+    if request.args.get('category'):
+        filters['category'] = request.args['category']
+    return filters
+
+def stream_log_csv(filters):
+    """Yield the log export as CSV text, one chunk per database batch"""
+    fieldnames = ['school_name', 'email', 'template_used', 'status', 'timestamp', 'subject']
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=fieldnames, extrasaction='ignore')
+    writer.writeheader()
+
+    count = 0
+    for log in storage.iter_logs(batch_size=EXPORT_BATCH_SIZE, **filters):
+        writer.writerow(log)
+        count += 1
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+    yield output.getvalue()
+    logging.info(f"Exported {count} log entries")
+
+def gzip_stream(chunks):
+    """Gzip-compress a stream of text chunks"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
 @app.route('/clear_data', methods=['POST'])
 def clear_data():
     """Clear all data (schools, logs)"""
     try:
-        save_json_file('data/schools.json', [])
-        save_json_file('data/logs.json', [])
+        log_journal.compact(wait=True)
+        storage.clear_schools()
+        storage.clear_logs()
         flash('All data cleared successfully', 'success')
     except Exception as e:
         logging.error(f"Error clearing data: {str(e)}")
@@ -755,13 +1451,7 @@ def clear_data():
 @app.route('/edit_template/<int:template_id>')
 def edit_template(template_id):
     """Edit template page"""
-    templates = load_json_file('data/templates.json', [])
-    template = None
-    for t in templates:
-        if t['id'] == template_id:
-            template = t
-            break
-
+    template = template_registry.get_template(template_id)
     if not template:
         flash('Template not found', 'error')
         return redirect(url_for('index'))
@@ -786,22 +1476,14 @@ def save_template():
             flash('All fields are required', 'error')
             return redirect(url_for('edit_template', template_id=template_id))
 
-        templates = load_json_file('data/templates.json', [])
-
         # Update template with both text and HTML content
-        for i, template in enumerate(templates):
-            if template['id'] == template_id:
-                templates[i] = {
-                    'id': template_id,
-                    'name': name,
-                    'subject': subject,
-                    'content': final_content,
-                    'content_text': content_text,
-                    'content_html': content_html
-                }
-                break
-
-        save_json_file('data/templates.json', templates)
+        template_registry.update_template(template_id, {
+            'name': name,
+            'subject': subject,
+            'content': final_content,
+            'content_text': content_text,
+            'content_html': content_html
+        })
         flash('Template updated successfully', 'success')
 
     except Exception as e:
@@ -830,23 +1512,14 @@ def create_template():
             flash('All fields are required', 'error')
             return render_template('create_template.html')
 
-        templates = load_json_file('data/templates.json', [])
-
-        # Find next ID
-        next_id = max([t['id'] for t in templates], default=0) + 1
-
-        # Create new template with both text and HTML content
-        new_template = {
-            'id': next_id,
+        # Create new template with both text and HTML content; ids are never reused
+        template_registry.create_template({
             'name': name,
             'subject': subject,
             'content': final_content,
             'content_text': content_text,
             'content_html': content_html
-        }
-
-        templates.append(new_template)
-        save_json_file('data/templates.json', templates)
+        })
 
         flash('Template created successfully', 'success')
         return redirect(url_for('index'))
@@ -860,12 +1533,7 @@ def create_template():
 def delete_template(template_id):
     """Delete a template"""
     try:
-        templates = load_json_file('data/templates.json', [])
-        
-        # Find and remove template
-        templates = [t for t in templates if t['id'] != template_id]
-        
-        save_json_file('data/templates.json', templates)
+        template_registry.delete_template(template_id)
         flash('Template deleted successfully', 'success')
         
     except Exception as e:
@@ -887,13 +1555,7 @@ def send_test_email():
         # Get template data if template_id is provided
         template_name = 'Custom Test'
         if template_id:
-            templates = load_json_file('data/templates.json', [])
-            template = None
-            for t in templates:
-                if t['id'] == template_id:
-                    template = t
-                    break
-            
+            template = template_registry.get_template(template_id)
             if template:
                 template_name = template['name']
                 # Use template content if no custom content provided
@@ -944,10 +1606,9 @@ def send_test_email():
         else:
             params["text"] = final_content
 
-        email = resend.Emails.send(params)
+        email = current_transport().send_now(params)
 
         # Log the test email
-        logs = load_json_file('data/logs.json', [])
         log_entry = {
             'school_name': 'Test Email',
             'email': 'rishulchanana36@gmail.com',
@@ -958,8 +1619,7 @@ def send_test_email():
             'email_id': email.get('id', ''),
             'subject': f"[TEST] {final_subject}"
         }
-        logs.append(log_entry)
-        save_json_file('data/logs.json', logs)
+        append_logs([log_entry])
 
         return jsonify({
             'message': f'Test email sent successfully using "{template_name}" template',
@@ -970,140 +1630,57 @@ def send_test_email():
         logging.error(f"Error sending test email: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def run_custom_send_job(job_id, payload):
+    """Queue handler: send a custom email to the schools captured in the job payload"""
+    summary = run_campaign(job_id, payload, lambda schools, recipients, variants: render_custom_emails(schools, payload))
+
+    successful_count = summary['states'].get(send_queue.SENT, 0)
+    error_count = summary['states'].get(send_queue.FAILED, 0)
+    return {
+        'message': f'Custom email sending completed. Removed {successful_count} schools from list.',
+        'summary': {
+            'total_processed': successful_count + error_count,
+            'successful': successful_count,
+            'failed': error_count,
+            'removed_schools': successful_count
+        }
+    }
+
+send_queue.register_handler('send_custom_email', run_custom_send_job)
+
 @app.route('/send_custom_email', methods=['POST'])
 def send_custom_email():
-    """Send custom email without using templates"""
+    """Queue a custom email without using templates"""
     try:
         data = request.get_json()
         subject = data.get('subject', '').strip()
         content = data.get('content', '').strip()
         html_content = data.get('html_content', '').strip()
-        selected_schools = data.get('selected_schools', [])
 
         if not subject or (not content and not html_content):
             return jsonify({'error': 'Subject and content are required'}), 400
 
-        if not selected_schools:
+        try:
+            school_ids = resolve_selection(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if not school_ids:
             return jsonify({'error': 'No schools selected'}), 400
 
-        schools = load_json_file('data/schools.json', [])
-        logs = load_json_file('data/logs.json', [])
-        results = []
-
-        for i, school_index in enumerate(selected_schools):
-            if school_index >= len(schools):
-                continue
-
-            school = schools[school_index]
-
-            # Replace placeholders in custom content
-            email_subject = replace_placeholders(subject, school)
-            email_content = replace_placeholders(content, school) if content else ''
-            email_html = replace_placeholders(html_content, school) if html_content else ''
-
-            # Rate limiting: wait 0.6 seconds between emails
-            if i > 0:
-                time.sleep(0.6)
-
-            # Send email via Resend
-            try:
-                settings = load_settings()
-                sender_email = settings.get('sender_email', 'hello@maximally.in')
-                sender_name = settings.get('sender_name', 'Maximally Team')
-                from_address = f"{sender_name} <{sender_email}>" if sender_name else sender_email
-
-                params = {
-                    "from": from_address,
-                    "to": [school['Email']],
-                    "subject": email_subject,
-                }
-
-                if email_html:
-                    params["html"] = email_html
-                    if email_content:
-                        params["text"] = email_content
-                else:
-                    params["text"] = email_content
-
-                email = resend.Emails.send(params)
-
-                log_entry = {
-                    'school_name': school.get('School Name', ''),
-                    'email': school['Email'],
-                    'template_used': 'Custom Email',
-                    'template_id': 0,
-                    'status': 'Sent',
-                    'timestamp': datetime.now().isoformat(),
-                    'email_id': email.get('id', ''),
-                    'subject': email_subject
-                }
-
-                results.append({'status': 'success', 'school': school['School Name'], 'email': school['Email']})
-
-            except Exception as email_error:
-                error_message = str(email_error)
-                logging.error(f"Error sending custom email to {school['Email']}: {error_message}")
-                
-                # If it's a rate limit error, wait and retry once
-                if "Too many requests" in error_message or "rate limit" in error_message.lower():
-                    logging.info(f"Rate limit hit, waiting 2 seconds and retrying for {school['Email']}")
-                    time.sleep(2)
-                    try:
-                        email = resend.Emails.send(params)
-                        log_entry = {
-                            'school_name': school.get('School Name', ''),
-                            'email': school['Email'],
-                            'template_used': 'Custom Email',
-                            'template_id': 0,
-                            'status': 'Sent (Retry)',
-                            'timestamp': datetime.now().isoformat(),
-                            'email_id': email.get('id', ''),
-                            'subject': email_subject
-                        }
-                        results.append({'status': 'success', 'school': school['School Name'], 'email': school['Email']})
-                    except Exception as retry_error:
-                        log_entry = {
-                            'school_name': school.get('School Name', ''),
-                            'email': school['Email'],
-                            'template_used': 'Custom Email', 
-                            'template_id': 0,
-                            'status': f'Error: {str(retry_error)}',
-                            'timestamp': datetime.now().isoformat(),
-                            'email_id': '',
-                            'subject': email_subject
-                        }
-                        results.append({'status': 'error', 'school': school['School Name'], 'email': school['Email'], 'error': str(retry_error)})
-                else:
-                    log_entry = {
-                        'school_name': school.get('School Name', ''),
-                        'email': school['Email'],
-                        'template_used': 'Custom Email',
-                        'template_id': 0,
-                        'status': f'Error: {error_message}',
-                        'timestamp': datetime.now().isoformat(),
-                        'email_id': '',
-                        'subject': email_subject
-                    }
-                    results.append({'status': 'error', 'school': school['School Name'], 'email': school['Email'], 'error': error_message})
-
-            logs.append(log_entry)
-
-        # Save updated logs
-        save_json_file('data/logs.json', logs)
-
-        # Remove successfully sent schools from the schools list
-        successful_emails = [result['school'] for result in results if result['status'] == 'success']
-        if successful_emails:
-            schools = load_json_file('data/schools.json')
-            # Keep only schools that were not successfully sent emails
-            remaining_schools = [school for school in schools if school.get('School Name', '') not in successful_emails]
-            save_json_file('data/schools.json', remaining_schools)
+        job_id = send_queue.enqueue('send_custom_email', {
+            'subject': subject,
+            'content': content,
+            'html_content': html_content,
+            'transport': current_transport().name,
+            'school_ids': school_ids
+        }, total=len(school_ids))
 
         return jsonify({
-            'message': f'Custom email sending completed. Removed {len(successful_emails)} schools from list.',
-            'results': results,
-            'removed_schools': len(successful_emails)
-        })
+            'message': f'Queued {len(school_ids)} custom emails for sending',
+            'job_id': job_id,
+            'status': 'queued',
+            'total': len(school_ids)
+        }), 202
 
     except Exception as e:
         logging.error(f"Error sending custom emails: {str(e)}")
@@ -1114,19 +1691,29 @@ def settings():
     """Email settings page"""
     if request.method == 'GET':
         current_settings = load_settings()
-        return render_template('settings.html', settings=current_settings)
+        return render_template(
+            'settings.html',
+            settings=current_settings,
+            transports=transports.TRANSPORTS.values(),
+            current_transport=current_settings.get('transport') or transports.DEFAULT_TRANSPORT
+        )
 
     try:
         sender_email = request.form.get('sender_email', '').strip()
         sender_name = request.form.get('sender_name', '').strip()
+        transport = request.form.get('transport', transports.DEFAULT_TRANSPORT)
 
         if not sender_email:
             flash('Sender email is required', 'error')
             return redirect(url_for('settings'))
+        if transport not in transports.TRANSPORTS:
+            flash('Unknown delivery provider', 'error')
+            return redirect(url_for('settings'))
 
         settings = {
             'sender_email': sender_email,
-            'sender_name': sender_name
+            'sender_name': sender_name,
+            'transport': transport
         }
 
         save_json_file('data/settings.json', settings)
@@ -1176,10 +1763,9 @@ def individual_email():
         else:
             params["text"] = content
 
-        email = resend.Emails.send(params)
+        email = current_transport().send_now(params)
 
         # Log the individual email
-        logs = load_json_file('data/logs.json', [])
         log_entry = {
             'school_name': to_name or 'Individual Email',
             'email': to_email,
@@ -1190,8 +1776,7 @@ def individual_email():
             'email_id': email.get('id', ''),
             'subject': subject
         }
-        logs.append(log_entry)
-        save_json_file('data/logs.json', logs)
+        append_logs([log_entry])
 
         flash(f'Email sent successfully to {to_email}!', 'success')
 
@@ -1202,4 +1787,21 @@ def individual_email():
     return render_template('individual_email.html')
 
 # Initialize templates on startup
-initialize_templates()
\ No newline at end of file
+initialize_templates()
+
+# Initialize the shared rate limiter
+rate_limiter.init_limiter()
+
+# Initialize the send queue and start in-process workers unless a separate worker process is used
+send_queue.init_queue()
+send_queue.set_context_factory(app.app_context)
+metrics.add_collector(collect_queue_metrics)
+
+# Move journaled log entries into the database in the background
+log_journal.start_compactor(app)
+# Feed scheduled campaigns to the send queue; a file lock keeps processes from double-dispatching
+campaign_scheduler.start_scheduler(app, enqueue_campaign_job)
+# Queue a campaign's next slice as soon as its current one finishes, not at the next tick
+send_queue.on_finish(campaign_job_finished)
+if os.environ.get("SEND_QUEUE_INPROCESS", "1") == "1":
+    send_queue.start_workers(int(os.environ.get("SEND_WORKER_THREADS", "1")))
\ No newline at end of file
@@ -0,0 +1,198 @@
+import os
+import asyncio
+import time
+import contextvars
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import resend
+from resend.http_client_async import AsyncHTTPClient
+
+import log_config
+import metrics
+import rate_limiter
+
+# Provider requests a send job keeps in flight; the shared rate limiter still caps the aggregate rate
+SEND_CONCURRENCY = int(os.environ.get("SEND_CONCURRENCY", "8"))
+REQUEST_TIMEOUT = float(os.environ.get("SEND_REQUEST_TIMEOUT", "30"))
+MAX_RETRIES = 3
+
+# Retries and rejections are logged per recipient, so they go to the sampled logger
+recipient_log = logging.getLogger(log_config.RECIPIENT_LOGGER)
+
+# Keep-alive client for the send run executing in the current task
+_client = contextvars.ContextVar('send_http_client', default=None)
+
+
+class PooledHTTPXClient(AsyncHTTPClient):
+    """Resend async HTTP client that reuses the current send run's connections"""
+
+    async def request(self, method, url, headers, json=None, files=None, data=None):
+        client = _client.get()
+        if client is None:
+            async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT) as client:
+                return await self._send(client, method, url, headers, json, files, data)
+        return await self._send(client, method, url, headers, json, files, data)
+
+    async def _send(self, client, method, url, headers, json, files, data):
+        try:
+            if files is not None:
+                response = await client.request(method, url, headers=headers, files=files, data=data)
+            else:
+                response = await client.request(method, url, headers=headers, json=json if data is None else None, data=data)
+        except httpx.RequestError as e:
+            # Same wording as the SDK's client so categorize_error sees e.g. "connection" or "timeout"
+            raise RuntimeError(f"Request failed: {e!r}") from e
+        return response.content, response.status_code, response.headers
+
+
+resend.default_async_http_client = PooledHTTPXClient()
+
+
+async def send_with_retries(send, recipient, bucket=rate_limiter.DEFAULT_BUCKET):
+    """Await a provider send coroutine under the shared rate limiter, retrying transient errors"""
+    for attempt in range(MAX_RETRIES):
+        try:
+            # Wait for a token from the rate limiter shared by all workers
+            metrics.RATE_LIMIT_WAIT_SECONDS.observe(await rate_limiter.acquire_async(bucket), provider=bucket)
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = await send()
+                outcome = 'ok'
+                return result
+            finally:
+                metrics.PROVIDER_REQUEST_SECONDS.observe(time.perf_counter() - started, provider=bucket, outcome=outcome)
+        except Exception as retry_error:
+            retry_error_str = str(retry_error)
+
+            if "rate limit" in retry_error_str.lower() or "too many requests" in retry_error_str:
+                # Pause every sender, honouring Retry-After when the provider sends one
+                wait_time = rate_limiter.retry_after_from_error(retry_error) or 2 + attempt  # 2s, 3s, 4s fallback
+                recipient_log.warning("Rate limit hit on attempt %d for %s, waiting %ss", attempt + 1, recipient, wait_time,
+                                      extra={'recipient': recipient, 'attempt': attempt + 1})
+                rate_limiter.penalize(wait_time, bucket)
+                if attempt < MAX_RETRIES - 1:
+                    metrics.SEND_RETRIES.inc(provider=bucket, reason='rate_limit')
+            elif "invalid" in retry_error_str.lower() and "email" in retry_error_str.lower():
+                # Don't retry invalid emails
+                recipient_log.error("Invalid email address %s: %s", recipient, retry_error_str, extra={'recipient': recipient})
+                raise
+            else:
+                # Short retry delay for other errors; other in-flight sends carry on meanwhile
+                wait_time = 1 + attempt  # 1s, 2s, 3s delays
+                recipient_log.warning("Attempt %d failed for %s: %s", attempt + 1, recipient, retry_error_str,
+                                      extra={'recipient': recipient, 'attempt': attempt + 1})
+                if attempt < MAX_RETRIES - 1:
+                    metrics.SEND_RETRIES.inc(provider=bucket, reason='error')
+                    await asyncio.sleep(wait_time)
+
+            if attempt == MAX_RETRIES - 1:
+                raise
+
+
+def run(groups, deliver, record, concurrency=None, checkpoint=None):
+    """Deliver every group from an iterator with up to `concurrency` provider calls in flight
+
+    deliver(group) is a coroutine returning a list of the group's outcomes. record(outcomes)
+    receives the outcomes of every group that finished while the previous call ran, so
+    database writes are batched. Both record and the iterator (which may block; it's read
+    between sends, keeping at most `concurrency` prepared groups buffered) run on one
+    worker thread, so their SQLite work never stalls the sends in flight and never uses the
+    caller's database session from two threads at once.
+
+    checkpoint(groups), if given, must commit before those groups are delivered; groups that
+    come up while one checkpoint commits share the next. It runs on a thread of its own, so
+    sends never wait behind a slow record call, and mustn't use the caller's database session.
+    """
+    asyncio.run(_run(groups, deliver, record, concurrency or SEND_CONCURRENCY, checkpoint))
+
+
+async def _run(groups, deliver, record, concurrency, checkpoint):
+    queue = asyncio.Queue(maxsize=concurrency)
+    finished = asyncio.Queue()
+    starting = asyncio.Queue()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    groups = iter(groups)
+    loop = asyncio.get_running_loop()
+    storage_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='send-storage')
+
+    def off_loop(func, *args):
+        # Like asyncio.to_thread (the caller's app context comes along), but always the same thread
+        return loop.run_in_executor(storage_thread, functools.partial(contextvars.copy_context().run, func, *args))
+
+    async def worker():
+        while True:
+            group = await queue.get()
+            if group is None:
+                return
+            if checkpoint:
+                checkpointed = loop.create_future()
+                starting.put_nowait((group, checkpointed))
+                await checkpointed
+            finished.put_nowait(await deliver(group))
+
+    async def checkpointer():
+        done = False
+        while not done:
+            batch = [await starting.get()]
+            # Groups that come up while a checkpoint commits share the next one
+            while not starting.empty():
+                batch.append(starting.get_nowait())
+            done = None in batch
+            waiting = [item for item in batch if item is not None]
+            if waiting:
+                await asyncio.to_thread(checkpoint, [group for group, _ in waiting])
+                for _, checkpointed in waiting:
+                    # A worker cancelled by another task's failure no longer waits for its checkpoint
+                    if not checkpointed.cancelled():
+                        checkpointed.set_result(None)
+
+    async def recorder():
+        done = False
+        while not done:
+            outcomes = []
+            batch = [await finished.get()]
+            # Take everything that finished meanwhile, so one commit covers many sends
+            while not finished.empty():
+                batch.append(finished.get_nowait())
+            for group_outcomes in batch:
+                if group_outcomes is None:
+                    done = True
+                else:
+                    outcomes.extend(group_outcomes)
+            if outcomes:
+                await off_loop(record, outcomes)
+
+    try:
+        async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT, limits=limits) as client:
+            # Set before the workers start so every task inherits the pooled client
+            _client.set(client)
+            async with asyncio.TaskGroup() as tasks:
+                recording = tasks.create_task(recorder())
+                if checkpoint:
+                    tasks.create_task(checkpointer())
+                async with asyncio.TaskGroup() as sending:
+                    for _ in range(concurrency):
+                        sending.create_task(worker())
+                    while (group := await off_loop(next, groups, None)) is not None:
+                        await queue.put(group)
+                    for _ in range(concurrency):
+                        await queue.put(None)
+                starting.put_nowait(None)
+                finished.put_nowait(None)
+                await recording
+    except BaseExceptionGroup as group:
+        # The task groups wrap whatever stopped the run; callers (and the job's error) see the cause
+        raise first_error(group)
+    finally:
+        # A call cut short by a failed send still finishes before the caller cleans up
+        storage_thread.shutdown(wait=True)
+
+
+def first_error(group):
+    """Return the first exception inside a (possibly nested) exception group"""
+    error = group.exceptions[0]
+    return first_error(error) if isinstance(error, BaseExceptionGroup) else error
@@ -0,0 +1,291 @@
+"""End-to-end benchmark of the main routes through the Flask test client, with a JSON report
+
+Runs against a throwaway data directory: uploads a synthetic CSV of --size schools, previews
+and sends through the real Resend SDK pointed at mock_provider.py, seeds --size log entries,
+then times the error dashboard, /api/error_stats and the CSV export. DNS checks are replaced by
+a syntax-only validation so runs are repeatable offline.
+
+    python benchmarks/app_benchmark.py --size 100k
+    python benchmarks/app_benchmark.py --size 100k --compare benchmarks/results/app-100k-<commit>.json
+
+Each report records the git commit, so reports from different commits can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+RESULTS_DIR = os.path.join(REPO_ROOT, 'benchmarks', 'results')
+LOG_SEED_BATCH = 10000
+ERROR_CATEGORIES = ['Rate Limit', 'Invalid Email', 'Network Error', 'Timeout Error', 'Unknown Error']
+
+
+def parse_size(value):
+    """Parse a count such as 1000, 1k, 100k or 1m"""
+    value = value.strip().lower()
+    multiplier = {'k': 1000, 'm': 1000000}.get(value[-1:], 1)
+    return int(float(value.rstrip('km')) * multiplier)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', default='1k', help="schools and log entries to generate (1k, 100k, 1m)")
+    parser.add_argument('--send', type=int, default=None, help="emails to send (default: min(size, 5000))")
+    parser.add_argument('--latency', type=float, default=0, help="simulated provider latency in ms")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs of each read-only route")
+    parser.add_argument('--seed', type=int, default=1, help="random seed for the synthetic data")
+    parser.add_argument('--output', help="report path (default: benchmarks/results/app-<size>-<commit>.json)")
+    parser.add_argument('--compare', help="earlier report to compare the medians against")
+    return parser.parse_args()
+
+
+args = parse_args()
+# Resolve report paths before moving into the scratch directory
+if args.output:
+    args.output = os.path.abspath(args.output)
+if args.compare:
+    args.compare = os.path.abspath(args.compare)
+SIZE = parse_size(args.size)
+SEND_COUNT = min(SIZE, args.send if args.send is not None else 5000)
+
+# Everything the app writes lands in a scratch directory, and nothing is rate limited
+workdir = tempfile.mkdtemp(prefix='app-benchmark-')
+os.chdir(workdir)
+os.environ['SEND_QUEUE_INPROCESS'] = '0'
+os.environ['RATE_LIMIT_PER_SECOND'] = '1000000'
+os.environ.pop('DATABASE_URL', None)
+sys.path.insert(0, REPO_ROOT)
+
+
+def start_mock_provider():
+    """Run the mock in its own process so it doesn't compete with the app for the GIL"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    script = os.path.join(REPO_ROOT, 'mock_provider.py')
+    process = subprocess.Popen([sys.executable, script, str(port), str(args.latency)], stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return process, f"http://127.0.0.1:{port}"
+
+
+server, os.environ['RESEND_API_URL'] = start_mock_provider()
+
+import logging
+
+from email_validator import validate_email
+
+import app
+import campaign_scheduler
+import email_validation
+import log_journal
+import send_queue
+import storage
+import template_registry
+
+logging.getLogger().setLevel(logging.WARNING)
+campaign_scheduler.stop_scheduler()
+email_validation.validate_email = lambda email: validate_email(email, check_deliverability=False)
+
+
+def git_commit():
+    """Return (commit, dirty) for the checkout being benchmarked, or (None, None) outside git"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_ROOT,
+                                capture_output=True, text=True, check=True).stdout
+        return commit, bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def write_schools_csv(path, count):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('School Name,Email,Contact Person,City\n')
+        for n in range(count):
+            f.write(f"School {n},contact{n}@school{n % 1000}.example.org,Principal {n},City {n % 50}\n")
+
+
+def synthetic_logs(count, template_ids, rng):
+    """Yield log entries spread over the last two days, about one in ten an error"""
+    templates = [template_registry.get_template(template_id) for template_id in template_ids]
+    now = datetime.now()
+    for n in range(count):
+        template = templates[n % len(templates)]
+        entry = {
+            'school_name': f"School {n}",
+            'email': f"contact{n}@school{n % 1000}.example.org",
+            'template_used': template['name'],
+            'template_id': template['id'],
+            'timestamp': (now - timedelta(seconds=rng.randrange(2 * 24 * 3600))).isoformat(),
+            'email_id': f"{n:032x}",
+            'subject': f"Partnership opportunity for School {n}",
+            'status': 'Sent'
+        }
+        if rng.random() < 0.1:
+            category = rng.choice(ERROR_CATEGORIES)
+            entry['status'] = f"Error ({category}): simulated failure"
+            entry['error_category'] = category
+        yield entry
+
+
+def summarize(seconds, items=None):
+    """Return timing stats for one measurement; `items` is the work done per run"""
+    result = {
+        'runs': len(seconds),
+        'median_ms': round(statistics.median(seconds) * 1000, 3),
+        'min_ms': round(min(seconds) * 1000, 3),
+        'max_ms': round(max(seconds) * 1000, 3)
+    }
+    if items is not None:
+        result['items'] = items
+        result['items_per_second'] = round(items / statistics.median(seconds), 1)
+    return result
+
+
+def timed(run, repeat=1):
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - started)
+    return seconds
+
+
+def expect(response, status=200):
+    if response.status_code != status:
+        raise RuntimeError(f"{response.request.path} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return response
+
+
+def run_benchmarks(client):
+    results = {}
+    rng = random.Random(args.seed)
+
+    # Upload: the request spools the file, the import job validates and merges it
+    csv_path = os.path.join(workdir, 'schools.csv')
+    write_schools_csv(csv_path, SIZE)
+
+    def upload():
+        with open(csv_path, 'rb') as f:
+            expect(client.post('/upload', data={'file': (f, 'schools.csv')}, content_type='multipart/form-data'), 302)
+        send_queue.run_pending()
+    results['upload_csv'] = summarize(timed(upload), SIZE)
+
+    with app.app.app_context():
+        school_ids = storage.select_school_ids({})
+    if len(school_ids) != SIZE:
+        raise RuntimeError(f"Imported {len(school_ids)} of {SIZE} schools")
+    template_id = template_registry.template_ids()[0]
+
+    preview_ids = [rng.choice(school_ids) for _ in range(max(args.repeat, 20))]
+    previews = iter(preview_ids)
+    results['preview_email'] = summarize(timed(
+        lambda: expect(client.post('/preview', json={'template_id': template_id, 'school_id': next(previews)})),
+        len(preview_ids)
+    ))
+
+    # Send: queue the job, then run it to completion against the mock provider
+    def send():
+        job_id = expect(client.post('/send', json={'template_id': template_id, 'selected_schools': school_ids[:SEND_COUNT]}), 202).json['job_id']
+        send_queue.run_pending()
+        job = send_queue.get_job(job_id)
+        if job['status'] != 'done':
+            raise RuntimeError(f"Send job ended {job['status']}: {job.get('error')}")
+        return job
+    seconds = timed(send)
+    results['send_emails'] = summarize(seconds, SEND_COUNT)
+
+    # Logs for the read-side routes, written straight to the database in batches
+    with app.app.app_context():
+        log_journal.sync()
+        log_journal.compact()
+        started = time.perf_counter()
+        batch = []
+        for entry in synthetic_logs(SIZE, template_registry.template_ids(), rng):
+            batch.append(entry)
+            if len(batch) == LOG_SEED_BATCH:
+                storage.add_logs(batch)
+                batch = []
+        storage.add_logs(batch)
+        results['seed_logs'] = summarize([time.perf_counter() - started], SIZE)
+        log_count = storage.count_logs()
+
+    results['error_dashboard'] = summarize(timed(lambda: expect(client.get('/error_dashboard')), args.repeat))
+    results['api_error_stats'] = summarize(timed(lambda: expect(client.get('/api/error_stats')), args.repeat))
+
+    export_bytes = []
+    def export():
+        response = expect(client.get('/export'))
+        export_bytes.append(len(response.get_data()))
+    results['export_logs'] = summarize(timed(export, args.repeat), log_count)
+    results['export_logs']['bytes'] = export_bytes[-1]
+    return results
+
+
+def compare(report, baseline):
+    """Print each median next to the baseline report's"""
+    print(f"\nvs {baseline.get('commit', '?')[:12]} ({baseline.get('size')} rows)")
+    for name, result in report['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            print(f"{name:<18} {result['median_ms']:12.1f} ms   (new)")
+            continue
+        change = (result['median_ms'] - before['median_ms']) / before['median_ms'] * 100 if before['median_ms'] else 0
+        print(f"{name:<18} {before['median_ms']:12.1f} -> {result['median_ms']:10.1f} ms  {change:+7.1f}%")
+
+
+def main():
+    commit, dirty = git_commit()
+    client = app.app.test_client()
+    try:
+        results = run_benchmarks(client)
+    finally:
+        server.terminate()
+        log_journal.stop_compactor()
+
+    report = {
+        'benchmark': 'app',
+        'commit': commit,
+        'dirty': dirty,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'size': SIZE,
+        'send_count': SEND_COUNT,
+        'latency_ms': args.latency,
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'results': results
+    }
+    for name, result in results.items():
+        rate = f"  {result['items_per_second']:10.1f} /s" if 'items_per_second' in result else ''
+        print(f"{name:<18} {result['median_ms']:12.1f} ms{rate}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"app-{args.size}-{(commit or 'nogit')[:12]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
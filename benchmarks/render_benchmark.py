@@ -0,0 +1,69 @@
+"""Compare legacy str.replace placeholder substitution with the compiled template engine"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import template_engine
+
+SCHOOL_COUNT = 10000
+
+SUBJECT = "Partnership opportunity for {{school_name}}"
+CONTENT = """Dear {{contact_person}},
+
+I hope this message finds you well. We'd love to bring our programmes to {{school_name}} in {{city}}.
+Students across {{city}} have already taken part, and we think {{school_name}} would be a great fit.
+
+If it helps, I can send more details to {{email}}.
+
+Best regards,
+Maximally Team
+""" * 4
+
+
+def legacy_replace(text, school_data):
+    """The original four-pass str.replace implementation"""
+    placeholders = {
+        '{{school_name}}': school_data.get('School Name', ''),
+        '{{contact_person}}': school_data.get('Contact Person', ''),
+        '{{city}}': school_data.get('City', ''),
+        '{{email}}': school_data.get('Email', '')
+    }
+    result = text
+    for placeholder, value in placeholders.items():
+        result = result.replace(placeholder, str(value))
+    return result
+
+
+def make_schools(count):
+    return [{
+        'School Name': f"School {n}",
+        'Contact Person': f"Principal {n}",
+        'City': f"City {n % 50}",
+        'Email': f"school{n}@example.com",
+    } for n in range(count)]
+
+
+def timed(render, schools):
+    started = time.perf_counter()
+    for school in schools:
+        render(SUBJECT, school)
+        render(CONTENT, school)
+    return time.perf_counter() - started
+
+
+def main():
+    schools = make_schools(SCHOOL_COUNT)
+    for school in schools[:100]:
+        assert legacy_replace(CONTENT, school) == template_engine.render_text(CONTENT, school, 1)
+
+    legacy = timed(legacy_replace, schools)
+    compiled = timed(lambda text, school: template_engine.render_text(text, school, 1), schools)
+    print(f"{SCHOOL_COUNT} schools, {len(CONTENT)} character body")
+    print(f"legacy str.replace: {legacy * 1000:.1f} ms ({legacy / SCHOOL_COUNT * 1e6:.1f} us/school)")
+    print(f"compiled template:  {compiled * 1000:.1f} ms ({compiled / SCHOOL_COUNT * 1e6:.1f} us/school)")
+
+
+if __name__ == '__main__':
+    main()
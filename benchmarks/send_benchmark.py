@@ -0,0 +1,86 @@
+"""Compare the old sequential send loop with the asyncio engine against a local mock provider
+
+The mock answers like the Resend API after a fixed delay; pass the message count and the
+latency in milliseconds as arguments. The rate limiter is opened up so only round trips count.
+"""
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+workdir = tempfile.mkdtemp()
+os.environ['RATE_LIMIT_DB'] = os.path.join(workdir, 'ratelimit.db')
+os.environ['RATE_LIMIT_PER_SECOND'] = '100000'
+
+import resend
+
+import async_sender
+import rate_limiter
+
+MESSAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+LATENCY = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.05
+
+
+def start_mock_provider():
+    """Run the mock in its own process so it doesn't compete with the sender for the GIL"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mock_provider.py')
+    process = subprocess.Popen([sys.executable, script, str(port), str(LATENCY * 1000)], stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def make_params(count):
+    return [{
+        'from': 'Maximally Team <hello@maximally.in>',
+        'to': [f"school{n}@example.com"],
+        'subject': f"Partnership opportunity for School {n}",
+        'text': 'Hello',
+    } for n in range(count)]
+
+
+def sequential(params_list):
+    """The send loop before the asyncio engine: one blocking SDK call at a time"""
+    for params in params_list:
+        rate_limiter.acquire()
+        resend.Emails.send(params)
+
+
+def concurrent(params_list, concurrency):
+    async def deliver(params):
+        return [await async_sender.send_with_retries(lambda: resend.Emails.send_async(params), params['to'][0])]
+    async_sender.run(iter(params_list), deliver, lambda outcome: None, concurrency)
+
+
+def timed(label, run):
+    started = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed:7.2f} s  {MESSAGES / elapsed:8.1f} emails/s")
+
+
+def main():
+    rate_limiter.init_limiter()
+    server, resend.api_url = start_mock_provider()
+    params_list = make_params(MESSAGES)
+    print(f"{MESSAGES} emails, {LATENCY * 1000:.0f} ms simulated provider latency")
+
+    timed('sequential (before)', lambda: sequential(params_list))
+    for concurrency in (1, 4, 8, 16):
+        timed(f"asyncio, {concurrency} in flight", lambda: concurrent(params_list, concurrency))
+    server.terminate()
+
+
+if __name__ == '__main__':
+    main()
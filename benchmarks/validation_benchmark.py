@@ -0,0 +1,67 @@
+"""Time email validation for a large import: serial vs. thread pool vs. cached re-upload
+
+DNS lookups are replaced by a fixed sleep so runs are repeatable offline; pass the
+latency in milliseconds as the second argument (row count is the first).
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from email_validator import validate_email
+
+import email_validation
+import storage
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+LATENCY = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.002
+CHUNK_SIZE = 1000
+
+
+def simulated_validate_email(email):
+    """Syntax check plus a fixed delay standing in for the MX lookup"""
+    time.sleep(LATENCY)
+    return validate_email(email, check_deliverability=False)
+
+
+def make_addresses(count):
+    return [f"contact{n}@School{n % 500}.example.org" for n in range(count)]
+
+
+def chunks(items):
+    for start in range(0, len(items), CHUNK_SIZE):
+        yield items[start:start + CHUNK_SIZE]
+
+
+def timed(label, run):
+    started = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<32} {elapsed:8.2f} s  ({elapsed / ROWS * 1e6:7.1f} us/row)")
+    return elapsed
+
+
+def main():
+    email_validation.validate_email = simulated_validate_email
+    addresses = make_addresses(ROWS)
+    print(f"{ROWS} rows, {LATENCY * 1000:.1f} ms simulated DNS latency, {email_validation.VALIDATION_WORKERS} workers")
+
+    timed('serial (before)', lambda: [email_validation.check_address(a) for a in addresses])
+
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    storage.init_storage(app)
+    with app.app_context():
+        timed('thread pool, cold cache', lambda: [email_validation.validate_many(c) for c in chunks(addresses)])
+        timed('re-upload, memory cache', lambda: [email_validation.validate_many(c) for c in chunks(addresses)])
+        email_validation._cache.clear()
+        timed('re-upload, database cache', lambda: [email_validation.validate_many(c) for c in chunks(addresses)])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+import os
+import math
+import fcntl
+import logging
+import threading
+from datetime import datetime, time, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import send_queue
+import storage
+
+# How often due campaigns are checked and topped up
+SCHEDULER_INTERVAL = float(os.environ.get("CAMPAIGN_SCHEDULER_INTERVAL", "30"))
+# Most recipients handed to one send job; a campaign has one job in flight at a time
+SLICE_SIZE = int(os.environ.get("CAMPAIGN_SLICE_SIZE", "1000"))
+LOCK_FILE = 'data/campaigns.lock'
+
+_thread = None
+_stopping = False
+_wake_event = threading.Event()
+
+
+def valid_timezone(name):
+    """Return True if name is an IANA timezone such as 'Asia/Kolkata'"""
+    try:
+        ZoneInfo(name)
+        return True
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        return False
+
+
+def parse_clock(value):
+    """Parse 'HH:MM' into a time; raises ValueError"""
+    hour, minute = value.split(':')
+    return time(int(hour), int(minute))
+
+
+def is_quiet(local_time, quiet_start, quiet_end):
+    """Return True if a local time falls in the quiet window, which may wrap past midnight"""
+    start, end = parse_clock(quiet_start), parse_clock(quiet_end)
+    if start <= end:
+        return start <= local_time < end
+    return local_time >= start or local_time < end
+
+
+def open_timezones(campaign, timezones, now_utc):
+    """Return the timezones in which it is currently outside the campaign's quiet hours"""
+    quiet = campaign['quiet_hours']
+    if not quiet:
+        return timezones
+    return [name for name in timezones
+            if not is_quiet(now_utc.astimezone(ZoneInfo(name)).time(), quiet['start'], quiet['end'])]
+
+
+def pace_tokens(campaign, now):
+    """Return the hourly pacing balance a campaign has built up by now
+
+    The balance refills at per_hour / 3600 recipients a second from the time it was last
+    saved (the last dispatch, or the start time), whatever woke the scheduler, and keeps
+    fractions between dispatches. It is capped at one tick's worth plus one, so a campaign
+    that waited (for a slice, quiet hours or a pause) doesn't resume with a burst.
+    """
+    rate = campaign['per_hour'] / 3600
+    since = datetime.fromisoformat(campaign['paced_at'] or campaign['start_at'])
+    elapsed = max(0.0, (now - since).total_seconds())
+    return min((campaign['pace_tokens'] or 0.0) + rate * elapsed, rate * SCHEDULER_INTERVAL + 1)
+
+
+def allowance(campaign, now):
+    """Return how many recipients the campaign may dispatch now under its ceilings"""
+    last_hour, last_day = storage.campaign_dispatch_counts(campaign['id'], now)
+    limits = [SLICE_SIZE]
+    if campaign['per_hour']:
+        limits.append(campaign['per_hour'] - last_hour)
+        # Spread the hourly ceiling over the hour instead of sending it all at the top
+        limits.append(math.floor(pace_tokens(campaign, now)))
+    if campaign['per_day']:
+        limits.append(campaign['per_day'] - last_day)
+    return max(0, min(limits))
+
+
+def dispatch(campaign, enqueue, now=None, now_utc=None):
+    """Queue the campaign's next slice if it is allowed to send now; return the number queued
+
+    enqueue(campaign, school_ids) queues a send job and returns its id.
+    """
+    now = now or datetime.now()
+    now_utc = now_utc or datetime.now(timezone.utc)
+    if campaign['current_job_id']:
+        job = send_queue.get_job(campaign['current_job_id'])
+        if job and job['status'] in ('queued', 'running'):
+            return 0
+
+    if campaign['status'] == 'scheduled':
+        added = storage.start_campaign(campaign['id'], campaign['selection'], campaign['timezone'], valid_timezone)
+        logging.info(f"Campaign {campaign['id']} started with {added} recipients")
+
+    timezones = storage.pending_campaign_timezones(campaign['id'])
+    if not timezones:
+        storage.update_campaign(campaign['id'], status='done', finished_at=now)
+        logging.info(f"Campaign {campaign['id']} finished")
+        return 0
+
+    timezones = open_timezones(campaign, timezones, now_utc)
+    count = allowance(campaign, now)
+    if not timezones or count <= 0:
+        return 0
+    school_ids = storage.pending_campaign_recipients(campaign['id'], timezones, count)
+    if not school_ids:
+        return 0
+    job_id = enqueue(campaign, school_ids)
+    balance = pace_tokens(campaign, now) - len(school_ids) if campaign['per_hour'] else None
+    storage.mark_campaign_dispatched(campaign['id'], school_ids, job_id, now, balance)
+    logging.info(f"Campaign {campaign['id']} queued {len(school_ids)} recipients as job {job_id}")
+    return len(school_ids)
+
+
+def tick(enqueue, now=None):
+    """Top up every due campaign (needs an app context); return the number of recipients queued"""
+    os.makedirs(os.path.dirname(LOCK_FILE), exist_ok=True)
+    fd = os.open(LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Another process is already dispatching
+            return 0
+        queued = 0
+        for campaign in storage.due_campaigns(now):
+            try:
+                queued += dispatch(campaign, enqueue, now)
+            except Exception as e:
+                storage.db.session.rollback()
+                logging.error(f"Campaign {campaign['id']} dispatch failed: {str(e)}")
+        return queued
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def _scheduler_loop(app, enqueue):
+    while True:
+        _wake_event.wait(SCHEDULER_INTERVAL)
+        _wake_event.clear()
+        if _stopping:
+            return
+        try:
+            with app.app_context():
+                tick(enqueue)
+        except Exception as e:
+            logging.error(f"Campaign scheduler tick failed: {str(e)}")
+
+
+def start_scheduler(app, enqueue):
+    """Start the background thread that feeds due campaigns to the send queue"""
+    global _thread, _stopping
+    if _thread is not None:
+        return
+    _stopping = False
+    _thread = threading.Thread(target=_scheduler_loop, args=(app, enqueue), name='campaign-scheduler', daemon=True)
+    _thread.start()
+
+
+def wake():
+    """Run a scheduler tick now, e.g. after a campaign is created or resumed"""
+    _wake_event.set()
+
+
+def stop_scheduler(timeout=5):
+    """Stop the background scheduler thread"""
+    global _thread, _stopping
+    _stopping = True
+    _wake_event.set()
+    if _thread is not None:
+        _thread.join(timeout)
+        _thread = None
@@ -0,0 +1,79 @@
+import os
+import json
+import threading
+import time
+
+import metrics
+
+# JSON config files (settings, templates) are parsed once and kept in memory. Within this many
+# seconds of the last check a read touches nothing on disk; after that, one stat() tells whether
+# another process rewrote the file.
+RECHECK_INTERVAL = float(os.environ.get("CONFIG_RECHECK_INTERVAL", "1.0"))
+
+_entries = {}
+_lock = threading.Lock()
+
+
+class _Entry:
+    __slots__ = ('stamp', 'checked_at', 'data')
+
+    def __init__(self, stamp, checked_at, data):
+        self.stamp = stamp
+        self.checked_at = checked_at
+        self.data = data
+
+
+def _stamp(filename):
+    """Identify a version of a file by inode, size and mtime (None if it doesn't exist)"""
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def _read(filename, default):
+    try:
+        with open(filename, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+
+def load(filename, default):
+    """Return the parsed contents of a JSON file, re-reading it only when it changed
+
+    The returned object is shared with other callers; copy it before modifying.
+    """
+    now = time.monotonic()
+    entry = _entries.get(filename)
+    if entry is not None and now - entry.checked_at < RECHECK_INTERVAL:
+        return entry.data
+    stamp = _stamp(filename)
+    if entry is not None and entry.stamp == stamp:
+        entry.checked_at = now
+        return entry.data
+    with _lock, metrics.timer(metrics.STORAGE_SECONDS, 'json', operation='json_load'):
+        data = _read(filename, default)
+        _entries[filename] = _Entry(stamp, now, data)
+    return data
+
+
+def save(filename, data):
+    """Write a JSON file atomically and update the cache with what was written"""
+    temp_path = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with _lock, metrics.timer(metrics.STORAGE_SECONDS, 'json', operation='json_save'):
+        with open(temp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        # Readers in other processes see either the old file or the new one, never half of it
+        os.replace(temp_path, filename)
+        _entries[filename] = _Entry(_stamp(filename), time.monotonic(), data)
+
+
+def invalidate(filename=None):
+    """Forget cached contents so the next load re-reads from disk"""
+    with _lock:
+        if filename is None:
+            _entries.clear()
+        else:
+            _entries.pop(filename, None)
@@ -0,0 +1,86 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from flask import has_app_context
+from email_validator import validate_email, EmailNotValidError
+
+import storage
+
+# Validation is mostly DNS lookups, so it runs across a thread pool and results are cached
+VALIDATION_WORKERS = int(os.environ.get("VALIDATION_WORKERS", "16"))
+VALIDATION_CACHE_SIZE = int(os.environ.get("VALIDATION_CACHE_SIZE", "100000"))
+VALIDATION_CACHE_DAYS = float(os.environ.get("VALIDATION_CACHE_DAYS", "30"))
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def cache_key(email):
+    """Normalize an address for cache lookups (domains are case-insensitive, local parts aren't)"""
+    local, _, domain = email.strip().rpartition('@')
+    return f"{local}@{domain.lower()}" if local else email.strip()
+
+
+def check_address(email):
+    """Run email_validator on one address without consulting the cache"""
+    try:
+        # Validate and get info about the email
+        validated_email = validate_email(email)
+        return True, validated_email.email
+    except EmailNotValidError:
+        return False, email
+
+
+def _remember(results):
+    """Store results in the in-process LRU"""
+    with _cache_lock:
+        for key, result in results.items():
+            _cache[key] = result
+            _cache.move_to_end(key)
+        while len(_cache) > VALIDATION_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _cached(keys):
+    """Return cached results for keys, checking memory first and then the database"""
+    found = {}
+    with _cache_lock:
+        for key in keys:
+            result = _cache.get(key)
+            if result is not None:
+                _cache.move_to_end(key)
+                found[key] = result
+    missing = [key for key in keys if key not in found]
+    if missing and has_app_context():
+        stored = storage.get_validations(missing, timedelta(days=VALIDATION_CACHE_DAYS))
+        _remember(stored)
+        found.update(stored)
+    return found
+
+
+def validate_many(emails):
+    """Validate addresses in parallel; return {email: (is_valid, normalized_email)}"""
+    keys = {email: cache_key(email) for email in emails}
+    results = _cached(set(keys.values()))
+    pending = [key for key in set(keys.values()) if key not in results]
+    if len(pending) == 1:
+        checked = {pending[0]: check_address(pending[0])}
+    elif pending:
+        with ThreadPoolExecutor(max_workers=min(VALIDATION_WORKERS, len(pending))) as pool:
+            checked = dict(zip(pending, pool.map(check_address, pending)))
+    if pending:
+        _remember(checked)
+        if has_app_context():
+            storage.save_validations(checked)
+        logging.debug("Validated %d addresses (%d from cache)", len(pending), len(results))
+        results.update(checked)
+    return {email: results[key] for email, key in keys.items()}
+
+
+def validate_address(email):
+    """Validate a single address through the cache"""
+    return validate_many([email])[email]
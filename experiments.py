@@ -0,0 +1,112 @@
+import os
+import bisect
+import hashlib
+import json
+import logging
+from itertools import accumulate
+
+import numpy as np
+
+import send_queue
+import storage
+
+# Share of A/B traffic spread evenly over every variant, so new and unlucky templates keep getting data
+EXPLORATION = float(os.environ.get("AB_EXPLORATION", "0.1"))
+# Assignments between recomputing weights; send jobs render 500 recipients at a time once the
+# previous chunk is almost all sent, so its results are in by the next refresh (a refresh later
+# in batch mode, where up to SEND_CONCURRENCY whole batches are queued ahead)
+REFRESH_EVERY = int(os.environ.get("AB_REFRESH_EVERY", "500"))
+# Posterior samples per weight calculation
+THOMPSON_DRAWS = 2000
+
+
+def thompson_weights(outcomes, seed, draws=THOMPSON_DRAWS, exploration=EXPLORATION):
+    """Return each variant's share of traffic from its (sent, errors) counts
+
+    Each variant's delivery rate gets a Beta(sent + 1, errors + 1) posterior and its share is
+    the fraction of joint posterior draws in which it comes out best, mixed with a uniform
+    `exploration` share. Variants with little data have wide posteriors and still win draws.
+    """
+    sent = np.array([outcome[0] for outcome in outcomes], dtype=float)
+    errors = np.array([outcome[1] for outcome in outcomes], dtype=float)
+    samples = np.random.default_rng(seed).beta(sent + 1, errors + 1, size=(draws, len(outcomes)))
+    wins = np.bincount(samples.argmax(axis=1), minlength=len(outcomes))
+    return [float(exploration / len(outcomes) + (1 - exploration) * win / draws) for win in wins]
+
+
+def _unit_hash(value):
+    """Map a string to a stable float in [0, 1)"""
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big') / 2 ** 64
+
+
+class Experiment:
+    """Assigns template variants to a campaign's recipients
+
+    A recipient's variant is picked by hashing the campaign and recipient onto the current
+    weights, so the same inputs always give the same variant. Weights come from the
+    per-template log counters, which moves the bulk of a campaign onto the templates that
+    have delivered best, and are recomputed every `refresh_every` assignments with the
+    campaign's own checkpointed results added. Send jobs render each chunk just before
+    sending it (see app.spool_messages), so a variant failing early in a campaign loses
+    traffic for the rest of it.
+    """
+
+    def __init__(self, campaign_id, template_ids, refresh_every=REFRESH_EVERY, job_ids=None, baseline=None):
+        self.campaign_id = campaign_id
+        # Send jobs whose recipient checkpoints hold the campaign's results (a one-off send is its own campaign)
+        self.job_ids = list(job_ids or [campaign_id])
+        self.variants = tuple(template_ids)
+        self.refresh_every = refresh_every
+        self.assigned = 0
+        self.rounds = 0
+        self.weights = []
+        self._bounds = []
+        # Logs reach the counters when the journal is compacted, so the campaign's own results
+        # come from its recipient checkpoints instead of re-reading the counters mid-run
+        self.baseline = storage.variant_outcome_counts() if baseline is None else baseline
+        self.refresh()
+
+    def refresh(self):
+        """Recompute variant weights from the latest sent/error counts"""
+        campaign = send_queue.variant_outcomes(self.job_ids)
+        outcomes = []
+        for variant in self.variants:
+            baseline = self.baseline.get(variant, {})
+            states = campaign.get(variant, {})
+            outcomes.append((baseline.get('sent', 0) + states.get(send_queue.SENT, 0),
+                             baseline.get('error', 0) + states.get(send_queue.FAILED, 0)))
+        seed = int.from_bytes(hashlib.blake2b(f"{self.campaign_id}-{self.rounds}".encode('utf-8'), digest_size=8).digest(), 'big')
+        self.weights = thompson_weights(outcomes, seed)
+        self._bounds = list(accumulate(self.weights))
+        self.rounds += 1
+        logging.info(f"A/B weights for {self.campaign_id} (round {self.rounds}): "
+                     f"{dict(zip(self.variants, (round(weight, 3) for weight in self.weights)))}")
+
+    def assign(self, recipient, previous=None):
+        """Return the template id for a recipient, keeping `previous` if it's still a variant"""
+        if previous in self.variants:
+            return previous
+        if self.assigned and self.assigned % self.refresh_every == 0:
+            self.refresh()
+        self.assigned += 1
+        point = _unit_hash(f"{self.campaign_id}:{recipient}") * self._bounds[-1]
+        return self.variants[min(bisect.bisect_right(self._bounds, point), len(self.variants) - 1)]
+
+
+def campaign_experiment(campaign_id, job_id, template_ids):
+    """Return the experiment for one slice of a scheduled campaign, carrying on where earlier slices left off
+
+    Every slice hashes recipients under the same campaign key and weighs the template counters
+    as they were when the first slice started (kept in storage meta; later counters already
+    include the campaign's own sends) plus the checkpointed results of all the campaign's jobs.
+    """
+    key = f"ab_baseline:campaign-{campaign_id}"
+    stored = storage.get_meta(key)
+    if stored is None:
+        baseline = storage.variant_outcome_counts()
+        storage.set_meta(key, json.dumps(baseline))
+    else:
+        baseline = {int(template_id): counts for template_id, counts in json.loads(stored).items()}
+    # The current slice may start before the scheduler records its job id against the recipients
+    job_ids = sorted(set(storage.campaign_job_ids(campaign_id)) | {job_id})
+    return Experiment(f"campaign-{campaign_id}", template_ids, job_ids=job_ids, baseline=baseline)
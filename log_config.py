@@ -0,0 +1,97 @@
+import os
+import json
+import atexit
+import logging
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Root log level: DEBUG, INFO, WARNING or ERROR
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# 'text' for readable lines, 'json' for one JSON object per line with any `extra` fields
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()
+# Share of per-recipient messages (skips, retries, provider errors) that are written; every
+# outcome is still recorded in email_logs and the emails_total metric
+RECIPIENT_SAMPLE_RATE = float(os.environ.get("LOG_RECIPIENT_SAMPLE_RATE", "0.1"))
+# Logger for per-recipient messages, which are sampled
+RECIPIENT_LOGGER = 'recipients'
+# Libraries that log every provider request at INFO; raised to WARNING unless LOG_LEVEL is DEBUG
+QUIET_LOGGERS = ('httpx', 'httpcore')
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# Attributes every LogRecord has; anything else on a record came from `extra`
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object, including fields passed with `extra`"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """Lets through a random `rate` share of records, tagging each with the rate it was sampled at"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if self.rate >= 1:
+            return True
+        if random.random() >= self.rate:
+            return False
+        record.sample_rate = self.rate
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queues records unformatted, so message formatting happens on the listener thread
+
+    The queue never leaves the process, so the record doesn't need to be made picklable.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def configure_logging():
+    """Route all logging through a queue drained by a background thread; safe to call twice"""
+    global _listener
+    if _listener is not None:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT))
+
+    # Callers only put records on the queue; the listener does the formatting and I/O
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(DeferredQueueHandler(records))
+    root.setLevel(LOG_LEVEL)
+
+    _listener = QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+    # Flush what's still queued when the process exits
+    atexit.register(_listener.stop)
+
+    logging.getLogger(RECIPIENT_LOGGER).addFilter(SampleFilter(RECIPIENT_SAMPLE_RATE))
+    if root.getEffectiveLevel() > logging.DEBUG:
+        for name in QUIET_LOGGERS:
+            logging.getLogger(name).setLevel(logging.WARNING)
@@ -0,0 +1,224 @@
+import os
+import json
+import fcntl
+import glob
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+import storage
+
+# Append-only journal for email log entries; compaction moves them into the database
+JOURNAL_DIR = os.environ.get("LOG_JOURNAL_DIR", "data/journal")
+FSYNC_EVERY = int(os.environ.get("LOG_JOURNAL_FSYNC_EVERY", "50"))
+FSYNC_INTERVAL = float(os.environ.get("LOG_JOURNAL_FSYNC_INTERVAL", "1.0"))
+MAX_BYTES = int(os.environ.get("LOG_JOURNAL_MAX_BYTES", str(16 * 1024 * 1024)))
+COMPACT_INTERVAL = float(os.environ.get("LOG_JOURNAL_COMPACT_INTERVAL", "5.0"))
+INGEST_BATCH_SIZE = 1000
+
+ACTIVE_FILE = 'logs.jsonl'
+
+_lock = threading.Lock()
+_fd = None
+_fd_inode = None
+_unsynced = 0
+_last_sync = 0.0
+_compactor = None
+_stopping = False
+_wake_event = threading.Event()
+
+
+def _path(name):
+    return os.path.join(JOURNAL_DIR, name)
+
+
+@contextmanager
+def _file_lock(name, mode):
+    """Hold an flock on a lock file in the journal directory"""
+    os.makedirs(JOURNAL_DIR, exist_ok=True)
+    fd = os.open(_path(name), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, mode)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def _active_fd():
+    """Return an fd for the active journal, reopening it if compaction rotated the file"""
+    global _fd, _fd_inode, _unsynced
+    path = _path(ACTIVE_FILE)
+    try:
+        inode = os.stat(path).st_ino
+    except FileNotFoundError:
+        inode = None
+    if _fd is None or inode != _fd_inode:
+        if _fd is not None:
+            os.fsync(_fd)
+            os.close(_fd)
+        _fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        _fd_inode = os.fstat(_fd).st_ino
+        _unsynced = 0
+    return _fd
+
+
+def append(entries):
+    """Append log entries to the journal; fsync is batched by count and time"""
+    global _unsynced, _last_sync
+    if not entries:
+        return
+    data = ''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries).encode('utf-8')
+    with _lock, _file_lock('rotate.lock', fcntl.LOCK_SH), \
+            metrics.timer(metrics.STORAGE_SECONDS, 'journal', operation='journal_append'):
+        fd = _active_fd()
+        # One write call with O_APPEND keeps concurrent writers from interleaving lines
+        os.write(fd, data)
+        if os.fstat(fd).st_size >= MAX_BYTES:
+            # Wake the compactor early instead of letting the journal grow unbounded
+            _wake_event.set()
+        _unsynced += len(entries)
+        now = time.monotonic()
+        if _unsynced >= FSYNC_EVERY or now - _last_sync >= FSYNC_INTERVAL:
+            os.fsync(fd)
+            _unsynced = 0
+            _last_sync = now
+
+
+def sync():
+    """Force buffered journal writes from this process to disk"""
+    global _unsynced, _last_sync
+    with _lock:
+        if _fd is not None and _unsynced:
+            os.fsync(_fd)
+            _unsynced = 0
+            _last_sync = time.monotonic()
+
+
+def rotate():
+    """Move the active journal aside as a segment ready for compaction"""
+    with _file_lock('rotate.lock', fcntl.LOCK_EX):
+        path = _path(ACTIVE_FILE)
+        try:
+            if os.path.getsize(path) == 0:
+                return None
+        except FileNotFoundError:
+            return None
+        segment = _path(f"segment-{time.time_ns()}-{os.getpid()}.jsonl")
+        os.rename(path, segment)
+        return segment
+
+
+def _segments():
+    return sorted(glob.glob(_path('segment-*.jsonl')))
+
+
+def _read_file(path):
+    """Yield entries from one journal file, skipping lines that aren't valid JSON"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.endswith('\n'):
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn or corrupt line would otherwise block compaction for good
+                    logging.warning(f"Skipping unreadable journal line {line_no} in {os.path.basename(path)}: {line[:200]!r}")
+                    continue
+                yield entry
+    except FileNotFoundError:
+        return
+
+
+def iter_entries():
+    """Stream every entry still in the journal, oldest first, without loading it into memory"""
+    for segment in _segments():
+        yield from _read_file(segment)
+    yield from _read_file(_path(ACTIVE_FILE))
+
+
+def pending_bytes():
+    """Return the size of journal data not yet compacted into the database"""
+    total = 0
+    for path in _segments() + [_path(ACTIVE_FILE)]:
+        try:
+            total += os.path.getsize(path)
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def _ingest_segment(segment):
+    """Copy a segment into the database, checkpointing progress so a crash never duplicates rows"""
+    key = 'journal:' + os.path.basename(segment)
+    done = int(storage.get_meta(key) or 0)
+    batch = []
+    line_no = 0
+    for line_no, entry in enumerate(_read_file(segment), 1):
+        if line_no <= done:
+            continue
+        batch.append(entry)
+        if len(batch) >= INGEST_BATCH_SIZE:
+            storage.add_logs(batch, checkpoint=(key, str(line_no)))
+            batch = []
+    if batch:
+        storage.add_logs(batch, checkpoint=(key, str(line_no)))
+    os.remove(segment)
+    storage.delete_meta(key)
+    return line_no - done
+
+
+def compact(wait=False):
+    """Rotate the journal and ingest all segments into the database (needs an app context)"""
+    rotate()
+    ingested = 0
+    try:
+        with _file_lock('ingest.lock', fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB), \
+                metrics.timer(metrics.STORAGE_SECONDS, operation='journal_compact'):
+            for segment in _segments():
+                ingested += _ingest_segment(segment)
+    except BlockingIOError:
+        # Another process is already compacting; callers about to read or clear email_logs pass
+        # wait=True to wait for it and ingest whatever it left instead
+        return 0
+    if ingested:
+        logging.info(f"Compacted {ingested} journal entries into the database")
+    return ingested
+
+
+def _compactor_loop(app):
+    """Periodically compact the journal, sooner when it grows past MAX_BYTES"""
+    while True:
+        _wake_event.wait(COMPACT_INTERVAL)
+        _wake_event.clear()
+        if _stopping:
+            return
+        try:
+            sync()
+            with app.app_context():
+                compact()
+        except Exception as e:
+            logging.error(f"Log journal compaction failed: {str(e)}")
+
+
+def start_compactor(app):
+    """Start the background compaction thread for this process"""
+    global _compactor, _stopping
+    if _compactor is not None:
+        return
+    _stopping = False
+    _compactor = threading.Thread(target=_compactor_loop, args=(app,), name='log-journal-compactor', daemon=True)
+    _compactor.start()
+
+
+def stop_compactor(timeout=5):
+    """Stop the background compaction thread"""
+    global _compactor, _stopping
+    _stopping = True
+    _wake_event.set()
+    if _compactor is not None:
+        _compactor.join(timeout)
+        _compactor = None
@@ -0,0 +1,84 @@
+import os
+import gzip
+import json
+
+import metrics
+
+# Rendered campaign messages, written once before sending and streamed by the send stage
+SPOOL_DIR = os.environ.get("MESSAGE_SPOOL_DIR", "data/spool")
+# Spools are written once and read once, so favour speed over ratio
+COMPRESS_LEVEL = 1
+
+
+def _path(job_id, suffix):
+    return os.path.join(SPOOL_DIR, f"{job_id}{suffix}")
+
+
+class SpoolWriter:
+    """Writes a job's messages to a temporary gzipped JSONL file that commit() publishes
+
+    The first line is a header shared by every message (e.g. the From address); each
+    following line is one message row.
+    """
+
+    def __init__(self, job_id, header):
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        self.job_id = job_id
+        self.temp_path = _path(job_id, '.jsonl.gz.tmp')
+        self.file = gzip.open(self.temp_path, 'wt', encoding='utf-8', compresslevel=COMPRESS_LEVEL)
+        self.file.write(json.dumps(header) + '\n')
+        self.count = 0
+
+    def write(self, rows):
+        with metrics.timer(metrics.STORAGE_SECONDS, operation='spool_write'):
+            self.file.write(''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in rows))
+        self.count += len(rows)
+
+    def commit(self, stats):
+        """Publish the spool with its stats and return them (with message count and size added)"""
+        self.file.close()
+        stats = {**stats, 'messages': self.count, 'bytes': os.path.getsize(self.temp_path)}
+        with open(_path(self.job_id, '.json'), 'w') as f:
+            json.dump(stats, f)
+        # A spool only exists once it is complete; a crash mid-write leaves a .tmp to redo
+        os.replace(self.temp_path, _path(self.job_id, '.jsonl.gz'))
+        return stats
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+def exists(job_id):
+    """Return True if the job has a complete spool"""
+    return os.path.exists(_path(job_id, '.jsonl.gz'))
+
+
+def stats(job_id):
+    """Return the stats recorded when the job's spool was written, or None"""
+    try:
+        with open(_path(job_id, '.json'), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def read(job_id):
+    """Return (header, rows) for a job's spool, where rows lazily yields each message row"""
+    f = gzip.open(_path(job_id, '.jsonl.gz'), 'rt', encoding='utf-8')
+    header = json.loads(f.readline())
+
+    def rows():
+        with f:
+            for line in f:
+                yield json.loads(line)
+
+    return header, rows()
+
+
+def remove(job_id):
+    """Delete a job's spool and its stats"""
+    for suffix in ('.jsonl.gz', '.jsonl.gz.tmp', '.json'):
+        if os.path.exists(_path(job_id, suffix)):
+            os.remove(_path(job_id, suffix))
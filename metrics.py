@@ -0,0 +1,205 @@
+import os
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add a Server-Timing header (total plus timed phases such as db and render) to every response
+SERVER_TIMING = os.environ.get("METRICS_SERVER_TIMING", "0") == "1"
+# Histogram bucket bounds in seconds, from a fast SQLite query to a slow provider call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Metrics live in the process that records them; with a separate worker.py process its
+# send metrics are served on METRICS_PORT instead of the web app's /metrics
+_metrics = {}
+_collectors = []
+_registry_lock = threading.Lock()
+# Phase durations of the request being handled in this context (None outside a request)
+_phases = contextvars.ContextVar('request_phases', default=None)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        with _registry_lock:
+            _metrics[name] = self
+
+    def clear(self):
+        """Drop every labelled series, e.g. before a collector sets the current ones"""
+        with self.lock:
+            self.values.clear()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, '')) for label in self.labels)
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter(_Metric):
+    """A count that only goes up, e.g. emails sent"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def lines(self):
+        with self.lock:
+            values = dict(self.values)
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in values.items()]
+
+
+class Gauge(_Metric):
+    """A value that is set rather than accumulated, e.g. queue depth"""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def lines(self):
+        with self.lock:
+            values = dict(self.values)
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in values.items()]
+
+
+class Histogram(_Metric):
+    """Durations counted into cumulative buckets, with their sum and count"""
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then the sum
+                series = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def lines(self):
+        with self.lock:
+            values = {key: list(series) for key, series in self.values.items()}
+        lines = []
+        for key, series in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._format_labels(key, [('le', str(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {series[-1]}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+
+# Web requests
+HTTP_REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Time to handle a request, by route', ('route', 'method', 'status'))
+# Provider calls and sending
+PROVIDER_REQUEST_SECONDS = Histogram('provider_request_duration_seconds', 'Time for one provider send call', ('provider', 'outcome'))
+RATE_LIMIT_WAIT_SECONDS = Histogram('rate_limit_wait_seconds', 'Time spent waiting for a rate limiter token', ('provider',))
+SEND_RETRIES = Counter('send_retries_total', 'Provider calls retried, by reason', ('provider', 'reason'))
+EMAILS = Counter('emails_total', 'Recipients processed by send jobs, by outcome', ('outcome',))
+# Rendering and storage
+RENDER_SECONDS = Histogram('render_duration_seconds', 'Time to render one chunk of a campaign', ('kind',))
+STORAGE_SECONDS = Histogram('storage_operation_seconds', 'Time for JSON, journal and spool file operations', ('operation',))
+DB_QUERY_SECONDS = Histogram('db_query_duration_seconds', 'Time for one SQLAlchemy query')
+# Queue
+JOB_SECONDS = Histogram('job_duration_seconds', 'Time to run a queued job', ('kind', 'status'))
+QUEUE_JOBS = Gauge('send_queue_jobs', 'Jobs in the send queue, by kind and status', ('kind', 'status'))
+# Recipients for send jobs, bytes for CSV imports
+QUEUE_REMAINING = Gauge('send_queue_remaining', 'Work not yet processed by queued and running jobs', ('kind',))
+
+
+def record_phase(name, seconds):
+    """Add time to the current request's Server-Timing phase (no-op outside a request)"""
+    phases = _phases.get()
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + seconds
+
+
+@contextmanager
+def timer(histogram, phase=None, **labels):
+    """Observe the block's duration in a histogram and, if named, a Server-Timing phase"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        histogram.observe(elapsed, **labels)
+        if phase:
+            record_phase(phase, elapsed)
+
+
+def start_request():
+    """Begin collecting phase timings for the request in this context"""
+    _phases.set({})
+
+
+def request_phases():
+    """Return the phase timings collected for the current request"""
+    return _phases.get() or {}
+
+
+def server_timing(phases, total):
+    """Format phase durations (seconds) as a Server-Timing header value"""
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in phases.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ', '.join(entries)
+
+
+def add_collector(collector):
+    """Call collector() before each scrape, e.g. to refresh gauges from the database"""
+    _collectors.append(collector)
+
+
+def render():
+    """Return every metric in the Prometheus text exposition format"""
+    for collector in _collectors:
+        collector()
+    with _registry_lock:
+        metrics = list(_metrics.values())
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.lines())
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        data = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port):
+    """Serve /metrics from a background thread, for processes without the web app (worker.py)"""
+    server = ThreadingHTTPServer(('0.0.0.0', port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
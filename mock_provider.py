@@ -0,0 +1,127 @@
+"""Local stand-in for the Resend HTTP API, for load tests and offline development
+
+Run it with `python mock_provider.py [port] [latency_ms] [rate_limit_rate] [failure_rate]`
+and point the app at it with RESEND_API_URL=http://127.0.0.1:<port>. Every request sleeps
+for the configured latency, a fraction can be answered with 429s or 500s, and idempotency
+keys are honoured the way the real API does. The same behaviour backs the in-process
+"mock" transport in transports.py.
+"""
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Simulator:
+    """Provider behaviour shared by the HTTP mock and the in-process mock transport"""
+
+    def __init__(self, latency=0.05, rate_limit_rate=0.0, failure_rate=0.0, retry_after=1, seed=None, history=None):
+        self.latency = latency
+        self.rate_limit_rate = rate_limit_rate
+        self.failure_rate = failure_rate
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.requests = 0
+        # history caps the delivered list and remembered idempotency replies (None keeps everything),
+        # so a long-lived process running the mock transport doesn't grow without bound
+        self.history = history
+        self.delivered = deque(maxlen=history)
+        self.replies = OrderedDict()
+
+    def respond(self, path, body, idempotency_key=None):
+        """Return (status, payload, headers) for a send, replaying earlier replies for a repeated key"""
+        with self.lock:
+            self.requests += 1
+            if idempotency_key and idempotency_key in self.replies:
+                return 200, self.replies[idempotency_key], {}
+            roll = self.random.random()
+            if roll < self.rate_limit_rate:
+                return 429, {
+                    'statusCode': 429,
+                    'name': 'rate_limit_exceeded',
+                    'message': 'Too many requests. You can only make 2 requests per second.'
+                }, {'Retry-After': str(self.retry_after)}
+            if roll < self.rate_limit_rate + self.failure_rate:
+                return 500, {'statusCode': 500, 'name': 'application_error', 'message': 'Simulated provider failure'}, {}
+            if path == '/emails/batch':
+                reply = {'data': [{'id': uuid.uuid4().hex} for _ in body]}
+                self.delivered.extend(params['to'][0] for params in body)
+            else:
+                reply = {'id': uuid.uuid4().hex}
+                self.delivered.append(body['to'][0])
+            if idempotency_key:
+                self.replies[idempotency_key] = reply
+                if self.history is not None and len(self.replies) > self.history:
+                    self.replies.popitem(last=False)
+            return 200, reply, {}
+
+
+class MockProvider(ThreadingHTTPServer):
+    """Threaded HTTP server answering /emails and /emails/batch"""
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, port=0, latency=0.05, rate_limit_rate=0.0, failure_rate=0.0):
+        super().__init__(('127.0.0.1', port), MockHandler)
+        self.simulator = Simulator(latency, rate_limit_rate, failure_rate)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    @property
+    def delivered(self):
+        return self.simulator.delivered
+
+    def handle_error(self, request, client_address):
+        # Senders cancelling in-flight requests is expected during load tests
+        pass
+
+    def start(self):
+        """Serve from a background thread and return self"""
+        threading.Thread(target=self.serve_forever, name='mock-provider', daemon=True).start()
+        return self
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep connections alive between requests
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without this Nagle adds ~40 ms per reply
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'null')
+        simulator = self.server.simulator
+        time.sleep(simulator.latency)
+        if self.path not in ('/emails', '/emails/batch'):
+            self.reply(404, {'statusCode': 404, 'name': 'not_found', 'message': 'Not found'}, {})
+            return
+        self.reply(*simulator.respond(self.path, body, self.headers.get('Idempotency-Key')))
+
+    def reply(self, status, payload, headers):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8025
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.05
+    rate_limit_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+    failure_rate = float(sys.argv[4]) if len(sys.argv) > 4 else 0.0
+    server = MockProvider(port, latency, rate_limit_rate, failure_rate)
+    print(f"Mock provider listening on {server.url} with {latency * 1000:.0f} ms latency")
+    server.serve_forever()
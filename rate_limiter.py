@@ -0,0 +1,177 @@
+import os
+import asyncio
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+# Token bucket shared by every process that talks to the email provider
+RATE_LIMIT_DB = os.environ.get("RATE_LIMIT_DB", "data/ratelimit.db")
+RATE_PER_SECOND = float(os.environ.get("RATE_LIMIT_PER_SECOND", "2"))
+BURST = float(os.environ.get("RATE_LIMIT_BURST", str(RATE_PER_SECOND)))
+DEFAULT_BUCKET = 'resend'
+
+# Token acquisition runs once per send, so each thread keeps its connection open
+_local = threading.local()
+
+
+def _connect():
+    """Open a connection to the rate limiter database"""
+    conn = sqlite3.connect(RATE_LIMIT_DB, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    # Bucket state is cheap to lose, so don't pay for an fsync on every token
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def _thread_connection():
+    """Return this thread's long-lived connection to the rate limiter database"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.path != RATE_LIMIT_DB:
+        conn = _local.conn = _connect()
+        _local.path = RATE_LIMIT_DB
+    return conn
+
+
+def init_limiter():
+    """Create the bucket table if it doesn't exist"""
+    directory = os.path.dirname(RATE_LIMIT_DB)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = _connect()
+    try:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                blocked_until REAL NOT NULL DEFAULT 0
+            )
+        ''')
+    finally:
+        conn.close()
+
+
+def _load_bucket(conn, name, now):
+    """Read a bucket inside an open transaction and refill it up to now"""
+    row = conn.execute(
+        'SELECT tokens, updated_at, blocked_until FROM buckets WHERE name = ?', (name,)
+    ).fetchone()
+    if row is None:
+        conn.execute(
+            'INSERT INTO buckets (name, tokens, updated_at, blocked_until) VALUES (?, ?, ?, 0)',
+            (name, BURST, now)
+        )
+        return BURST, 0.0
+    tokens, updated_at, blocked_until = row
+    elapsed = max(0.0, now - max(updated_at, blocked_until))
+    return min(BURST, tokens + elapsed * RATE_PER_SECOND), blocked_until
+
+
+def _try_acquire(name, tokens):
+    """Take tokens if available; return 0 on success or the seconds to wait"""
+    conn = _thread_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        now = time.time()
+        available, blocked_until = _load_bucket(conn, name, now)
+        if now < blocked_until:
+            wait = blocked_until - now
+        elif available >= tokens:
+            available -= tokens
+            wait = 0.0
+        else:
+            wait = (tokens - available) / RATE_PER_SECOND
+        conn.execute(
+            'UPDATE buckets SET tokens = ?, updated_at = ? WHERE name = ?',
+            (available, max(now, blocked_until), name)
+        )
+        conn.execute('COMMIT')
+        return wait
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+
+
+def acquire(name=DEFAULT_BUCKET, tokens=1, timeout=None):
+    """Block until tokens are available in the shared bucket; return seconds waited"""
+    started = time.monotonic()
+    while True:
+        wait = _try_acquire(name, tokens)
+        if wait <= 0:
+            return time.monotonic() - started
+        if timeout is not None and time.monotonic() - started + wait > timeout:
+            raise TimeoutError(f"Timed out waiting for rate limit bucket '{name}'")
+        time.sleep(wait)
+
+
+async def acquire_async(name=DEFAULT_BUCKET, tokens=1, timeout=None):
+    """Like acquire, but waits without blocking the event loop"""
+    started = time.monotonic()
+    while True:
+        # The bucket update is a SQLite write; run it off the loop so in-flight sends keep going
+        wait = await asyncio.to_thread(_try_acquire, name, tokens)
+        if wait <= 0:
+            return time.monotonic() - started
+        if timeout is not None and time.monotonic() - started + wait > timeout:
+            raise TimeoutError(f"Timed out waiting for rate limit bucket '{name}'")
+        await asyncio.sleep(wait)
+
+
+def penalize(retry_after, name=DEFAULT_BUCKET):
+    """Block every sender for retry_after seconds, then allow one send when the window reopens"""
+    conn = _connect()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        now = time.time()
+        _, blocked_until = _load_bucket(conn, name, now)
+        conn.execute(
+            'UPDATE buckets SET tokens = ?, updated_at = ?, blocked_until = ? WHERE name = ?',
+            (min(1.0, BURST), now, max(blocked_until, now + retry_after), name)
+        )
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+
+def fill_level(name=DEFAULT_BUCKET):
+    """Return the current state of a bucket"""
+    conn = _connect()
+    try:
+        conn.execute('BEGIN')
+        now = time.time()
+        tokens, blocked_until = _load_bucket(conn, name, now)
+        conn.execute('ROLLBACK')
+    finally:
+        conn.close()
+    return {
+        'bucket': name,
+        'tokens': round(tokens, 3),
+        'capacity': BURST,
+        'rate_per_second': RATE_PER_SECOND,
+        'blocked_for': round(max(0.0, blocked_until - now), 3)
+    }
+
+
+def retry_after_from_error(error):
+    """Extract the Retry-After delay in seconds from a provider error, if present"""
+    headers = getattr(error, 'headers', None) or {}
+    value = None
+    for key, header_value in headers.items():
+        if key.lower() == 'retry-after':
+            value = header_value
+            break
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,460 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import metrics
+
+# Persistent job queue shared by every web worker and the standalone worker process
+QUEUE_DB = os.environ.get("SEND_QUEUE_DB", "data/queue.db")
+POLL_INTERVAL = float(os.environ.get("SEND_QUEUE_POLL_INTERVAL", "1.0"))
+# A running job whose worker hasn't checked in for this long is assumed dead and handed to another worker
+LEASE_SECONDS = float(os.environ.get("SEND_QUEUE_LEASE_SECONDS", "300"))
+
+# Per-recipient campaign states
+PENDING = 'pending'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+
+_handlers = {}
+_workers = []
+_stop_event = threading.Event()
+_context_factory = None
+_finish_listeners = []
+
+
+def _connect():
+    """Open a connection to the queue database"""
+    conn = sqlite3.connect(QUEUE_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def init_queue():
+    """Create queue tables if they don't exist"""
+    directory = os.path.dirname(QUEUE_DB)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = _connect()
+    try:
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                total INTEGER NOT NULL DEFAULT 0,
+                processed INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                heartbeat_at TEXT,
+                created_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+            CREATE TABLE IF NOT EXISTS job_results (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                result TEXT NOT NULL,
+                PRIMARY KEY (job_id, seq)
+            );
+            CREATE TABLE IF NOT EXISTS job_recipients (
+                job_id TEXT NOT NULL,
+                recipient TEXT NOT NULL,
+                state TEXT NOT NULL,
+                idempotency_key TEXT,
+                email_id TEXT,
+                category TEXT,
+                variant INTEGER,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (job_id, recipient)
+            );
+        ''')
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+        if 'heartbeat_at' not in columns:
+            # Queues created before jobs were leased
+            conn.execute('ALTER TABLE jobs ADD COLUMN heartbeat_at TEXT')
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(job_recipients)')}
+        if 'variant' not in columns:
+            # Checkpoints created before A/B assignments were recorded
+            conn.execute('ALTER TABLE job_recipients ADD COLUMN variant INTEGER')
+    finally:
+        conn.close()
+
+
+def register_handler(kind, handler):
+    """Register the function that processes jobs of the given kind"""
+    _handlers[kind] = handler
+
+
+def set_context_factory(factory):
+    """Set a callable returning a context manager (e.g. app.app_context) that wraps every job"""
+    global _context_factory
+    _context_factory = factory
+
+
+def on_finish(listener):
+    """Call listener(job) after every job this process runs, once it is marked done or failed"""
+    _finish_listeners.append(listener)
+
+
+def enqueue(kind, payload, total=0):
+    """Add a job to the queue and return its id"""
+    job_id = uuid.uuid4().hex
+    conn = _connect()
+    try:
+        conn.execute(
+            'INSERT INTO jobs (id, kind, status, payload, total, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (job_id, kind, 'queued', json.dumps(payload), total, datetime.now().isoformat())
+        )
+    finally:
+        conn.close()
+    logging.info(f"Queued {kind} job {job_id} ({total} items)")
+    return job_id
+
+
+def claim_next(worker_id):
+    """Atomically mark the oldest queued (or abandoned running) job as running and return it"""
+    now = datetime.now()
+    expired = (now - timedelta(seconds=LEASE_SECONDS)).isoformat()
+    conn = _connect()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE status = 'queued' "
+            "OR (status = 'running' AND COALESCE(heartbeat_at, started_at) < ?) "
+            "ORDER BY created_at LIMIT 1", (expired,)
+        ).fetchone()
+        if row is None:
+            conn.execute('COMMIT')
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', worker = ?, started_at = COALESCE(started_at, ?), heartbeat_at = ? "
+            "WHERE id = ?",
+            (worker_id, now.isoformat(), now.isoformat(), row['id'])
+        )
+        conn.execute('COMMIT')
+        if row['status'] == 'running':
+            logging.warning(f"Resuming job {row['id']} abandoned by worker {row['worker']}")
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        return job
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+
+def add_results(job_id, results, recipients=None):
+    """Record per-item results for a job and advance its progress counter
+
+    recipients is an optional list of (recipient, state, email_id, category) checkpoints
+    committed in the same transaction, so a resumed job never repeats or drops a result.
+    """
+    if not results:
+        return
+    now = datetime.now().isoformat()
+    conn = _connect()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        start = conn.execute(
+            'SELECT COALESCE(MAX(seq), 0) FROM job_results WHERE job_id = ?', (job_id,)
+        ).fetchone()[0]
+        conn.executemany(
+            'INSERT INTO job_results (job_id, seq, result) VALUES (?, ?, ?)',
+            [(job_id, start + i + 1, json.dumps(result)) for i, result in enumerate(results)]
+        )
+        if recipients:
+            conn.executemany(
+                'UPDATE job_recipients SET state = ?, email_id = ?, category = ?, updated_at = ? '
+                'WHERE job_id = ? AND recipient = ?',
+                [(state, email_id, category, now, job_id, recipient) for recipient, state, email_id, category in recipients]
+            )
+        conn.execute(
+            'UPDATE jobs SET processed = processed + ?, heartbeat_at = ? WHERE id = ?', (len(results), now, job_id)
+        )
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+
+def set_progress(job_id, processed, total=None):
+    """Record progress for jobs whose work isn't counted in per-item results"""
+    now = datetime.now().isoformat()
+    conn = _connect()
+    try:
+        if total is None:
+            conn.execute('UPDATE jobs SET processed = ?, heartbeat_at = ? WHERE id = ?', (processed, now, job_id))
+        else:
+            conn.execute(
+                'UPDATE jobs SET processed = ?, total = ?, heartbeat_at = ? WHERE id = ?', (processed, total, now, job_id)
+            )
+    finally:
+        conn.close()
+
+
+def touch(job_id):
+    """Refresh a running job's heartbeat, e.g. during long work that records no results"""
+    conn = _connect()
+    try:
+        conn.execute('UPDATE jobs SET heartbeat_at = ? WHERE id = ?', (datetime.now().isoformat(), job_id))
+    finally:
+        conn.close()
+
+
+def load_recipients(job_id, recipients):
+    """Register recipients as pending (if new) and return {recipient: checkpoint row} for them"""
+    if not recipients:
+        return {}
+    now = datetime.now().isoformat()
+    conn = _connect()
+    try:
+        conn.executemany(
+            'INSERT OR IGNORE INTO job_recipients (job_id, recipient, state, updated_at) VALUES (?, ?, ?, ?)',
+            [(job_id, recipient, PENDING, now) for recipient in recipients]
+        )
+        rows = []
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(recipients), 500):
+            part = recipients[start:start + 500]
+            rows.extend(conn.execute(
+                f"SELECT * FROM job_recipients WHERE job_id = ? AND recipient IN ({','.join('?' * len(part))})",
+                [job_id, *part]
+            ).fetchall())
+    finally:
+        conn.close()
+    return {row['recipient']: dict(row) for row in rows}
+
+
+def mark_sending(job_id, keys, variants=None):
+    """Checkpoint recipients as handed to the provider
+
+    keys maps each recipient to its idempotency key and variants to the template id it was
+    rendered with, so a resumed A/B send re-renders the same variant.
+    """
+    variants = variants or {}
+    now = datetime.now().isoformat()
+    conn = _connect()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.executemany(
+            'UPDATE job_recipients SET state = ?, idempotency_key = ?, variant = ?, attempts = attempts + 1, '
+            'updated_at = ? WHERE job_id = ? AND recipient = ?',
+            [(SENDING, idempotency_key, variants.get(recipient), now, job_id, recipient)
+             for recipient, idempotency_key in keys.items()]
+        )
+        conn.execute('UPDATE jobs SET heartbeat_at = ? WHERE id = ?', (now, job_id))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+
+def recipient_summary(job_id):
+    """Return recipient counts by state, failure counts by category and state counts per A/B variant for a job"""
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            'SELECT state, category, variant, COUNT(*) AS count FROM job_recipients WHERE job_id = ? '
+            'GROUP BY state, category, variant',
+            (job_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+    summary = {'states': {}, 'error_categories': {}, 'variants': {}}
+    for row in rows:
+        summary['states'][row['state']] = summary['states'].get(row['state'], 0) + row['count']
+        if row['state'] == FAILED:
+            category = row['category'] or 'Unknown'
+            summary['error_categories'][category] = summary['error_categories'].get(category, 0) + row['count']
+        if row['variant'] is not None:
+            states = summary['variants'].setdefault(row['variant'], {})
+            states[row['state']] = states.get(row['state'], 0) + row['count']
+    return summary
+
+
+def variant_outcomes(job_ids):
+    """Return {variant: {state: count}} over the A/B recipients of several jobs"""
+    outcomes = {}
+    conn = _connect()
+    try:
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(job_ids), 500):
+            part = job_ids[start:start + 500]
+            rows = conn.execute(
+                f"SELECT variant, state, COUNT(*) AS count FROM job_recipients "
+                f"WHERE job_id IN ({','.join('?' * len(part))}) AND variant IS NOT NULL GROUP BY variant, state",
+                part
+            ).fetchall()
+            for row in rows:
+                states = outcomes.setdefault(row['variant'], {})
+                states[row['state']] = states.get(row['state'], 0) + row['count']
+    finally:
+        conn.close()
+    return outcomes
+
+
+def finish_job(job_id, result):
+    """Mark a job as done with its summary result"""
+    conn = _connect()
+    try:
+        conn.execute(
+            "UPDATE jobs SET status = 'done', result = ?, finished_at = ? WHERE id = ?",
+            (json.dumps(result), datetime.now().isoformat(), job_id)
+        )
+    finally:
+        conn.close()
+
+
+def fail_job(job_id, error):
+    """Mark a job as failed"""
+    conn = _connect()
+    try:
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+            (error, datetime.now().isoformat(), job_id)
+        )
+    finally:
+        conn.close()
+
+
+def get_job(job_id):
+    """Return job metadata, or None if the id is unknown"""
+    conn = _connect()
+    try:
+        row = conn.execute(
+            'SELECT id, kind, status, result, error, total, processed, created_at, started_at, finished_at '
+            'FROM jobs WHERE id = ?', (job_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    job = dict(row)
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+
+def job_counts():
+    """Return {(kind, status): (jobs, progress units not yet processed)} across the queue"""
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            'SELECT kind, status, COUNT(*) AS jobs, SUM(MAX(total - processed, 0)) AS remaining '
+            'FROM jobs GROUP BY kind, status'
+        ).fetchall()
+    finally:
+        conn.close()
+    return {(row['kind'], row['status']): (row['jobs'], row['remaining'] or 0) for row in rows}
+
+
+def get_results(job_id, after=0, limit=500):
+    """Return (seq, result) pairs recorded for a job after the given sequence number"""
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            'SELECT seq, result FROM job_results WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?',
+            (job_id, after, limit)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [(row['seq'], json.loads(row['result'])) for row in rows]
+
+
+def run_job(job):
+    """Run a claimed job through its registered handler"""
+    handler = _handlers.get(job['kind'])
+    if handler is None:
+        fail_job(job['id'], f"No handler registered for job kind '{job['kind']}'")
+        return
+    started = time.perf_counter()
+    try:
+        if _context_factory is not None:
+            with _context_factory():
+                result = handler(job['id'], job['payload'])
+        else:
+            result = handler(job['id'], job['payload'])
+        finish_job(job['id'], result)
+        logging.info(f"Finished {job['kind']} job {job['id']}")
+        metrics.JOB_SECONDS.observe(time.perf_counter() - started, kind=job['kind'], status='done')
+    except Exception as e:
+        logging.error(f"Job {job['id']} failed: {str(e)}")
+        fail_job(job['id'], str(e)[:500])
+        metrics.JOB_SECONDS.observe(time.perf_counter() - started, kind=job['kind'], status='failed')
+    for listener in _finish_listeners:
+        try:
+            listener(job)
+        except Exception as e:
+            logging.error(f"Job finish listener failed for {job['id']}: {str(e)}")
+
+
+def run_pending(worker_id='inline'):
+    """Process queued jobs in the current thread until the queue is empty"""
+    processed = 0
+    while True:
+        job = claim_next(worker_id)
+        if job is None:
+            return processed
+        run_job(job)
+        processed += 1
+
+
+def _worker_loop(worker_id):
+    """Poll the queue and run jobs until stopped"""
+    while not _stop_event.is_set():
+        try:
+            job = claim_next(worker_id)
+        except Exception as e:
+            logging.error(f"Worker {worker_id} could not claim a job: {str(e)}")
+            job = None
+        if job is None:
+            _stop_event.wait(POLL_INTERVAL)
+            continue
+        run_job(job)
+
+
+def start_workers(count):
+    """Start background worker threads that drain the queue"""
+    if _workers:
+        return
+    _stop_event.clear()
+    for n in range(count):
+        worker_id = f"{os.getpid()}-{n}"
+        thread = threading.Thread(target=_worker_loop, args=(worker_id,), name=f"send-worker-{n}", daemon=True)
+        thread.start()
+        _workers.append(thread)
+    logging.info(f"Started {count} send queue worker thread(s)")
+
+
+def stop_workers(timeout=5):
+    """Signal worker threads to stop and wait for them"""
+    _stop_event.set()
+    for thread in _workers:
+        thread.join(timeout)
+    _workers.clear()
+
+
+def run_forever(worker_id=None):
+    """Run a blocking worker loop (used by the standalone worker process)"""
+    worker_id = worker_id or f"{os.getpid()}-main"
+    logging.info(f"Send queue worker {worker_id} started")
+    try:
+        _worker_loop(worker_id)
+    except KeyboardInterrupt:
+        logging.info(f"Send queue worker {worker_id} stopped")
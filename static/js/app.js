@@ -26,8 +26,339 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         });
     }
+
+    // Follow a CSV import started from the upload form
+    const importProgress = document.getElementById('importProgress');
+    if (importProgress) {
+        trackImport(importProgress.dataset.jobId);
+    }
+
+    // Load the first page of schools and logs; later pages load on demand
+    if (document.getElementById('schoolsTableBody')) {
+        let searchTimer = null;
+        const reload = () => {
+            // Editing the filter by hand detaches it from any saved segment
+            activeSegment = null;
+            document.getElementById('segmentSelect').value = '';
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => loadSchools(true), 300);
+        };
+        document.getElementById('segmentSelect').addEventListener('change', applySegment);
+        loadSegments();
+        document.getElementById('schoolSearch').addEventListener('input', reload);
+        document.getElementById('schoolCityFilter').addEventListener('input', reload);
+        document.getElementById('schoolSort').addEventListener('change', () => loadSchools(true));
+        loadSchools(true);
+    }
+    if (document.getElementById('logsTableBody')) {
+        loadLogs();
+    }
+    if (document.getElementById('campaignsTableBody')) {
+        const timezoneInput = document.getElementById('campaignTimezone');
+        if (timezoneInput) {
+            timezoneInput.value = Intl.DateTimeFormat().resolvedOptions().timeZone || '';
+        }
+        loadCampaigns();
+    }
 });
 
+// Cursors for the next page of each lazily loaded table
+let schoolsCursor = null;
+let logsCursor = null;
+let schoolsRequest = 0;
+
+// Number of schools matching the current filter, and the saved segment it came from
+let matchingTotal = 0;
+let activeSegment = null;
+let segments = [];
+
+// Current school filter as understood by /api/schools and the send endpoints
+function currentFilter() {
+    const filter = {};
+    const search = document.getElementById('schoolSearch').value.trim();
+    const city = document.getElementById('schoolCityFilter').value.trim();
+    if (search) filter.q = search;
+    if (city) filter.city = city;
+    return filter;
+}
+
+// Describe who a send goes to: a saved segment, the current filter, or the ticked rows
+function getRecipients() {
+    const targetMatching = document.getElementById('targetMatching');
+    if (targetMatching && targetMatching.checked) {
+        if (activeSegment) {
+            return {selection: {segment_id: activeSegment.id}, count: matchingTotal};
+        }
+        return {selection: {filter: currentFilter()}, count: matchingTotal};
+    }
+    const selectedSchools = getSelectedSchools();
+    return {selection: {selected_schools: selectedSchools}, count: selectedSchools.length};
+}
+
+// Fill the saved segment dropdown
+async function loadSegments() {
+    const response = await fetch('/api/segments');
+    if (!response.ok) {
+        return;
+    }
+    segments = (await response.json()).segments;
+    const select = document.getElementById('segmentSelect');
+    select.length = 1;
+    segments.forEach(segment => select.add(new Option(segment.name, segment.id)));
+    if (activeSegment) {
+        select.value = activeSegment.id;
+    }
+}
+
+// Apply a saved segment's filter to the school table
+function applySegment() {
+    const segmentId = parseInt(document.getElementById('segmentSelect').value);
+    activeSegment = segments.find(segment => segment.id === segmentId) || null;
+    const filters = activeSegment ? activeSegment.filters : {};
+    document.getElementById('schoolSearch').value = filters.q || '';
+    document.getElementById('schoolCityFilter').value = filters.city || '';
+    loadSchools(true);
+}
+
+// Save the current filter as a named segment
+async function saveSegment() {
+    const name = prompt('Name for this segment:');
+    if (!name) {
+        return;
+    }
+    const response = await fetch('/api/segments', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({name: name, filters: currentFilter()})
+    });
+    const data = await response.json();
+    if (!response.ok) {
+        showErrorModal(data.error || 'Could not save segment');
+        return;
+    }
+    activeSegment = data;
+    await loadSegments();
+}
+
+// Schedule the current campaign form for unattended, paced sending
+async function scheduleCampaign() {
+    const templateSelect = document.getElementById('templateSelect');
+    const abTesting = document.getElementById('abTesting').checked;
+    const recipients = getRecipients();
+    if (recipients.count === 0) {
+        alert('Please select at least one school');
+        return;
+    }
+    if (!abTesting && !templateSelect.value) {
+        alert('Please select a template or enable A/B testing');
+        return;
+    }
+    const name = document.getElementById('campaignName').value.trim();
+    if (!name) {
+        alert('Please name the campaign');
+        return;
+    }
+
+    const start = document.getElementById('campaignStart').value;
+    const quietStart = document.getElementById('quietStart').value;
+    const quietEnd = document.getElementById('quietEnd').value;
+    const response = await fetch('/api/campaigns', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({
+            name: name,
+            template_id: parseInt(templateSelect.value),
+            ...recipients.selection,
+            ab_testing: abTesting,
+            batch_mode: document.getElementById('batchMode').checked,
+            custom_content: document.getElementById('customContent').value || null,
+            custom_subject: document.getElementById('customSubject').value || null,
+            custom_html_content: document.getElementById('customHtmlContent').value || null,
+            start_at: start ? new Date(start).toISOString() : null,
+            per_hour: document.getElementById('campaignPerHour').value || null,
+            per_day: document.getElementById('campaignPerDay').value || null,
+            quiet_hours: quietStart && quietEnd ? {start: quietStart, end: quietEnd} : null,
+            timezone: document.getElementById('campaignTimezone').value.trim() || null
+        })
+    });
+    const data = await response.json();
+    if (!response.ok) {
+        showErrorModal(data.error || 'Could not schedule campaign');
+        return;
+    }
+    loadCampaigns();
+}
+
+// Show scheduled campaigns with their progress and controls
+async function loadCampaigns() {
+    const response = await fetch('/api/campaigns');
+    if (!response.ok) {
+        return;
+    }
+    const campaigns = (await response.json()).campaigns;
+    document.getElementById('campaignsSection').classList.toggle('d-none', campaigns.length === 0);
+    const tbody = document.getElementById('campaignsTableBody');
+    tbody.innerHTML = '';
+    campaigns.forEach(campaign => {
+        const limits = [
+            campaign.per_hour ? `${campaign.per_hour}/hour` : null,
+            campaign.per_day ? `${campaign.per_day}/day` : null,
+            campaign.quiet_hours ? `quiet ${campaign.quiet_hours.start}-${campaign.quiet_hours.end}` : null
+        ].filter(Boolean).join(', ') || 'none';
+        const actions = document.createElement('div');
+        const buttons = {
+            pause: ['scheduled', 'running'],
+            resume: ['paused'],
+            cancel: ['scheduled', 'running', 'paused']
+        };
+        Object.entries(buttons).forEach(([action, states]) => {
+            if (states.includes(campaign.status)) {
+                const button = document.createElement('button');
+                button.type = 'button';
+                button.className = 'btn btn-sm btn-outline-secondary me-1';
+                button.textContent = action.charAt(0).toUpperCase() + action.slice(1);
+                button.onclick = () => campaignAction(campaign.id, action);
+                actions.appendChild(button);
+            }
+        });
+        tbody.appendChild(buildRow([
+            campaign.name,
+            campaign.status,
+            new Date(campaign.start_at).toLocaleString(),
+            limits,
+            campaign.recipients ? `${campaign.dispatched}/${campaign.recipients} queued` : '-',
+            actions
+        ]));
+    });
+}
+
+async function campaignAction(campaignId, action) {
+    const response = await fetch(`/api/campaigns/${campaignId}/${action}`, {method: 'POST'});
+    if (!response.ok) {
+        const data = await response.json();
+        showErrorModal(data.error || `Could not ${action} campaign`);
+    }
+    loadCampaigns();
+}
+
+// Build a table row from cell values, escaping them as text
+function buildRow(cells) {
+    const row = document.createElement('tr');
+    cells.forEach(cell => {
+        const td = document.createElement('td');
+        if (cell instanceof Node) {
+            td.appendChild(cell);
+        } else {
+            td.textContent = cell;
+        }
+        row.appendChild(td);
+    });
+    return row;
+}
+
+// Fetch a page of schools; reset starts again from the first page with the current filters
+async function loadSchools(reset = false) {
+    const tbody = document.getElementById('schoolsTableBody');
+    const loadMore = document.getElementById('loadMoreSchools');
+    const params = new URLSearchParams({
+        limit: 100,
+        sort: document.getElementById('schoolSort').value,
+        ...(activeSegment ? activeSegment.filters : currentFilter())
+    });
+    if (!reset && schoolsCursor) params.set('cursor', schoolsCursor);
+    
+    // Ignore responses from requests superseded by newer filter changes
+    const requestId = ++schoolsRequest;
+    const response = await fetch(`/api/schools?${params}`);
+    const data = await response.json();
+    if (requestId !== schoolsRequest) {
+        return;
+    }
+    if (!response.ok) {
+        showErrorModal(data.error || 'Could not load schools');
+        return;
+    }
+    
+    if (reset) {
+        tbody.innerHTML = '';
+        matchingTotal = data.total;
+        document.getElementById('matchingCount').textContent = matchingTotal;
+    }
+    data.schools.forEach(school => {
+        const checkbox = document.createElement('input');
+        checkbox.type = 'checkbox';
+        checkbox.className = 'school-checkbox';
+        checkbox.value = school.id;
+        tbody.appendChild(buildRow([
+            checkbox,
+            school['School Name'] || '',
+            school['Contact Person'] || '',
+            school['Email'] || '',
+            school['City'] || ''
+        ]));
+    });
+    
+    schoolsCursor = data.next_cursor;
+    loadMore.classList.toggle('d-none', !schoolsCursor);
+    updateSelectAllCheckbox();
+}
+
+// Fetch the next page of logs, newest first
+async function loadLogs() {
+    const tbody = document.getElementById('logsTableBody');
+    const loadMore = document.getElementById('loadMoreLogs');
+    const params = new URLSearchParams({limit: 20});
+    if (logsCursor) params.set('cursor', logsCursor);
+    
+    const response = await fetch(`/api/logs?${params}`);
+    const data = await response.json();
+    if (!response.ok) {
+        showErrorModal(data.error || 'Could not load logs');
+        return;
+    }
+    
+    data.logs.forEach(log => {
+        const badge = document.createElement('span');
+        if (log.status === 'Sent' || log.status.includes('Sent (Retry)')) {
+            badge.className = 'badge bg-success';
+        } else if (log.status.includes('Error')) {
+            badge.className = 'badge bg-danger';
+        } else {
+            badge.className = 'badge bg-info';
+        }
+        badge.textContent = log.status;
+        tbody.appendChild(buildRow([log.school_name, log.email, log.template_used, badge, log.timestamp]));
+    });
+    
+    logsCursor = data.next_cursor;
+    loadMore.classList.toggle('d-none', !logsCursor);
+}
+
+// Poll an import job, update its progress bar and reload the page when it finishes
+async function trackImport(jobId) {
+    const bar = document.getElementById('importProgressBar');
+    const text = document.getElementById('importProgressText');
+    
+    while (true) {
+        const response = await fetch(`/jobs/${jobId}`);
+        if (!response.ok) {
+            return;
+        }
+        
+        const job = await response.json();
+        const percentage = job.total ? Math.min(100, Math.round(job.processed / job.total * 100)) : 0;
+        bar.style.width = `${percentage}%`;
+        text.textContent = `${percentage}%`;
+        
+        if (job.status === 'done' || job.status === 'failed') {
+            window.location.reload();
+            return;
+        }
+        
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
 // Toggle select all functionality
 function toggleSelectAll() {
     const selectAllCheckbox = document.getElementById('selectAllCheckbox');
@@ -66,7 +397,7 @@ function clearSelection() {
     }
 }
 
-// Get selected school indices
+// Get selected school ids
 function getSelectedSchools() {
     const selectedSchools = [];
     const schoolCheckboxes = document.querySelectorAll('.school-checkbox:checked');
@@ -98,7 +429,7 @@ async function previewEmail() {
     }
     
     // Use first selected school for preview
-    const schoolIndex = selectedSchools[0];
+    const schoolId = selectedSchools[0];
     
     try {
         const response = await fetch('/preview', {
@@ -108,7 +439,7 @@ async function previewEmail() {
             },
             body: JSON.stringify({
                 template_id: parseInt(templateSelect.value),
-                school_index: schoolIndex,
+                school_id: schoolId,
                 custom_content: customContent || null,
                 custom_subject: customSubject || null,
                 custom_html_content: customHtmlContent || null
@@ -204,20 +535,20 @@ async function sendCustomEmail() {
         return;
     }
     
-    const selectedSchools = getSelectedSchools();
-    if (selectedSchools.length === 0) {
+    const recipients = getRecipients();
+    if (recipients.count === 0) {
         alert('Please select at least one school');
         return;
     }
     
     // Confirm sending
-    const confirmMessage = `Send custom email to ${selectedSchools.length} school(s)?`;
+    const confirmMessage = `Send custom email to ${recipients.count} school(s)?`;
     if (!confirm(confirmMessage)) {
         return;
     }
     
     // Show loading modal
-    showLoadingModal('Preparing custom email...', selectedSchools.length);
+    showLoadingModal('Preparing custom email...', recipients.count);
     
     try {
         const response = await fetch('/send_custom_email', {
@@ -229,24 +560,20 @@ async function sendCustomEmail() {
                 subject: customSubject,
                 content: customContent,
                 html_content: customHtmlContent,
-                selected_schools: selectedSchools
+                ...recipients.selection
             })
         });
         
         const data = await response.json();
         
         if (response.ok) {
-            // Show results with animated success
             let successCount = 0;
             let errorCount = 0;
             
-            // Simulate real-time progress for custom emails too
-            for (let i = 0; i < data.results.length; i++) {
-                const result = data.results[i];
-                
-                // Add small delay to show each email being processed
-                await new Promise(resolve => setTimeout(resolve, 200));
-                
+            updateLoadingProgress('Sending custom emails...', 0);
+            
+            // Follow the background job and show each email as it is processed
+            const job = await followJob(data.job_id, result => {
                 if (result.status === 'success') {
                     successCount++;
                     addEmailToProgress(result.school, 'Custom email sent successfully', 'Sent', false);
@@ -254,6 +581,12 @@ async function sendCustomEmail() {
                     errorCount++;
                     addEmailToProgress(result.school, result.error || 'Unknown error', 'Failed', true);
                 }
+            });
+            
+            if (job.status === 'failed') {
+                hideLoadingModal();
+                showErrorModal('Error: ' + job.error);
+                return;
             }
             
             updateLoadingProgress('Custom emails sent successfully!', 100);
@@ -279,6 +612,78 @@ async function sendCustomEmail() {
     }
 }
 
+// Follow a background send job over Server-Sent Events, passing each result to onResult
+// and each progress update (processed, total, rate, eta_seconds) to onProgress
+function followJob(jobId, onResult, onProgress = updateJobProgress) {
+    if (!window.EventSource) {
+        return pollJob(jobId, onResult);
+    }
+    
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(`/jobs/${jobId}/events`);
+        
+        source.addEventListener('results', event => {
+            JSON.parse(event.data).forEach(onResult);
+        });
+        source.addEventListener('progress', event => {
+            onProgress(JSON.parse(event.data));
+        });
+        source.addEventListener('done', event => {
+            source.close();
+            resolve(JSON.parse(event.data));
+        });
+        source.onerror = () => {
+            // EventSource reconnects on its own; give up only if the stream was closed for good
+            if (source.readyState === EventSource.CLOSED) {
+                reject(new Error('Lost connection to the progress stream'));
+            }
+        };
+    });
+}
+
+// Show real progress, throughput and ETA from a job progress event
+function updateJobProgress(progress) {
+    if (window.emailProgress) {
+        window.emailProgress.completed = progress.processed;
+        window.emailProgress.total = progress.total;
+    }
+    const percentage = progress.total ? (progress.processed / progress.total) * 100 : 0;
+    updateLoadingProgress(progress.status === 'queued' ? 'Waiting for a worker...' : 'Sending emails...', percentage);
+    
+    const progressRate = document.getElementById('progressRate');
+    if (progressRate) {
+        let text = `${progress.rate.toFixed(1)} emails/s`;
+        if (progress.eta_seconds !== null) {
+            const minutes = Math.floor(progress.eta_seconds / 60);
+            const seconds = progress.eta_seconds % 60;
+            text += ` · ETA ${minutes}m ${seconds}s`;
+        }
+        progressRate.textContent = text;
+    }
+}
+
+// Poll a background send job until it finishes, passing each new result to onResult
+async function pollJob(jobId, onResult) {
+    let after = 0;
+    
+    while (true) {
+        const response = await fetch(`/jobs/${jobId}?after=${after}`);
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        
+        const job = await response.json();
+        job.results.forEach(onResult);
+        after = job.next;
+        
+        if (job.status === 'done' || job.status === 'failed') {
+            return job;
+        }
+        
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
 // Send emails
 async function sendEmails() {
     const templateSelect = document.getElementById('templateSelect');
@@ -287,8 +692,8 @@ async function sendEmails() {
     const customSubject = document.getElementById('customSubject').value;
     const sendButton = document.getElementById('sendButton');
     
-    const selectedSchools = getSelectedSchools();
-    if (selectedSchools.length === 0) {
+    const recipients = getRecipients();
+    if (recipients.count === 0) {
         alert('Please select at least one school');
         return;
     }
@@ -299,22 +704,18 @@ async function sendEmails() {
     }
     
     // Confirm sending
-    const confirmMessage = `Are you sure you want to send emails to ${selectedSchools.length} school(s)?`;
+    const confirmMessage = `Are you sure you want to send emails to ${recipients.count} school(s)?`;
     if (!confirm(confirmMessage)) {
         return;
     }
     
     // Show loading modal
-    showLoadingModal('Preparing to send emails...', selectedSchools.length);
+    showLoadingModal('Preparing to send emails...', recipients.count);
     
     // Disable send button and show loading
     sendButton.disabled = true;
     sendButton.innerHTML = '<i class="bi bi-hourglass-split"></i> Sending...';
     
-    // Create an AbortController for request timeout
-    const controller = new AbortController();
-    const timeoutId = setTimeout(() => controller.abort(), 120000); // 2 minute timeout
-    
     try {
         const response = await fetch('/send', {
             method: 'POST',
@@ -323,49 +724,47 @@ async function sendEmails() {
             },
             body: JSON.stringify({
                 template_id: parseInt(templateSelect.value),
-                selected_schools: selectedSchools,
+                ...recipients.selection,
                 ab_testing: abTesting,
+                batch_mode: document.getElementById('batchMode').checked,
                 custom_content: customContent || null,
                 custom_subject: customSubject || null,
                 custom_html_content: document.getElementById('customHtmlContent').value || null
-            }),
-            signal: controller.signal
+            })
         });
         
-        clearTimeout(timeoutId);
-        updateLoadingProgress('Processing response...', 90);
+        const data = await response.json();
         
         if (!response.ok) {
             hideLoadingModal();
-            throw new Error(`HTTP error! status: ${response.status}`);
+            throw new Error(data.error || `HTTP error! status: ${response.status}`);
         }
         
-        const data = await response.json();
-        
-        // Show results with animated success
         let successCount = 0;
         let errorCount = 0;
         
-        // Simulate real-time progress by adding each result to the progress display
-        if (data.results && Array.isArray(data.results)) {
-            for (let i = 0; i < data.results.length; i++) {
-                const result = data.results[i];
-                
-                // Add small delay to show each email being processed
-                await new Promise(resolve => setTimeout(resolve, 200));
-                
-                if (result.status === 'success') {
-                    successCount++;
-                    addEmailToProgress(result.school, 'Email sent successfully', 'Sent', false);
-                } else {
-                    errorCount++;
-                    addEmailToProgress(result.school, result.error || 'Unknown error', 'Failed', true);
-                }
+        updateLoadingProgress('Sending emails...', 0);
+        
+        // Follow the background job and show each email as it is processed
+        const job = await followJob(data.job_id, result => {
+            if (result.status === 'success') {
+                successCount++;
+                addEmailToProgress(result.school, 'Email sent successfully', 'Sent', false);
+            } else {
+                errorCount++;
+                addEmailToProgress(result.school, result.error || 'Unknown error', 'Failed', true);
             }
+        });
+        
+        if (job.status === 'failed') {
+            hideLoadingModal();
+            throw new Error(job.error || 'Send job failed');
         }
         
         updateLoadingProgress('Emails sent successfully!', 100);
         
+        const removedSchools = job.result && job.result.summary ? job.result.summary.removed_schools : 0;
+        
         // Hide loading modal and show results
         setTimeout(() => {
             hideLoadingModal();
@@ -375,8 +774,8 @@ async function sendEmails() {
             if (errorCount > 0) {
                 message += `❌ Errors: ${errorCount}\n`;
             }
-            if (data.removed_schools > 0) {
-                message += `🗑️ Removed ${data.removed_schools} school(s) from list`;
+            if (removedSchools > 0) {
+                message += `🗑️ Removed ${removedSchools} school(s) from list`;
             }
             
             showResultsModal(message, successCount, errorCount);
@@ -388,14 +787,11 @@ async function sendEmails() {
         }, 1000);
         
     } catch (error) {
-        clearTimeout(timeoutId);
         hideLoadingModal();
         console.error('Error sending emails:', error);
         
         let errorMessage = 'Error sending emails: ';
-        if (error.name === 'AbortError') {
-            errorMessage += 'Request timed out. The operation may still be running in the background.';
-        } else if (error.message) {
+        if (error.message) {
             errorMessage += error.message;
         } else {
             errorMessage += 'Unknown error occurred';
@@ -464,6 +860,7 @@ function showLoadingModal(message, totalEmails) {
                                     <small class="text-muted" id="progressText">Starting...</small>
                                     <small class="text-muted" id="progressCount">0 / ${totalEmails}</small>
                                 </div>
+                                <small class="text-muted" id="progressRate"></small>
                             </div>
                         </div>
                         
@@ -550,8 +947,11 @@ function addEmailToProgress(schoolName, email, status, isError = false) {
         </div>
     `;
     
-    // Add to top of list for most recent first
+    // Add to top of list for most recent first, keeping only the latest entries on screen
     progressList.insertBefore(emailItem, progressList.firstChild);
+    while (progressList.children.length > 200) {
+        progressList.removeChild(progressList.lastChild);
+    }
     
     // Update global progress
     if (window.emailProgress) {
@@ -564,22 +964,6 @@ function addEmailToProgress(schoolName, email, status, isError = false) {
     }
 }
 
-function animateProgress() {
-    let progress = 10;
-    const interval = setInterval(() => {
-        progress += Math.random() * 15;
-        if (progress > 85) {
-            clearInterval(interval);
-            return;
-        }
-        
-        const progressBar = document.getElementById('loadingProgress');
-        const progressText = document.getElementById('progressText');
-        if (progressBar) progressBar.style.width = progress + '%';
-        if (progressText) progressText.textContent = `${Math.round(progress)}% complete`;
-    }, 1000);
-}
-
 function hideLoadingModal() {
     const modal = bootstrap.Modal.getInstance(document.getElementById('loadingModal'));
     if (modal) {
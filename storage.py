@@ -0,0 +1,1064 @@
+import os
+import json
+import base64
+import hashlib
+import logging
+import sqlite3
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import click
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, func, inspect, text, or_, and_
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+import metrics
+from template_engine import normalize_field
+
+# Database-backed storage for schools and email logs (templates and settings stay in JSON)
+db = SQLAlchemy()
+
+# CSV columns that map onto dedicated school columns; anything else is kept in `extra`
+SCHOOL_FIELDS = {
+    'School Name': 'name',
+    'Email': 'email',
+    'Contact Person': 'contact_person',
+    'City': 'city',
+}
+
+LOG_FIELDS = ['school_name', 'email', 'template_used', 'template_id', 'status',
+              'email_id', 'subject', 'error_category', 'dedupe_key']
+
+# Bump when the counters kept in log_stats change so they are rebuilt on startup
+LOG_STATS_VERSION = '2'
+HOUR_FORMAT = '%Y-%m-%dT%H'
+
+
+class School(db.Model):
+    __tablename__ = 'schools'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), nullable=False, index=True)
+    email = db.Column(db.String(320), nullable=False, index=True)
+    contact_person = db.Column(db.String(255))
+    city = db.Column(db.String(255), index=True)
+    extra = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    # Normalized keys used to merge uploads; one row per email address
+    email_key = db.Column(db.String(320), unique=True, index=True)
+    name_key = db.Column(db.String(255), index=True)
+    # Set once a campaign reaches the school; contacted schools stay hidden from the list
+    contacted_at = db.Column(db.DateTime, index=True)
+    # Import job that last inserted or updated the row, for targeting an uploaded batch
+    upload_id = db.Column(db.String(32), index=True)
+
+    @classmethod
+    def from_dict(cls, record):
+        """Build a School from a CSV/JSON record keyed by column name"""
+        return cls(**cls.row_from_dict(record))
+
+    @staticmethod
+    def row_from_dict(record):
+        """Map a CSV/JSON record to column values for a bulk insert"""
+        values = {column: record.get(field) or None for field, column in SCHOOL_FIELDS.items()}
+        extra = {key: value for key, value in record.items() if key not in SCHOOL_FIELDS and key != 'id'}
+        values['extra'] = json.dumps(extra) if extra else None
+        values['email_key'] = email_key(values['email'] or '')
+        values['name_key'] = name_key(values['name'] or '')
+        return values
+
+    def to_dict(self):
+        """Return the school in the CSV-column shape used by templates and placeholders"""
+        record = {'id': self.id}
+        for field, column in SCHOOL_FIELDS.items():
+            value = getattr(self, column)
+            if value:
+                record[field] = value
+        if self.extra:
+            record.update(json.loads(self.extra))
+        return record
+
+
+def email_key(email):
+    """Normalize an email address for duplicate detection"""
+    return email.strip().lower()
+
+
+def name_key(name):
+    """Normalize a school name for lookups (case and spacing insensitive)"""
+    return ' '.join(name.lower().split())
+
+
+class EmailLog(db.Model):
+    __tablename__ = 'email_logs'
+    __table_args__ = (
+        db.Index('ix_email_logs_outcome_timestamp', 'outcome', 'timestamp'),
+        db.Index('ix_email_logs_template_outcome', 'template_used', 'outcome'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    timestamp = db.Column(db.DateTime, nullable=False, index=True)
+    school_name = db.Column(db.String(255))
+    email = db.Column(db.String(320), index=True)
+    template_used = db.Column(db.String(255))
+    template_id = db.Column(db.Integer, index=True)
+    status = db.Column(db.Text, nullable=False, index=True)
+    outcome = db.Column(db.String(10), nullable=False)
+    error_category = db.Column(db.String(100), index=True)
+    email_id = db.Column(db.String(100))
+    subject = db.Column(db.Text)
+    # '<job id>:<recipient>' for send job outcomes, so a log journaled twice is stored once
+    dedupe_key = db.Column(db.String(400), index=True, unique=True)
+
+    @classmethod
+    def from_dict(cls, entry):
+        """Build an EmailLog from a log entry dict"""
+        values = {field: entry.get(field) for field in LOG_FIELDS}
+        values['status'] = values['status'] or ''
+        try:
+            timestamp = datetime.fromisoformat(entry.get('timestamp', ''))
+        except (TypeError, ValueError):
+            timestamp = datetime.now()
+        return cls(timestamp=timestamp, outcome=log_outcome(values['status']), **values)
+
+    def to_dict(self):
+        """Return the log entry in the dict shape used by templates and exports"""
+        entry = {
+            'school_name': self.school_name or '',
+            'email': self.email or '',
+            'template_used': self.template_used or '',
+            'template_id': self.template_id or 0,
+            'status': self.status,
+            'timestamp': self.timestamp.isoformat(),
+            'email_id': self.email_id or '',
+            'subject': self.subject or ''
+        }
+        if self.error_category:
+            entry['error_category'] = self.error_category
+        return entry
+
+
+class LogStat(db.Model):
+    """Counter maintained as logs are written, so dashboards never scan email_logs"""
+    __tablename__ = 'log_stats'
+
+    # e.g. ('outcome', 'error'), ('category', 'Rate Limit'), ('template:sent', 'Intro'), ('variant:sent', '3'),
+    # ('hour:error', '2025-07-24T13')
+    dimension = db.Column(db.String(50), primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class EmailValidation(db.Model):
+    """Cached email_validator result keyed on the address with its domain lower-cased"""
+    __tablename__ = 'email_validations'
+
+    address = db.Column(db.String(320), primary_key=True)
+    valid = db.Column(db.Boolean, nullable=False)
+    normalized = db.Column(db.String(320), nullable=False)
+    checked_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class Segment(db.Model):
+    """A saved school filter that sends can target by id"""
+    __tablename__ = 'segments'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), nullable=False)
+    filters = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'filters': json.loads(self.filters),
+            'created_at': self.created_at.isoformat()
+        }
+
+
+class Campaign(db.Model):
+    """A scheduled send that campaign_scheduler.py feeds to the send queue in paced slices"""
+    __tablename__ = 'campaigns'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), nullable=False)
+    # scheduled -> running -> done, or paused / cancelled by the operator
+    status = db.Column(db.String(20), nullable=False, index=True, default='scheduled')
+    # Send job options (template_id, ab_testing, batch_mode, custom content, transport)
+    settings = db.Column(db.Text, nullable=False)
+    # {'filter': {...}} or {'school_ids': [...]}, resolved to recipients when the campaign starts
+    selection = db.Column(db.Text, nullable=False)
+    start_at = db.Column(db.DateTime, nullable=False, index=True)
+    per_hour = db.Column(db.Integer)
+    per_day = db.Column(db.Integer)
+    # Local 'HH:MM' window in each recipient's timezone during which nothing is dispatched
+    quiet_start = db.Column(db.String(5))
+    quiet_end = db.Column(db.String(5))
+    timezone = db.Column(db.String(64), nullable=False, default='UTC')
+    current_job_id = db.Column(db.String(32))
+    # Hourly pacing balance (recipients) as of paced_at; see campaign_scheduler.pace_tokens
+    pace_tokens = db.Column(db.Float)
+    paced_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'settings': json.loads(self.settings),
+            'selection': json.loads(self.selection),
+            'start_at': self.start_at.isoformat(),
+            'per_hour': self.per_hour,
+            'per_day': self.per_day,
+            'quiet_hours': {'start': self.quiet_start, 'end': self.quiet_end} if self.quiet_start else None,
+            'timezone': self.timezone,
+            'current_job_id': self.current_job_id,
+            'pace_tokens': self.pace_tokens,
+            'paced_at': self.paced_at.isoformat() if self.paced_at else None,
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class CampaignRecipient(db.Model):
+    """A school in a campaign, with the timezone its quiet hours are checked in"""
+    __tablename__ = 'campaign_recipients'
+    __table_args__ = (
+        db.Index('ix_campaign_recipients_pending', 'campaign_id', 'dispatched_at', 'timezone'),
+    )
+
+    campaign_id = db.Column(db.Integer, primary_key=True)
+    school_id = db.Column(db.Integer, primary_key=True)
+    timezone = db.Column(db.String(64), nullable=False)
+    dispatched_at = db.Column(db.DateTime)
+    job_id = db.Column(db.String(32))
+
+
+class StorageMeta(db.Model):
+    __tablename__ = 'storage_meta'
+
+    key = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.Text)
+
+
+def log_outcome(status):
+    """Classify a log status as 'sent', 'error' or 'other' (tests, previews)"""
+    if 'Error' in status:
+        return 'error'
+    if status == 'Sent' or 'Sent (Retry)' in status:
+        return 'sent'
+    return 'other'
+
+
+@event.listens_for(Engine, 'connect')
+def _configure_sqlite(dbapi_connection, connection_record):
+    """Use WAL so web workers and send workers can read while another writes"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    """Time every query for /metrics and the request's Server-Timing db phase"""
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    metrics.DB_QUERY_SECONDS.observe(elapsed)
+    metrics.record_phase('db', elapsed)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _query_failed(exception_context):
+    started = exception_context.connection.info.get('query_started') if exception_context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def database_url():
+    """Return the configured database URL, defaulting to a local SQLite file"""
+    url = os.environ.get('DATABASE_URL')
+    if not url:
+        return 'sqlite:///' + os.path.abspath('data/outreach.db')
+    # SQLAlchemy only accepts the postgresql:// scheme
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def init_storage(app):
+    """Bind the database to the app, create tables and migrate legacy JSON data once"""
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', database_url())
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {'pool_pre_ping': True})
+    db.init_app(app)
+    app.cli.add_command(migrate_json_command)
+    with app.app_context():
+        db.create_all()
+        upgrade_schools_table()
+        upgrade_campaigns_table()
+        upgrade_email_logs_table()
+        migrate_json_data()
+        if get_meta('log_stats_version') != LOG_STATS_VERSION:
+            rebuild_log_stats()
+
+
+def migrate_json_data(schools_file='data/schools.json', logs_file='data/logs.json', force=False):
+    """Import schools.json and logs.json into the database the first time storage starts"""
+    if not force and db.session.get(StorageMeta, 'json_migrated'):
+        return False
+
+    try:
+        # The marker row doubles as a lock so only one worker performs the import
+        if not force:
+            db.session.add(StorageMeta(key='json_migrated', value=datetime.now().isoformat()))
+            db.session.flush()
+
+        schools = _load_legacy_json(schools_file)
+        logs = _load_legacy_json(logs_file)
+        # One row per address, later entries winning, as on upload
+        unique_schools = {email_key(record['Email']): record for record in schools if record.get('Email')}
+        db.session.add_all(School.from_dict(record) for record in unique_schools.values())
+        db.session.add_all(EmailLog.from_dict(entry) for entry in logs)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+    rebuild_log_stats()
+
+    logging.info(f"Migrated {len(schools)} schools and {len(logs)} log entries from JSON into the database")
+    return True
+
+
+def _load_legacy_json(filename):
+    """Read a legacy JSON data file, treating missing or corrupt files as empty"""
+    try:
+        with open(filename, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+
+
+@click.command('migrate-json')
+@click.option('--schools', 'schools_file', default='data/schools.json', help='Schools JSON file to import')
+@click.option('--logs', 'logs_file', default='data/logs.json', help='Logs JSON file to import')
+def migrate_json_command(schools_file, logs_file):
+    """Import legacy JSON data files into the database"""
+    migrate_json_data(schools_file, logs_file, force=True)
+    click.echo('JSON data imported')
+
+
+def get_meta(key):
+    """Return a storage meta value, or None"""
+    meta = db.session.get(StorageMeta, key)
+    return meta.value if meta else None
+
+
+def set_meta(key, value):
+    """Save a storage meta value"""
+    db.session.merge(StorageMeta(key=key, value=value))
+    db.session.commit()
+
+
+def delete_meta(key):
+    """Remove a storage meta value"""
+    StorageMeta.query.filter_by(key=key).delete()
+    db.session.commit()
+
+
+# Cursor pagination
+
+def _cursor_scope(scope):
+    """Fingerprint the sort, direction and filters a page was fetched with"""
+    canonical = json.dumps(scope, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def encode_cursor(values, scope):
+    """Encode the sort key of the last row on a page, and the query it came from, as an opaque cursor"""
+    payload = [*values, _cursor_scope(scope)]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, scope):
+    """Decode a cursor from encode_cursor into [value, id]
+
+    Raises ValueError if it is malformed or was issued for a different sort, order or filter.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != 3:
+        raise ValueError('Invalid cursor')
+    if values[2] != _cursor_scope(scope):
+        raise ValueError('Cursor was issued for a different sort, order or filter; start again without it')
+    return values[:2]
+
+
+def _keyset_page(query, sort_column, id_column, descending, cursor, limit, key_of, scope, parse_value=None):
+    """Fetch one page ordered by (sort_column, id) starting after cursor; return (rows, next_cursor)
+
+    scope describes the sort, direction and filters; a cursor only continues the same scope.
+    """
+    if cursor:
+        value, last_id = decode_cursor(cursor, scope)
+        if parse_value:
+            try:
+                value = parse_value(value)
+            except (TypeError, ValueError):
+                raise ValueError('Invalid cursor')
+        if descending:
+            query = query.filter(or_(sort_column < value, and_(sort_column == value, id_column < last_id)))
+        else:
+            query = query.filter(or_(sort_column > value, and_(sort_column == value, id_column > last_id)))
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column, id_column)
+    # Fetch one extra row to know whether another page exists
+    rows = query.limit(limit + 1).all()
+    next_cursor = encode_cursor(key_of(rows[limit - 1]), scope) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+# Schools
+
+# Sort keys accepted by page_schools: (order expression, value read from a row for the cursor).
+# City uses '' for missing values so the ordering stays total.
+SCHOOL_SORTS = {
+    'id': (School.id, lambda school: school.id),
+    'name': (School.name_key, lambda school: school.name_key),
+    'email': (School.email_key, lambda school: school.email_key),
+    'city': (func.coalesce(School.city, ''), lambda school: school.city or ''),
+}
+
+# Filters accepted when selecting schools: city (exact), q (name prefix), upload (import job id)
+SCHOOL_FILTERS = ('city', 'q', 'upload')
+
+
+def _active_schools():
+    return School.query.filter(School.contacted_at.is_(None))
+
+
+def _filtered_schools(filters=None):
+    """Build a query for not-yet-contacted schools matching filters; raises ValueError on unknown keys"""
+    filters = filters or {}
+    unknown = set(filters) - set(SCHOOL_FILTERS)
+    if unknown:
+        raise ValueError(f"Unknown school filter(s): {', '.join(sorted(unknown))}")
+    query = _active_schools()
+    if filters.get('city'):
+        query = query.filter(School.city == filters['city'])
+    if filters.get('q'):
+        query = query.filter(School.name_key.startswith(name_key(filters['q']), autoescape=True))
+    if filters.get('upload'):
+        query = query.filter(School.upload_id == filters['upload'])
+    return query
+
+
+def count_schools(filters=None):
+    """Return the number of schools not yet contacted, optionally matching filters"""
+    return _filtered_schools(filters).with_entities(func.count(School.id)).scalar()
+
+
+def select_school_ids(filters=None):
+    """Resolve a filter to the ids of matching schools, in upload order"""
+    rows = _filtered_schools(filters).with_entities(School.id).order_by(School.id) \
+        .execution_options(yield_per=10000)
+    return [school_id for school_id, in rows]
+
+
+def page_schools(limit=50, cursor=None, sort='id', descending=False, filters=None):
+    """Return one page of not-yet-contacted schools and the cursor for the next page"""
+    if sort not in SCHOOL_SORTS:
+        raise ValueError(f"Unknown sort '{sort}'")
+    query = _filtered_schools(filters)
+    sort_column, sort_value = SCHOOL_SORTS[sort]
+    scope = {'sort': sort, 'descending': bool(descending), 'filters': filters or {}}
+    rows, next_cursor = _keyset_page(query, sort_column, School.id, descending, cursor, limit,
+                                     lambda school: [sort_value(school), school.id], scope)
+    return [school.to_dict() for school in rows], next_cursor
+
+
+def get_school(school_id):
+    """Return one school by id, or None"""
+    school = db.session.get(School, school_id)
+    return school.to_dict() if school else None
+
+
+def get_schools(school_ids):
+    """Return not-yet-contacted schools for the given ids, in the order the ids were given"""
+    if not school_ids:
+        return []
+    found = {school.id: school.to_dict() for school in _active_schools().filter(School.id.in_(school_ids))}
+    return [found[school_id] for school_id in school_ids if school_id in found]
+
+
+def merge_schools(records, upload_id=None):
+    """Insert or update schools keyed on normalized email; return counts of what changed"""
+    # Later rows win when the same address appears twice in one batch
+    rows = {}
+    for record in records:
+        row = School.row_from_dict(record)
+        row['upload_id'] = upload_id
+        rows[row['email_key']] = row
+    counts = {'inserted': 0, 'updated': 0, 'contacted': 0, 'duplicates': len(records) - len(rows)}
+    if not rows:
+        return counts
+
+    keys = list(rows)
+    for start in range(0, len(keys), 500):
+        existing = db.session.query(School.email_key, School.contacted_at) \
+            .filter(School.email_key.in_(keys[start:start + 500]))
+        for _, contacted_at in existing:
+            counts['updated'] += 1
+            if contacted_at is not None:
+                counts['contacted'] += 1
+    counts['inserted'] = len(rows) - counts['updated']
+
+    dialect = postgresql if db.session.get_bind().dialect.name == 'postgresql' else sqlite
+    stmt = dialect.insert(School.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['email_key'],
+        set_={column: stmt.excluded[column] for column in ('name', 'email', 'contact_person', 'city', 'extra', 'name_key', 'upload_id')}
+    )
+    db.session.execute(stmt, list(rows.values()))
+    db.session.commit()
+    return counts
+
+
+def mark_contacted(school_ids):
+    """Mark schools as contacted by primary key; return how many were updated"""
+    school_ids = list(set(school_ids))
+    now = datetime.now()
+    marked = 0
+    # Chunk the IN clause to stay under database parameter limits
+    for start in range(0, len(school_ids), 500):
+        marked += School.query.filter(School.id.in_(school_ids[start:start + 500]), School.contacted_at.is_(None)) \
+            .update({School.contacted_at: now}, synchronize_session=False)
+    db.session.commit()
+    return marked
+
+
+def clear_schools():
+    """Delete every school"""
+    School.query.delete()
+    db.session.commit()
+
+
+# Columns added to schools after the table was first created, in the order they were introduced
+SCHOOL_UPGRADE_COLUMNS = [
+    ('email_key', 'VARCHAR(320)'),
+    ('name_key', 'VARCHAR(255)'),
+    ('contacted_at', 'TIMESTAMP'),
+    ('upload_id', 'VARCHAR(32)'),
+]
+
+
+def upgrade_schools_table():
+    """Add columns introduced since a schools table was created, backfilling dedup keys"""
+    columns = {column['name'] for column in inspect(db.engine).get_columns('schools')}
+    missing = [(name, type_) for name, type_ in SCHOOL_UPGRADE_COLUMNS if name not in columns]
+    if not missing:
+        return
+    with db.engine.begin() as conn:
+        for name, type_ in missing:
+            conn.execute(text(f'ALTER TABLE schools ADD COLUMN {name} {type_}'))
+
+    duplicates = []
+    if 'email_key' not in columns:
+        # Backfill the keys, keeping the most recently uploaded row for each address
+        seen = set()
+        for school in School.query.order_by(School.id.desc()):
+            key = email_key(school.email)
+            if key in seen:
+                duplicates.append(school.id)
+                continue
+            seen.add(key)
+            school.email_key = key
+            school.name_key = name_key(school.name)
+        for start in range(0, len(duplicates), 500):
+            School.query.filter(School.id.in_(duplicates[start:start + 500])).delete(synchronize_session=False)
+        db.session.commit()
+
+    added = {name for name, _ in missing}
+    for index in School.__table__.indexes:
+        if {column.name for column in index.columns} & added:
+            index.create(db.engine, checkfirst=True)
+    logging.info(f"Upgraded schools table: added {', '.join(sorted(added))} ({len(duplicates)} duplicate emails removed)")
+
+
+# Columns added to campaigns after the table was first created
+CAMPAIGN_UPGRADE_COLUMNS = [
+    ('pace_tokens', 'FLOAT'),
+    ('paced_at', 'TIMESTAMP'),
+]
+
+
+def upgrade_campaigns_table():
+    """Add columns introduced since a campaigns table was created"""
+    columns = {column['name'] for column in inspect(db.engine).get_columns('campaigns')}
+    missing = [(name, type_) for name, type_ in CAMPAIGN_UPGRADE_COLUMNS if name not in columns]
+    if not missing:
+        return
+    with db.engine.begin() as conn:
+        for name, type_ in missing:
+            conn.execute(text(f'ALTER TABLE campaigns ADD COLUMN {name} {type_}'))
+    logging.info(f"Upgraded campaigns table: added {', '.join(name for name, _ in missing)}")
+
+
+def upgrade_email_logs_table():
+    """Add the dedupe key column and its unique index to an email_logs table created before them"""
+    columns = {column['name'] for column in inspect(db.engine).get_columns('email_logs')}
+    if 'dedupe_key' in columns:
+        return
+    with db.engine.begin() as conn:
+        conn.execute(text('ALTER TABLE email_logs ADD COLUMN dedupe_key VARCHAR(400)'))
+        conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ix_email_logs_dedupe_key ON email_logs (dedupe_key)'))
+    logging.info("Upgraded email_logs table: added dedupe_key")
+
+
+# Segments
+
+def list_segments():
+    """Return saved segments, newest first"""
+    return [segment.to_dict() for segment in Segment.query.order_by(Segment.id.desc())]
+
+
+def get_segment(segment_id):
+    """Return one segment by id, or None"""
+    segment = db.session.get(Segment, segment_id)
+    return segment.to_dict() if segment else None
+
+
+def create_segment(name, filters):
+    """Save a named filter; raises ValueError for unknown filter keys"""
+    _filtered_schools(filters)
+    segment = Segment(name=name, filters=json.dumps({key: value for key, value in filters.items() if value}))
+    db.session.add(segment)
+    db.session.commit()
+    return segment.to_dict()
+
+
+def delete_segment(segment_id):
+    """Delete a segment; return whether it existed"""
+    removed = Segment.query.filter(Segment.id == segment_id).delete()
+    db.session.commit()
+    return bool(removed)
+
+
+# Campaigns
+
+# School columns (normalized like placeholders) that give a recipient's timezone
+TIMEZONE_FIELDS = ('timezone', 'time_zone', 'tz')
+
+
+def create_campaign(name, settings, selection, start_at, per_hour=None, per_day=None,
+                    quiet_hours=None, timezone='UTC'):
+    """Save a scheduled campaign and return it"""
+    campaign = Campaign(
+        name=name, status='scheduled', settings=json.dumps(settings), selection=json.dumps(selection),
+        start_at=start_at, per_hour=per_hour, per_day=per_day,
+        quiet_start=quiet_hours['start'] if quiet_hours else None,
+        quiet_end=quiet_hours['end'] if quiet_hours else None,
+        timezone=timezone
+    )
+    db.session.add(campaign)
+    db.session.commit()
+    return campaign.to_dict()
+
+
+def list_campaigns():
+    """Return campaigns with their progress, newest first"""
+    campaigns = [campaign.to_dict() for campaign in Campaign.query.order_by(Campaign.id.desc())]
+    progress = campaign_progress([campaign['id'] for campaign in campaigns])
+    for campaign in campaigns:
+        campaign.update(progress.get(campaign['id'], {'recipients': 0, 'dispatched': 0}))
+    return campaigns
+
+
+def get_campaign(campaign_id):
+    """Return one campaign with its progress, or None"""
+    campaign = db.session.get(Campaign, campaign_id)
+    if not campaign:
+        return None
+    record = campaign.to_dict()
+    record.update(campaign_progress([campaign_id]).get(campaign_id, {'recipients': 0, 'dispatched': 0}))
+    return record
+
+
+def campaign_progress(campaign_ids):
+    """Return {campaign_id: {'recipients': n, 'dispatched': m}}"""
+    if not campaign_ids:
+        return {}
+    rows = db.session.query(
+        CampaignRecipient.campaign_id, func.count(), func.count(CampaignRecipient.dispatched_at)
+    ).filter(CampaignRecipient.campaign_id.in_(campaign_ids)).group_by(CampaignRecipient.campaign_id)
+    return {campaign_id: {'recipients': total, 'dispatched': dispatched} for campaign_id, total, dispatched in rows}
+
+
+def update_campaign(campaign_id, **values):
+    """Set columns on a campaign; return whether it exists"""
+    updated = Campaign.query.filter(Campaign.id == campaign_id).update(values)
+    db.session.commit()
+    return bool(updated)
+
+
+def due_campaigns(now=None):
+    """Return scheduled or running campaigns whose start time has passed"""
+    now = now or datetime.now()
+    query = Campaign.query.filter(Campaign.status.in_(['scheduled', 'running']), Campaign.start_at <= now)
+    return [campaign.to_dict() for campaign in query.order_by(Campaign.start_at)]
+
+
+def _school_timezone(extra, default):
+    """Return the timezone named in a school's extra columns, or default"""
+    if extra:
+        for key, value in json.loads(extra).items():
+            if value and normalize_field(key) in TIMEZONE_FIELDS:
+                return str(value).strip()
+    return default
+
+
+def start_campaign(campaign_id, selection, default_timezone, valid_timezone):
+    """Resolve a campaign's selection to recipient rows and mark it running; return how many were added
+
+    Both happen in one transaction, so a campaign is never running without its recipients
+    or snapshotted twice.
+    """
+    if 'school_ids' in selection:
+        school_ids = sorted(set(selection['school_ids']))
+        # Chunk the IN clause to stay under database parameter limits
+        queries = [_active_schools().filter(School.id.in_(school_ids[start:start + 500]))
+                   for start in range(0, len(school_ids), 500)]
+    else:
+        queries = [_filtered_schools(selection.get('filter'))]
+    batch = []
+    added = 0
+    for query in queries:
+        rows = query.with_entities(School.id, School.extra).order_by(School.id).execution_options(yield_per=10000)
+        for school_id, extra in rows:
+            timezone = _school_timezone(extra, default_timezone)
+            batch.append({
+                'campaign_id': campaign_id,
+                'school_id': school_id,
+                'timezone': timezone if valid_timezone(timezone) else default_timezone
+            })
+            if len(batch) >= 5000:
+                db.session.execute(CampaignRecipient.__table__.insert(), batch)
+                added += len(batch)
+                batch = []
+    if batch:
+        db.session.execute(CampaignRecipient.__table__.insert(), batch)
+        added += len(batch)
+    Campaign.query.filter(Campaign.id == campaign_id).update({'status': 'running'})
+    db.session.commit()
+    return added
+
+
+def pending_campaign_timezones(campaign_id):
+    """Return the distinct timezones of a campaign's undispatched recipients"""
+    rows = db.session.query(CampaignRecipient.timezone).filter(
+        CampaignRecipient.campaign_id == campaign_id, CampaignRecipient.dispatched_at.is_(None)
+    ).distinct()
+    return [timezone for timezone, in rows]
+
+
+def pending_campaign_recipients(campaign_id, timezones, limit):
+    """Return up to limit undispatched school ids in the given timezones, in school order"""
+    rows = db.session.query(CampaignRecipient.school_id).filter(
+        CampaignRecipient.campaign_id == campaign_id,
+        CampaignRecipient.dispatched_at.is_(None),
+        CampaignRecipient.timezone.in_(timezones)
+    ).order_by(CampaignRecipient.school_id).limit(limit)
+    return [school_id for school_id, in rows]
+
+
+def mark_campaign_dispatched(campaign_id, school_ids, job_id, now=None, pace_tokens=None):
+    """Record that school ids were handed to a send job, make it the campaign's current job and save its pacing balance"""
+    now = now or datetime.now()
+    for start in range(0, len(school_ids), 500):
+        CampaignRecipient.query.filter(
+            CampaignRecipient.campaign_id == campaign_id,
+            CampaignRecipient.school_id.in_(school_ids[start:start + 500])
+        ).update({'dispatched_at': now, 'job_id': job_id}, synchronize_session=False)
+    Campaign.query.filter(Campaign.id == campaign_id).update(
+        {'current_job_id': job_id, 'pace_tokens': pace_tokens, 'paced_at': now}
+    )
+    db.session.commit()
+
+
+def campaign_job_ids(campaign_id):
+    """Return the ids of the send jobs a campaign's recipients were dispatched to"""
+    rows = db.session.query(CampaignRecipient.job_id).filter(
+        CampaignRecipient.campaign_id == campaign_id, CampaignRecipient.job_id.isnot(None)
+    ).distinct()
+    return [job_id for job_id, in rows]
+
+
+def campaign_dispatch_counts(campaign_id, now=None):
+    """Return (dispatched in the last hour, dispatched in the last day)"""
+    now = now or datetime.now()
+    hour_ago = now - timedelta(hours=1)
+    last_hour, last_day = db.session.query(
+        func.count(CampaignRecipient.school_id).filter(CampaignRecipient.dispatched_at > hour_ago),
+        func.count(CampaignRecipient.school_id)
+    ).filter(
+        CampaignRecipient.campaign_id == campaign_id,
+        CampaignRecipient.dispatched_at > now - timedelta(days=1)
+    ).one()
+    return last_hour, last_day
+
+
+# Email validation cache
+
+def get_validations(addresses, max_age):
+    """Return {address: (valid, normalized)} for cached results newer than max_age"""
+    addresses = list(set(addresses))
+    cutoff = datetime.now() - max_age
+    results = {}
+    # Chunk the IN clause to stay under database parameter limits
+    for start in range(0, len(addresses), 500):
+        rows = db.session.query(EmailValidation.address, EmailValidation.valid, EmailValidation.normalized) \
+            .filter(EmailValidation.address.in_(addresses[start:start + 500]),
+                    EmailValidation.checked_at >= cutoff)
+        for address, valid, normalized in rows:
+            results[address] = (valid, normalized)
+    return results
+
+
+def save_validations(results):
+    """Upsert {address: (valid, normalized)} validation results"""
+    if not results:
+        return
+    now = datetime.now()
+    dialect = postgresql if db.session.get_bind().dialect.name == 'postgresql' else sqlite
+    stmt = dialect.insert(EmailValidation.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['address'],
+        set_={'valid': stmt.excluded.valid, 'normalized': stmt.excluded.normalized,
+              'checked_at': stmt.excluded.checked_at}
+    )
+    db.session.execute(stmt, [{'address': address, 'valid': valid, 'normalized': normalized, 'checked_at': now}
+                              for address, (valid, normalized) in results.items()])
+    db.session.commit()
+
+
+# Email logs
+
+def add_logs(entries, checkpoint=None):
+    """Insert log entries and bump their counters, optionally saving a (key, value) meta checkpoint in the same transaction"""
+    if not entries:
+        return
+    logs = _new_logs([EmailLog.from_dict(entry) for entry in entries])
+    db.session.add_all(logs)
+    counts = Counter()
+    for log in logs:
+        counts.update(_stat_keys(log.timestamp, log.outcome, log.template_used, log.error_category, log.template_id))
+    _increment_stats(counts)
+    if checkpoint:
+        db.session.merge(StorageMeta(key=checkpoint[0], value=checkpoint[1]))
+    db.session.commit()
+
+
+def _new_logs(logs):
+    """Drop logs whose dedupe key is already stored or repeats earlier in the list"""
+    keys = list({log.dedupe_key for log in logs if log.dedupe_key})
+    seen = set()
+    # Stay under SQLite's bound-parameter limit
+    for start in range(0, len(keys), 500):
+        seen.update(key for key, in db.session.query(EmailLog.dedupe_key).filter(
+            EmailLog.dedupe_key.in_(keys[start:start + 500])))
+    new = []
+    for log in logs:
+        if log.dedupe_key:
+            if log.dedupe_key in seen:
+                continue
+            seen.add(log.dedupe_key)
+        new.append(log)
+    return new
+
+
+def count_logs(outcome=None):
+    """Return the number of log entries, optionally for one outcome"""
+    query = db.session.query(func.count(EmailLog.id))
+    if outcome:
+        query = query.filter(EmailLog.outcome == outcome)
+    return query.scalar()
+
+
+def page_logs(limit=50, cursor=None, descending=True, outcome=None, category=None, template_id=None, email=None):
+    """Return one page of log entries ordered by timestamp and the cursor for the next page"""
+    query = EmailLog.query
+    if outcome:
+        query = query.filter(EmailLog.outcome == outcome)
+    if category:
+        query = query.filter(EmailLog.error_category == category)
+    if template_id is not None:
+        query = query.filter(EmailLog.template_id == template_id)
+    if email:
+        query = query.filter(EmailLog.email == email)
+    scope = {'sort': 'timestamp', 'descending': bool(descending), 'outcome': outcome, 'category': category,
+             'template_id': template_id, 'email': email}
+    rows, next_cursor = _keyset_page(query, EmailLog.timestamp, EmailLog.id, descending, cursor, limit,
+                                     lambda row: [row.timestamp.isoformat(), row.id], scope,
+                                     parse_value=datetime.fromisoformat)
+    return [row.to_dict() for row in rows], next_cursor
+
+
+def iter_logs(batch_size=1000, start=None, end=None, outcome=None, category=None):
+    """Yield log entries in insertion order without loading them all at once, optionally filtered"""
+    query = EmailLog.query
+    if start:
+        query = query.filter(EmailLog.timestamp >= start)
+    if end:
+        query = query.filter(EmailLog.timestamp < end)
+    if outcome:
+        query = query.filter(EmailLog.outcome == outcome)
+    if category:
+        query = query.filter(EmailLog.error_category == category)
+    last_id = 0
+    while True:
+        rows = query.filter(EmailLog.id > last_id).order_by(EmailLog.id).limit(batch_size).all()
+        if not rows:
+            return
+        for row in rows:
+            yield row.to_dict()
+        last_id = rows[-1].id
+
+
+def error_category_counts():
+    """Return {error_category: count} over all error logs"""
+    return stat_counts('category')
+
+
+def error_examples(category, limit=5):
+    """Return the first error log entries for a category"""
+    query = EmailLog.query.filter(EmailLog.outcome == 'error')
+    if category == 'Unknown':
+        query = query.filter(EmailLog.error_category.is_(None))
+    else:
+        query = query.filter(EmailLog.error_category == category)
+    return [row.to_dict() for row in query.order_by(EmailLog.id).limit(limit)]
+
+
+def template_outcome_counts():
+    """Return {template_used: {'errors': n, 'success': m}}"""
+    counts = {}
+    for outcome, field in (('error', 'errors'), ('sent', 'success')):
+        for template, count in stat_counts('template:' + outcome).items():
+            counts.setdefault(template, {'errors': 0, 'success': 0})
+            counts[template][field] = count
+    return counts
+
+
+def variant_outcome_counts():
+    """Return {template_id: {'sent': n, 'error': m}} for templates that have sent email"""
+    counts = {}
+    for outcome in ('sent', 'error'):
+        for template_id, count in stat_counts('variant:' + outcome).items():
+            counts.setdefault(int(template_id), {'sent': 0, 'error': 0})[outcome] = count
+    return counts
+
+
+def logs_since(cutoff, outcome=None, limit=None):
+    """Return log entries newer than cutoff, oldest first"""
+    query = EmailLog.query.filter(EmailLog.timestamp >= cutoff)
+    if outcome:
+        query = query.filter(EmailLog.outcome == outcome)
+    query = query.order_by(EmailLog.timestamp, EmailLog.id)
+    if limit:
+        query = query.limit(limit)
+    return [row.to_dict() for row in query]
+
+
+def log_totals():
+    """Return {'total', 'sent', 'error', 'other'} log counts"""
+    totals = {'sent': 0, 'error': 0, 'other': 0}
+    totals.update(stat_counts('outcome'))
+    totals['total'] = sum(totals.values())
+    return totals
+
+
+def hourly_outcome_counts(hours=24, now=None):
+    """Return [(hour_start, errors, sent)] for the last `hours` clock hours, most recent first"""
+    now = now or datetime.now()
+    current_hour = now.replace(minute=0, second=0, microsecond=0)
+    hour_starts = [current_hour - timedelta(hours=i) for i in range(hours)]
+    keys = [hour.strftime(HOUR_FORMAT) for hour in hour_starts]
+    rows = LogStat.query.filter(LogStat.dimension.in_(['hour:error', 'hour:sent']), LogStat.key.in_(keys))
+    counts = {(row.dimension, row.key): row.count for row in rows}
+    return [(hour, counts.get(('hour:error', key), 0), counts.get(('hour:sent', key), 0))
+            for hour, key in zip(hour_starts, keys)]
+
+
+def stat_counts(dimension):
+    """Return {key: count} for one counter dimension"""
+    return {row.key: row.count for row in LogStat.query.filter_by(dimension=dimension) if row.count}
+
+
+def _stat_keys(timestamp, outcome, template_used, error_category, template_id=None):
+    """Return the counter keys a single log entry contributes to"""
+    keys = [('outcome', outcome), ('hour:' + outcome, timestamp.strftime(HOUR_FORMAT))]
+    if outcome in ('error', 'sent'):
+        keys.append(('template:' + outcome, (template_used or 'Unknown Template')[:255]))
+        # By id as well as name, for A/B weighting; 0 is custom email and pre-send validation errors
+        if template_id:
+            keys.append(('variant:' + outcome, str(template_id)))
+    if outcome == 'error':
+        keys.append(('category', error_category or 'Unknown'))
+    return keys
+
+
+def _increment_stats(counts):
+    """Add counts to log_stats rows with a single upsert"""
+    if not counts:
+        return
+    dialect = postgresql if db.session.get_bind().dialect.name == 'postgresql' else sqlite
+    stmt = dialect.insert(LogStat.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['dimension', 'key'],
+        set_={'count': LogStat.__table__.c.count + stmt.excluded.count}
+    )
+    db.session.execute(stmt, [{'dimension': dimension, 'key': key, 'count': count}
+                              for (dimension, key), count in counts.items()])
+
+
+def rebuild_log_stats():
+    """Recompute every counter from email_logs (used after bulk deletes and upgrades)"""
+    LogStat.query.delete()
+    counts = Counter()
+    rows = db.session.query(EmailLog.timestamp, EmailLog.outcome, EmailLog.template_used, EmailLog.error_category,
+                            EmailLog.template_id) \
+        .execution_options(yield_per=10000)
+    for row in rows:
+        counts.update(_stat_keys(*row))
+    _increment_stats(counts)
+    db.session.merge(StorageMeta(key='log_stats_version', value=LOG_STATS_VERSION))
+    db.session.commit()
+
+
+def clear_error_logs():
+    """Delete every log entry that is not a successful send; return how many were removed"""
+    removed = EmailLog.query.filter(EmailLog.outcome != 'sent').delete(synchronize_session=False)
+    rebuild_log_stats()
+    return removed
+
+
+def clear_logs():
+    """Delete every log entry"""
+    EmailLog.query.delete()
+    LogStat.query.delete()
+    db.session.commit()
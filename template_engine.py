@@ -0,0 +1,157 @@
+import re
+import threading
+from operator import itemgetter
+from collections import OrderedDict
+
+import pandas as pd
+
+# Placeholders look like {{field}} or {{field|default}}; field may be any CSV column
+PLACEHOLDER_PATTERN = re.compile(r'\{\{\s*([^{}|]+?)\s*(?:\|([^{}]*))?\}\}')
+
+# Legacy snake_case placeholder names and the CSV columns they read
+FIELD_ALIASES = {
+    'school_name': 'School Name',
+    'contact_person': 'Contact Person',
+    'city': 'City',
+    'email': 'Email',
+}
+
+CACHE_SIZE = 1024
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class Field:
+    """A placeholder in a compiled template"""
+    __slots__ = ('keys', 'normalized', 'default', 'source')
+
+    def __init__(self, name, default, source):
+        alias = FIELD_ALIASES.get(name)
+        self.keys = (alias, name) if alias else (name,)
+        self.normalized = normalize_field(name)
+        self.default = default
+        # Unknown fields without a default are left untouched, like the old str.replace behaviour
+        if default is None and alias:
+            self.default = ''
+        self.source = source
+
+
+class CompiledTemplate:
+    """Template text parsed once into literal segments, distinct fields and an output order"""
+    __slots__ = ('literals', 'fields', 'order')
+
+    def __init__(self, literals, fields, order):
+        self.literals = literals
+        self.fields = fields
+        # Picks segments out of literals + field values in output order
+        self.order = itemgetter(*order) if len(order) > 1 else None
+
+
+def normalize_field(name):
+    """Normalize a column or placeholder name so 'School Name' matches school_name"""
+    return re.sub(r'[\s_\-]+', '_', name.strip().lower())
+
+
+def compile_template(text):
+    """Parse template text into literal segments and field slots"""
+    literals = []
+    fields = []
+    slots = {}
+    layout = []
+    position = 0
+    for match in PLACEHOLDER_PATTERN.finditer(text):
+        if match.start() > position:
+            layout.append(('literal', len(literals)))
+            literals.append(text[position:match.start()])
+        # Repeated placeholders share one slot so each field is looked up once per school
+        source = match.group(0)
+        if source not in slots:
+            slots[source] = len(fields)
+            fields.append(Field(match.group(1), match.group(2), source))
+        layout.append(('field', slots[source]))
+        position = match.end()
+    if position < len(text) or not layout:
+        layout.append(('literal', len(literals)))
+        literals.append(text[position:])
+    order = [index if kind == 'literal' else len(literals) + index for kind, index in layout]
+    return CompiledTemplate(tuple(literals), tuple(fields), order)
+
+
+def get_compiled(text, template_id=None):
+    """Return the compiled form of text, cached by template id and content"""
+    # str hashes are computed once per string object, so repeat lookups don't rescan the text
+    key = (template_id, text)
+    compiled = _cache.get(key)
+    if compiled is not None:
+        return compiled
+    compiled = compile_template(text)
+    with _cache_lock:
+        _cache[key] = compiled
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return compiled
+
+
+def _lookup(school_data, field):
+    """Find a field's value in a school record, matching aliases and column-name variants"""
+    for key in field.keys:
+        value = school_data.get(key)
+        if value is not None and value != '':
+            return value
+    for key, value in school_data.items():
+        if normalize_field(key) == field.normalized and value is not None and value != '':
+            return value
+    return None
+
+
+def _value(school_data, field):
+    value = _lookup(school_data, field)
+    if value is None:
+        return field.default if field.default is not None else field.source
+    return value
+
+
+def render(compiled, school_data):
+    """Render a compiled template for one school with a single join"""
+    if not compiled.fields:
+        return compiled.literals[0]
+    values = tuple(str(_value(school_data, field)) for field in compiled.fields)
+    if compiled.order is None:
+        return values[0]
+    return ''.join(compiled.order(compiled.literals + values))
+
+
+def render_text(text, school_data, template_id=None):
+    """Compile (cached) and render text for one school"""
+    if not text:
+        return text
+    return render(get_compiled(text, template_id), school_data)
+
+
+def _column_values(frame, field):
+    """Return a field's value for every row of a DataFrame, as strings"""
+    # Same precedence as _lookup: exact keys first, then any column whose normalized name matches
+    columns = [key for key in field.keys if key in frame.columns]
+    columns += [column for column in frame.columns
+                if column not in field.keys and normalize_field(str(column)) == field.normalized]
+    values = pd.Series(None, index=frame.index, dtype=object)
+    for column in columns:
+        candidate = frame[column]
+        present = candidate.notna() & (candidate != '')
+        values = values.where(values.notna() | ~present, candidate)
+    fallback = field.default if field.default is not None else field.source
+    return values.where(values.notna(), fallback).astype(str)
+
+
+def render_frame(compiled, frame):
+    """Render a compiled template for every row of a DataFrame of school records, returning a list"""
+    if not compiled.fields:
+        return [compiled.literals[0]] * len(frame)
+    values = tuple(_column_values(frame, field) for field in compiled.fields)
+    parts = compiled.order(compiled.literals + values) if compiled.order is not None else values
+    # One vectorised concatenation per segment instead of one join per school
+    rendered = parts[0]
+    for part in parts[1:]:
+        rendered = rendered + part
+    return rendered.tolist() if isinstance(rendered, pd.Series) else [rendered] * len(frame)
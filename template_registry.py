@@ -0,0 +1,147 @@
+import os
+import fcntl
+import threading
+from contextlib import contextmanager
+
+import config_cache
+import template_engine
+
+# Templates stay in data/templates.json; the registry indexes whatever list config_cache holds
+TEMPLATES_FILE = 'data/templates.json'
+# High-water mark of allocated ids, so an id freed by a delete is never handed out again
+SEQUENCE_FILE = 'data/template_sequence.json'
+LOCK_FILE = 'data/templates.lock'
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+class TemplatePlan:
+    """A template's subject, text and HTML compiled once for rendering"""
+    __slots__ = ('template', 'subject', 'text', 'html')
+
+    def __init__(self, template):
+        self.template = template
+        self.subject = template_engine.compile_template(template['subject'])
+        self.text = template_engine.compile_template(template.get('content_text', template['content']))
+        html = template.get('content_html', '')
+        self.html = template_engine.compile_template(html) if html else None
+
+
+class Registry:
+    """Id-keyed index over one version of the templates list"""
+    __slots__ = ('source', 'by_id', 'ids', 'plans', 'lock')
+
+    def __init__(self, templates):
+        self.source = templates
+        self.by_id = {template['id']: template for template in templates}
+        self.ids = tuple(self.by_id)
+        # Plans are compiled on first use, so thousands of variants don't all compile up front
+        self.plans = {}
+        self.lock = threading.Lock()
+
+    def plan(self, template_id):
+        plan = self.plans.get(template_id)
+        if plan is None:
+            template = self.by_id.get(template_id)
+            if template is None:
+                return None
+            with self.lock:
+                plan = self.plans.setdefault(template_id, TemplatePlan(template))
+        return plan
+
+
+def _current():
+    """Return the registry for the current templates list, rebuilding it when the file changed"""
+    global _registry
+    templates = config_cache.load(TEMPLATES_FILE, [])
+    registry = _registry
+    # config_cache hands back the same list object until the file is rewritten
+    if registry is None or registry.source is not templates:
+        with _registry_lock:
+            registry = _registry
+            if registry is None or registry.source is not templates:
+                registry = _registry = Registry(templates)
+    return registry
+
+
+def all_templates():
+    """Return the templates list (shared; don't modify it)"""
+    return _current().source
+
+
+def template_ids():
+    """Return every template id, in file order"""
+    return _current().ids
+
+
+def get_template(template_id):
+    """Return the template with this id, or None"""
+    return _current().by_id.get(template_id)
+
+
+def get_plan(template_id):
+    """Return the compiled TemplatePlan for this id, or None"""
+    return _current().plan(template_id)
+
+
+@contextmanager
+def _editing():
+    """Hold the templates file lock and yield a fresh copy of the list to modify"""
+    os.makedirs(os.path.dirname(LOCK_FILE), exist_ok=True)
+    fd = os.open(LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        # Another process may have written the file within config_cache's recheck interval
+        config_cache.invalidate(TEMPLATES_FILE)
+        yield list(config_cache.load(TEMPLATES_FILE, []))
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def _allocate_id(templates):
+    """Return the next template id; call with the templates lock held"""
+    config_cache.invalidate(SEQUENCE_FILE)
+    sequence = config_cache.load(SEQUENCE_FILE, {})
+    next_id = max(sequence.get('next_id', 1), max((t['id'] for t in templates), default=0) + 1)
+    config_cache.save(SEQUENCE_FILE, {'next_id': next_id + 1})
+    return next_id
+
+
+def create_template(fields):
+    """Add a template under a newly allocated id and return it"""
+    with _editing() as templates:
+        template = {'id': _allocate_id(templates), **fields}
+        templates.append(template)
+        config_cache.save(TEMPLATES_FILE, templates)
+    return template
+
+
+def update_template(template_id, fields):
+    """Replace a template's fields, returning False if the id doesn't exist"""
+    with _editing() as templates:
+        for i, template in enumerate(templates):
+            if template['id'] == template_id:
+                templates[i] = {'id': template_id, **fields}
+                config_cache.save(TEMPLATES_FILE, templates)
+                return True
+    return False
+
+
+def delete_template(template_id):
+    """Remove a template, returning False if the id doesn't exist"""
+    with _editing() as templates:
+        remaining = [t for t in templates if t['id'] != template_id]
+        if len(remaining) == len(templates):
+            return False
+        config_cache.save(TEMPLATES_FILE, remaining)
+    return True
+
+
+def ensure_templates(default_templates):
+    """Write the default templates if the templates file doesn't exist yet"""
+    with _editing():
+        if not os.path.exists(TEMPLATES_FILE):
+            config_cache.save(TEMPLATES_FILE, default_templates)
+    return all_templates()
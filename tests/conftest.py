@@ -0,0 +1,78 @@
+"""Shared fixtures: the app runs against a throwaway data directory with the in-process mock provider
+
+Modules read their settings from the environment when imported and keep their data under
+the working directory, so both are set here before anything from the app is imported.
+"""
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+os.chdir(tempfile.mkdtemp(prefix='outreach-tests-'))
+os.environ['SEND_QUEUE_INPROCESS'] = '0'
+os.environ['EMAIL_TRANSPORT'] = 'mock'
+os.environ['MOCK_LATENCY_MS'] = '0'
+os.environ['RATE_LIMIT_PER_SECOND'] = '1000000'
+os.environ['LOG_RECIPIENT_SAMPLE_RATE'] = '0'
+os.environ.pop('DATABASE_URL', None)
+sys.path.insert(0, os.path.abspath(REPO_ROOT))
+
+import app as outreach
+import campaign_scheduler
+import email_validation
+import log_journal
+import storage
+import transports
+
+# Background threads would race the tests for queued jobs and journal entries
+campaign_scheduler.stop_scheduler()
+log_journal.stop_compactor()
+
+
+@pytest.fixture(autouse=True)
+def offline_validation(monkeypatch):
+    """Check address syntax only, so tests don't depend on DNS"""
+    monkeypatch.setattr(email_validation, 'check_address', lambda email: (True, email.strip()))
+
+
+@pytest.fixture
+def app_context():
+    with outreach.app.app_context():
+        yield
+
+
+@pytest.fixture
+def client():
+    return outreach.app.test_client()
+
+
+@pytest.fixture
+def mock_provider():
+    """The shared mock transport's simulator, with its history cleared"""
+    simulator = transports.get_transport('mock').simulator
+    simulator.delivered.clear()
+    simulator.replies.clear()
+    simulator.requests = 0
+    simulator.failure_rate = 0.0
+    simulator.rate_limit_rate = 0.0
+    return simulator
+
+
+@pytest.fixture
+def make_schools(app_context):
+    """Import schools with addresses unique to the test and return their ids in order"""
+
+    def make(count, **columns):
+        upload = uuid.uuid4().hex
+        storage.merge_schools([
+            {'School Name': f"School {n}", 'Email': f"contact{n}@{upload}.example.org", **columns}
+            for n in range(count)
+        ], upload_id=upload)
+        return storage.select_school_ids({'upload': upload})
+
+    return make
+
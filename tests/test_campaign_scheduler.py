@@ -0,0 +1,148 @@
+import uuid
+from datetime import datetime, time, timedelta, timezone
+
+import pytest
+
+import campaign_scheduler
+import send_queue
+import storage
+import template_registry
+
+START = datetime(2026, 3, 2, 9, 0)
+
+
+class FakeQueue:
+    """enqueue() for dispatch that records slices instead of queueing jobs"""
+
+    def __init__(self):
+        self.slices = []
+
+    def __call__(self, campaign, school_ids):
+        self.slices.append(school_ids)
+        return uuid.uuid4().hex
+
+
+@pytest.fixture
+def campaign(make_schools):
+    """Create a campaign over fresh schools; returns a function taking the count and ceilings"""
+
+    def create(count, **options):
+        school_ids = make_schools(count)
+        return storage.create_campaign('Test campaign', {'template_id': 1}, {'school_ids': school_ids}, START, **options)
+
+    return create
+
+
+def dispatch(campaign, enqueue, now):
+    """Dispatch the campaign as stored now, at a given local (and UTC) time"""
+    return campaign_scheduler.dispatch(storage.get_campaign(campaign['id']), enqueue, now,
+                                       now.replace(tzinfo=timezone.utc))
+
+
+def test_quiet_hours_can_wrap_past_midnight():
+    assert campaign_scheduler.is_quiet(time(23, 30), '22:00', '07:00')
+    assert campaign_scheduler.is_quiet(time(6, 59), '22:00', '07:00')
+    assert not campaign_scheduler.is_quiet(time(7, 0), '22:00', '07:00')
+    assert campaign_scheduler.is_quiet(time(13, 0), '12:00', '14:00')
+    assert not campaign_scheduler.is_quiet(time(14, 0), '12:00', '14:00')
+
+
+def test_only_timezones_outside_quiet_hours_are_open():
+    campaign = {'quiet_hours': {'start': '20:00', 'end': '08:00'}}
+    # 03:00 UTC is 08:30 in Kolkata and 22:00 the evening before in New York
+    now_utc = datetime(2026, 3, 2, 3, 0, tzinfo=timezone.utc)
+
+    assert campaign_scheduler.open_timezones(campaign, ['Asia/Kolkata', 'America/New_York'], now_utc) == ['Asia/Kolkata']
+
+
+def test_slices_are_capped_at_the_slice_size(campaign, monkeypatch, app_context):
+    monkeypatch.setattr(campaign_scheduler, 'SLICE_SIZE', 4)
+    created = campaign(10)
+    enqueue = FakeQueue()
+
+    assert dispatch(created, enqueue, START) == 4
+    assert storage.get_campaign(created['id'])['status'] == 'running'
+
+
+def test_daily_ceiling_holds_until_a_day_has_passed(campaign, app_context):
+    created = campaign(25, per_day=10)
+    enqueue = FakeQueue()
+
+    assert dispatch(created, enqueue, START) == 10
+    assert dispatch(created, enqueue, START + timedelta(hours=6)) == 0
+    assert dispatch(created, enqueue, START + timedelta(days=1, minutes=1)) == 10
+    # Every school is dispatched once, in school order
+    assert sorted(sum(enqueue.slices, [])) == sum(enqueue.slices, [])
+    assert len(set(sum(enqueue.slices, []))) == 20
+
+
+def test_next_slice_waits_for_the_current_job(campaign, app_context):
+    created = campaign(5)
+    job_id = send_queue.enqueue('test_campaign_slice', {})
+
+    assert dispatch(created, lambda campaign, school_ids: job_id, START) == 5
+    assert dispatch(created, FakeQueue(), START + timedelta(minutes=5)) == 0
+
+    send_queue.finish_job(job_id, {})
+    assert dispatch(created, FakeQueue(), START + timedelta(minutes=10)) == 0
+    assert storage.get_campaign(created['id'])['status'] == 'done'
+
+
+def test_hourly_ceiling_is_spread_over_the_hour_however_often_the_scheduler_wakes(campaign, app_context):
+    created = campaign(200, per_hour=60)
+    enqueue = FakeQueue()
+    dispatched = []
+    # Wakes every 10 seconds, as when each slice finishes quickly and wakes the scheduler
+    for second in range(0, 2 * 3600, 10):
+        now = START + timedelta(seconds=second)
+        count = dispatch(created, enqueue, now)
+        if count:
+            dispatched.append((now, count))
+
+    def in_window(start, length):
+        return sum(count for at, count in dispatched if start <= at < start + length)
+
+    assert in_window(START, timedelta(hours=1)) <= 60
+    # No quarter of an hour gets more than its share plus the pacing cap's one extra
+    assert max(in_window(at, timedelta(minutes=15)) for at, _ in dispatched) <= 16
+    # Fractions carry over between dispatches, so the campaign still keeps its pace
+    assert sum(count for _, count in dispatched) >= 118
+
+
+def test_starting_a_campaign_snapshots_each_recipient_once(make_schools, app_context):
+    school_ids = make_schools(1200)
+    created = storage.create_campaign('Large', {'template_id': 1}, {'school_ids': school_ids + school_ids[:50]}, START)
+
+    assert storage.start_campaign(created['id'], storage.get_campaign(created['id'])['selection'], 'UTC',
+                                  campaign_scheduler.valid_timezone) == 1200
+    started = storage.get_campaign(created['id'])
+    assert (started['status'], started['recipients']) == ('running', 1200)
+
+
+def test_a_failed_start_leaves_nothing_behind_to_retry(campaign, app_context):
+    created = campaign(10)
+    calls = []
+
+    def failing_timezone_check(name):
+        calls.append(name)
+        if len(calls) == 5:
+            raise RuntimeError('lookup failed')
+        return True
+
+    with pytest.raises(RuntimeError):
+        storage.start_campaign(created['id'], created['selection'], 'UTC', failing_timezone_check)
+    storage.db.session.rollback()
+    failed = storage.get_campaign(created['id'])
+    assert (failed['status'], failed['recipients']) == ('scheduled', 0)
+
+    assert dispatch(created, FakeQueue(), START) == 10
+
+
+@pytest.mark.parametrize('quiet_hours', ['22:00-07:00', ['22:00', '07:00'], {'start': 22, 'end': 7}, {'start': '22:00'}])
+def test_malformed_quiet_hours_are_rejected(client, make_schools, quiet_hours):
+    response = client.post('/api/campaigns', json={
+        'name': 'Quiet', 'template_id': template_registry.template_ids()[0], 'selected_schools': make_schools(1),
+        'quiet_hours': quiet_hours
+    })
+
+    assert response.status_code == 400
@@ -0,0 +1,52 @@
+import fcntl
+import threading
+import uuid
+
+import log_journal
+import storage
+
+
+def entry(email):
+    return {'school_name': 'School', 'email': email, 'template_used': 'T', 'template_id': 1, 'status': 'Sent',
+            'timestamp': '2026-01-01T12:00:00', 'email_id': '', 'subject': 'S'}
+
+
+def logged(email):
+    logs, _ = storage.page_logs(limit=5, email=email)
+    return len(logs)
+
+
+def test_corrupt_line_is_skipped_instead_of_blocking_compaction(app_context, caplog):
+    first, second = f"first@{uuid.uuid4().hex}.example.org", f"second@{uuid.uuid4().hex}.example.org"
+    log_journal.append([entry(first)])
+    with open(log_journal._path(log_journal.ACTIVE_FILE), 'a') as f:
+        f.write('{"school_name": "Torn\n')
+    log_journal.append([entry(second)])
+
+    log_journal.compact(wait=True)
+
+    assert (logged(first), logged(second)) == (1, 1)
+    assert log_journal.pending_bytes() == 0
+    assert 'Skipping unreadable journal line 2' in caplog.text
+
+
+def test_waiting_compaction_ingests_after_another_compactor_finishes(app_context):
+    email = f"waiting@{uuid.uuid4().hex}.example.org"
+    log_journal.append([entry(email)])
+    locked, release = threading.Event(), threading.Event()
+
+    def other_compactor():
+        with log_journal._file_lock('ingest.lock', fcntl.LOCK_EX):
+            locked.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=other_compactor)
+    thread.start()
+    locked.wait(5)
+    assert log_journal.compact() == 0
+    assert logged(email) == 0
+
+    threading.Timer(0.2, release.set).start()
+    assert log_journal.compact(wait=True) >= 1
+    assert logged(email) == 1
+    thread.join()
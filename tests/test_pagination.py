@@ -0,0 +1,106 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import storage
+
+
+def walk(client, path, key, **params):
+    """Follow next_cursor through every page and return the rows in order"""
+    rows = []
+    cursor = None
+    while True:
+        response = client.get(path, query_string={**params, **({'cursor': cursor} if cursor else {})})
+        assert response.status_code == 200, response.json
+        rows.extend(response.json[key])
+        cursor = response.json['next_cursor']
+        if not cursor:
+            return rows
+
+
+@pytest.fixture
+def schools(app_context):
+    """Twelve schools in one upload, with repeated names and some missing cities"""
+    upload = uuid.uuid4().hex
+    storage.merge_schools([
+        {'School Name': f"School {n % 4}", 'Email': f"page{n}@{upload}.example.org",
+         **({'City': f"City {n % 3}"} if n % 5 else {})}
+        for n in range(12)
+    ], upload_id=upload)
+    return upload, [storage.get_school(school_id) for school_id in storage.select_school_ids({'upload': upload})]
+
+
+@pytest.mark.parametrize('sort, key', [
+    ('id', lambda school: school['id']),
+    ('name', lambda school: (school['School Name'].lower(), school['id'])),
+    ('city', lambda school: (school.get('City', ''), school['id'])),
+])
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+def test_school_pages_cover_every_row_once_in_order(client, schools, sort, key, order):
+    upload, records = schools
+
+    rows = walk(client, '/api/schools', 'schools', sort=sort, order=order, upload=upload, limit=5)
+
+    expected = sorted(records, key=key, reverse=order == 'desc')
+    assert [row['id'] for row in rows] == [school['id'] for school in expected]
+
+
+def test_first_page_reports_the_total(client, schools):
+    upload, records = schools
+
+    page = client.get('/api/schools', query_string={'upload': upload, 'limit': 5}).json
+
+    assert page['total'] == len(records)
+    assert 'total' not in client.get('/api/schools', query_string={'upload': upload, 'limit': 5,
+                                                                   'cursor': page['next_cursor']}).json
+
+
+@pytest.mark.parametrize('changed', [{'sort': 'city'}, {'order': 'desc'}, {'upload': 'another-upload'}])
+def test_school_cursor_only_continues_the_query_it_came_from(client, schools, changed):
+    upload, _ = schools
+    params = {'sort': 'name', 'order': 'asc', 'upload': upload, 'limit': 5}
+    cursor = client.get('/api/schools', query_string=params).json['next_cursor']
+
+    response = client.get('/api/schools', query_string={**params, **changed, 'cursor': cursor})
+
+    assert response.status_code == 400
+    assert 'different sort' in response.json['error']
+
+
+def test_malformed_cursor_is_rejected(client):
+    assert client.get('/api/schools', query_string={'cursor': 'not-a-cursor'}).status_code == 400
+    with pytest.raises(ValueError):
+        storage.decode_cursor(storage.encode_cursor([1, 2], {'sort': 'id'})[:-4], {'sort': 'id'})
+
+
+def test_log_pages_follow_timestamp_then_id(client, app_context):
+    category = f"Category {uuid.uuid4().hex}"
+    start = datetime(2026, 1, 1, 12, 0)
+    # Pairs of entries share a timestamp, so the id breaks ties
+    storage.add_logs([{
+        'school_name': f"School {n}", 'email': f"log{n}@example.org", 'template_used': 'T', 'template_id': 1,
+        'status': f"Error ({category}): failed", 'error_category': category,
+        'timestamp': (start + timedelta(minutes=n // 2)).isoformat(), 'email_id': '', 'subject': 'S'
+    } for n in range(9)])
+
+    newest_first = walk(client, '/api/logs', 'logs', category=category, limit=4)
+    oldest_first = walk(client, '/api/logs', 'logs', category=category, order='asc', limit=4)
+
+    assert len(newest_first) == 9
+    assert [log['email'] for log in oldest_first] == [f"log{n}@example.org" for n in range(9)]
+    assert newest_first == oldest_first[::-1]
+
+
+def test_log_cursor_only_continues_the_same_filter(client, app_context):
+    category = f"Category {uuid.uuid4().hex}"
+    storage.add_logs([{
+        'school_name': 'School', 'email': f"filter{n}@example.org", 'template_used': 'T', 'template_id': 1,
+        'status': f"Error ({category}): failed", 'error_category': category,
+        'timestamp': datetime(2026, 1, 1, 12, n).isoformat(), 'email_id': '', 'subject': 'S'
+    } for n in range(3)])
+    cursor = client.get('/api/logs', query_string={'category': category, 'limit': 1}).json['next_cursor']
+
+    assert client.get('/api/logs', query_string={'category': category, 'limit': 1, 'cursor': cursor}).status_code == 200
+    assert client.get('/api/logs', query_string={'category': category, 'outcome': 'error', 'limit': 1,
+                                                  'cursor': cursor}).status_code == 400
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limiter
+
+
+class FakeClock:
+    """Stands in for the time module inside rate_limiter; sleeping advances the clock"""
+
+    def __init__(self, start=1_000_000.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(tmp_path, monkeypatch):
+    """A fresh bucket database refilling 1 token a second up to 2, on a fake clock"""
+    monkeypatch.setattr(rate_limiter, 'RATE_LIMIT_DB', str(tmp_path / 'ratelimit.db'))
+    monkeypatch.setattr(rate_limiter, 'RATE_PER_SECOND', 1.0)
+    monkeypatch.setattr(rate_limiter, 'BURST', 2.0)
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, 'time', clock)
+    rate_limiter.init_limiter()
+    return clock
+
+
+def test_bucket_allows_a_burst_then_refills_at_the_rate(clock):
+    assert rate_limiter._try_acquire('test', 1) == 0
+    assert rate_limiter._try_acquire('test', 1) == 0
+    assert rate_limiter._try_acquire('test', 1) == pytest.approx(1.0)
+
+    clock.sleep(0.5)
+    assert rate_limiter._try_acquire('test', 1) == pytest.approx(0.5)
+    assert rate_limiter.acquire('test') == pytest.approx(0.5)
+
+
+def test_penalize_blocks_every_sender_then_allows_one_send(clock):
+    rate_limiter.penalize(5, 'test')
+
+    assert rate_limiter.fill_level('test')['blocked_for'] == pytest.approx(5)
+    assert rate_limiter._try_acquire('test', 1) == pytest.approx(5)
+
+    clock.sleep(5)
+    # The window reopens with a single token rather than a full burst
+    assert rate_limiter._try_acquire('test', 1) == 0
+    assert rate_limiter._try_acquire('test', 1) == pytest.approx(1.0)
+
+
+def test_penalize_never_shortens_an_existing_block(clock):
+    rate_limiter.penalize(10, 'test')
+    rate_limiter.penalize(2, 'test')
+
+    assert rate_limiter.fill_level('test')['blocked_for'] == pytest.approx(10)
+
+
+def test_acquire_times_out_instead_of_waiting_past_the_block(clock):
+    rate_limiter.penalize(30, 'test')
+
+    with pytest.raises(TimeoutError):
+        rate_limiter.acquire('test', timeout=5)
+
+
+def test_retry_after_is_read_as_seconds_or_an_http_date():
+    later = datetime.now(timezone.utc) + timedelta(seconds=120)
+
+    assert rate_limiter.retry_after_from_error(SimpleNamespace(headers={'Retry-After': '3'})) == 3.0
+    assert rate_limiter.retry_after_from_error(SimpleNamespace(headers={'retry-after': format_datetime(later, usegmt=True)})) \
+        == pytest.approx(120, abs=2)
+    assert rate_limiter.retry_after_from_error(SimpleNamespace(headers={})) is None
+    assert rate_limiter.retry_after_from_error(ValueError('no headers')) is None
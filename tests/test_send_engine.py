@@ -0,0 +1,102 @@
+import app as outreach
+import async_sender
+import send_queue
+import storage
+import template_registry
+import transports
+
+
+class RecordingTransport(transports.Transport):
+    """Accepts every send and remembers what it was given"""
+    name = 'recording'
+    bucket = 'recording'
+
+    def __init__(self):
+        self.sends = []
+        self.batches = []
+
+    async def send(self, params, idempotency_key=None):
+        self.sends.append((params, idempotency_key))
+        return {'id': f"email-{len(self.sends)}"}
+
+    async def send_batch(self, params_list, idempotency_key=None):
+        self.batches.append((params_list, idempotency_key))
+        return {'data': [{'id': f"batch-{len(self.batches)}-{n}"} for n in range(len(params_list))]}
+
+
+def send(client, school_ids, **options):
+    """Queue a send job through the API, run it and return the finished job"""
+    response = client.post('/send', json={
+        'template_id': template_registry.template_ids()[0], 'selected_schools': school_ids, **options
+    })
+    assert response.status_code == 202
+    send_queue.run_pending()
+    return send_queue.get_job(response.json['job_id'])
+
+
+def test_send_job_delivers_each_recipient_once(client, make_schools, mock_provider):
+    school_ids = make_schools(25)
+
+    job = send(client, school_ids)
+
+    assert job['status'] == 'done'
+    assert job['result']['summary']['successful'] == 25
+    assert len(mock_provider.delivered) == 25
+    assert len(set(mock_provider.delivered)) == 25
+    # Contacted schools drop off the list and every send is logged
+    assert not set(school_ids) & set(storage.select_school_ids())
+    logs, _ = storage.page_logs(limit=5, email=storage.get_school(school_ids[0])['Email'])
+    assert [log['status'] for log in logs] == ['Sent']
+
+
+def test_batch_mode_sends_up_to_batch_size_per_request(client, make_schools, mock_provider):
+    school_ids = make_schools(150)
+
+    job = send(client, school_ids, batch_mode=True)
+
+    assert job['result']['summary']['successful'] == 150
+    assert mock_provider.requests == 2
+    assert len(set(mock_provider.delivered)) == 150
+
+
+def test_provider_failures_are_recorded_and_schools_stay_listed(client, make_schools, mock_provider, monkeypatch):
+    monkeypatch.setattr(async_sender, 'MAX_RETRIES', 1)
+    mock_provider.failure_rate = 1.0
+    school_ids = make_schools(5)
+
+    job = send(client, school_ids)
+
+    summary = job['result']['summary']
+    assert job['status'] == 'done'
+    assert (summary['successful'], summary['failed']) == (0, 5)
+    assert sum(summary['error_categories'].values()) == 5
+    assert set(school_ids) <= set(storage.select_school_ids())
+
+
+def test_jobs_send_through_the_transport_they_were_queued_with(make_schools, monkeypatch):
+    monkeypatch.setitem(transports.TRANSPORTS, 'recording', RecordingTransport)
+    monkeypatch.setattr(transports, '_transports', {})
+    school_ids = make_schools(3)
+
+    send_queue.enqueue('send_emails', {
+        'template_id': template_registry.template_ids()[0], 'transport': 'recording', 'school_ids': school_ids
+    }, total=3)
+    send_queue.run_pending()
+
+    transport = transports.get_transport('recording')
+    recipients = [params['to'][0] for params, _ in transport.sends]
+    assert sorted(recipients) == sorted(storage.get_school(school_id)['Email'] for school_id in school_ids)
+    # Every send carries its own idempotency key
+    assert len({key for _, key in transport.sends}) == 3
+
+
+def test_failed_job_reports_the_error_that_stopped_it(client, make_schools, mock_provider, monkeypatch):
+    def failing_record(job_id, outcomes):
+        raise RuntimeError('database is locked')
+
+    monkeypatch.setattr(outreach, 'record_outcomes', failing_record)
+
+    job = send(client, make_schools(3))
+
+    assert job['status'] == 'failed'
+    assert job['error'] == 'database is locked'
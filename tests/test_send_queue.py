@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as outreach
+import async_sender
+import send_queue
+import storage
+import template_registry
+import transports
+
+
+class Crash(BaseException):
+    """Stands in for the worker process dying: nothing in the job catches it"""
+
+
+def backdate_heartbeat(job_id, seconds):
+    conn = send_queue._connect()
+    try:
+        conn.execute('UPDATE jobs SET heartbeat_at = ? WHERE id = ?',
+                     ((datetime.now() - timedelta(seconds=seconds)).isoformat(), job_id))
+    finally:
+        conn.close()
+
+
+def test_claimed_job_is_leased_until_its_heartbeat_expires(monkeypatch):
+    job_id = send_queue.enqueue('test_lease', {})
+    assert send_queue.claim_next('first')['id'] == job_id
+    assert send_queue.claim_next('second') is None
+
+    monkeypatch.setattr(send_queue, 'LEASE_SECONDS', 60)
+    backdate_heartbeat(job_id, 120)
+    resumed = send_queue.claim_next('second')
+
+    assert resumed['id'] == job_id
+    assert send_queue.get_job(job_id)['status'] == 'running'
+    send_queue.finish_job(job_id, {})
+
+
+def test_touch_renews_the_lease(monkeypatch):
+    job_id = send_queue.enqueue('test_lease', {})
+    send_queue.claim_next('first')
+    monkeypatch.setattr(send_queue, 'LEASE_SECONDS', 60)
+    backdate_heartbeat(job_id, 120)
+
+    send_queue.touch(job_id)
+
+    assert send_queue.claim_next('second') is None
+    send_queue.finish_job(job_id, {})
+
+
+def test_recipient_checkpoints_move_from_pending_to_sent():
+    job_id = send_queue.enqueue('test_checkpoints', {})
+    checkpoints = send_queue.load_recipients(job_id, ['1', '2'])
+    assert {recipient: row['state'] for recipient, row in checkpoints.items()} == {'1': 'pending', '2': 'pending'}
+
+    send_queue.mark_sending(job_id, {'1': 'key-1', '2': 'key-2'}, {'1': 7, '2': 8})
+    send_queue.add_results(job_id, [{'status': 'success'}, {'status': 'error'}], [
+        ('1', send_queue.SENT, 'email-1', None), ('2', send_queue.FAILED, None, 'Timeout Error')
+    ])
+
+    checkpoints = send_queue.load_recipients(job_id, ['1', '2'])
+    assert (checkpoints['1']['state'], checkpoints['1']['idempotency_key'], checkpoints['1']['variant']) == ('sent', 'key-1', 7)
+    summary = send_queue.recipient_summary(job_id)
+    assert summary['states'] == {'sent': 1, 'failed': 1}
+    assert summary['error_categories'] == {'Timeout Error': 1}
+    assert summary['variants'] == {7: {'sent': 1}, 8: {'failed': 1}}
+    assert send_queue.get_job(job_id)['processed'] == 2
+    send_queue.finish_job(job_id, {})
+
+
+@pytest.mark.parametrize('batch_mode', [False, True])
+def test_resumed_send_finishes_without_emailing_anyone_twice(client, make_schools, mock_provider, monkeypatch, batch_mode):
+    transport = transports.get_transport('mock')
+    real_send, real_batch = transport.send, transport.send_batch
+    calls = []
+
+    async def crash_after(send, *args):
+        # The provider accepts the request, then the worker dies before recording it
+        result = await send(*args)
+        calls.append(args)
+        if len(calls) == 3:
+            raise Crash()
+        return result
+
+    monkeypatch.setattr(transport, 'send', lambda *args: crash_after(real_send, *args))
+    monkeypatch.setattr(transport, 'send_batch', lambda *args: crash_after(real_batch, *args))
+    monkeypatch.setattr(outreach, 'BATCH_SIZE', 10)
+    school_ids = make_schools(40)
+    job_id = client.post('/send', json={
+        'template_id': template_registry.template_ids()[0], 'selected_schools': school_ids, 'batch_mode': batch_mode
+    }).json['job_id']
+
+    with pytest.raises(Crash):
+        send_queue.run_pending()
+    assert send_queue.get_job(job_id)['status'] == 'running'
+    # Only groups handed to the provider (in flight, or sent but not yet recorded) are left as sending
+    in_doubt = send_queue.recipient_summary(job_id)['states'].get(send_queue.SENDING, 0)
+    assert in_doubt <= (len(calls) + async_sender.SEND_CONCURRENCY) * (outreach.BATCH_SIZE if batch_mode else 1)
+
+    monkeypatch.setattr(send_queue, 'LEASE_SECONDS', 0)
+    send_queue.run_pending()
+
+    job = send_queue.get_job(job_id)
+    assert job['status'] == 'done'
+    assert job['result']['summary']['successful'] == 40
+    assert len(mock_provider.delivered) == 40
+    assert len(set(mock_provider.delivered)) == 40
+
+
+@pytest.mark.parametrize('checkpointed', [False, True])
+def test_crash_while_recording_outcomes_logs_each_recipient_once(client, make_schools, mock_provider, monkeypatch,
+                                                                   checkpointed):
+    real_add_results = send_queue.add_results
+    calls = []
+
+    def crash_around_checkpoint(*args, **kwargs):
+        # The log lines are journaled, then the worker dies just before or just after the checkpoint commits
+        calls.append(args)
+        if len(calls) == 1:
+            if checkpointed:
+                real_add_results(*args, **kwargs)
+            raise Crash()
+        return real_add_results(*args, **kwargs)
+
+    monkeypatch.setattr(send_queue, 'add_results', crash_around_checkpoint)
+    school_ids = make_schools(20)
+    emails = {storage.get_school(school_id)['Email'] for school_id in school_ids}
+    job_id = client.post('/send', json={
+        'template_id': template_registry.template_ids()[0], 'selected_schools': school_ids
+    }).json['job_id']
+
+    with pytest.raises(Crash):
+        send_queue.run_pending()
+    monkeypatch.setattr(send_queue, 'LEASE_SECONDS', 0)
+    send_queue.run_pending()
+
+    assert send_queue.get_job(job_id)['status'] == 'done'
+    logged = [log['email'] for log in storage.iter_logs() if log['email'] in emails]
+    assert sorted(logged) == sorted(emails)
@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+
+import app as outreach
+import template_engine
+import template_registry
+
+SCHOOLS = [
+    {'School Name': 'Green Valley High', 'Email': 'a@example.org', 'Contact Person': 'Ms Rao', 'City': 'Pune'},
+    {'School Name': 'Hill Side School', 'Email': 'b@example.org', 'City': ''},
+    {'School Name': 'Lake View', 'Email': 'c@example.org', 'Contact Person': 'Mr Das', 'principal_name': 'Dr Sen'},
+]
+
+
+@pytest.mark.parametrize('text, school, expected', [
+    ('Hello {{school_name}}', SCHOOLS[0], 'Hello Green Valley High'),
+    # Legacy aliases fall back to '' when the column is empty
+    ('Dear {{contact_person}} in {{city}}', SCHOOLS[1], 'Dear  in '),
+    ('Dear {{ Contact Person|team}}', SCHOOLS[1], 'Dear team'),
+    # Any column matches by normalized name
+    ('Attn {{Principal Name}}', SCHOOLS[2], 'Attn Dr Sen'),
+    # Unknown fields without a default stay as written
+    ('{{unknown}} stays', SCHOOLS[0], '{{unknown}} stays'),
+    ('{{school_name}}/{{school_name}}', SCHOOLS[2], 'Lake View/Lake View'),
+    ('no placeholders', SCHOOLS[0], 'no placeholders'),
+])
+def test_render_text(text, school, expected):
+    assert template_engine.render_text(text, school) == expected
+
+
+@pytest.mark.parametrize('text', [
+    'Hi {{school_name}}, {{contact_person|there}} from {{City|your city}} ({{principal_name}}) {{missing}}',
+    '{{school_name}}',
+    'plain',
+])
+def test_render_frame_matches_render_for_every_row(text):
+    compiled = template_engine.get_compiled(text)
+    frame = pd.DataFrame(SCHOOLS, dtype=object)
+
+    assert template_engine.render_frame(compiled, frame) == [template_engine.render(compiled, school) for school in SCHOOLS]
+
+
+def test_compiled_templates_are_cached_by_id_and_content():
+    compiled = template_engine.get_compiled('Hi {{school_name}}', 1)
+
+    assert template_engine.get_compiled('Hi {{school_name}}', 1) is compiled
+    assert template_engine.get_compiled('Hi {{school_name}}', 2) is not compiled
+
+
+def test_send_job_renders_each_template_from_its_compiled_plan():
+    template_id = template_registry.template_ids()[0]
+    plan = template_registry.get_plan(template_id)
+
+    rendered = outreach.render_school_emails(SCHOOLS, {}, [template_id] * len(SCHOOLS))
+
+    for school, (template, subject, text, html) in zip(SCHOOLS, rendered):
+        assert template['id'] == template_id
+        assert subject == template_engine.render(plan.subject, school)
+        assert text == template_engine.render(plan.text, school)
+
+
+def test_custom_content_overrides_the_template():
+    template_id = template_registry.template_ids()[0]
+    payload = {'custom_subject': 'For {{school_name}}', 'custom_content': 'Body for {{city|you}}'}
+
+    rendered = outreach.render_school_emails(SCHOOLS[:2], payload, [template_id] * 2)
+
+    assert [(subject, text) for _, subject, text, _ in rendered] == [
+        ('For Green Valley High', 'Body for Pune'), ('For Hill Side School', 'Body for you')
+    ]
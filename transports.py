@@ -0,0 +1,241 @@
+import os
+import asyncio
+import hashlib
+import queue
+import smtplib
+import ssl
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from email.message import EmailMessage
+
+import resend
+from resend.exceptions import raise_for_code_and_type
+
+import async_sender  # noqa: F401 - installs the pooled HTTP client used by ResendTransport
+import rate_limiter
+from mock_provider import Simulator
+
+# Provider used when settings.json doesn't pick one
+DEFAULT_TRANSPORT = os.environ.get("EMAIL_TRANSPORT", "resend")
+
+# SMTP relay; connections are kept open and reused across messages and jobs
+SMTP_HOST = os.environ.get("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
+SMTP_USERNAME = os.environ.get("SMTP_USERNAME", "")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD", "")
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "1") == "1"
+SMTP_POOL_SIZE = int(os.environ.get("SMTP_POOL_SIZE", "4"))
+SMTP_TIMEOUT = float(os.environ.get("SMTP_TIMEOUT", "30"))
+
+# In-process mock provider for offline load tests
+MOCK_LATENCY = float(os.environ.get("MOCK_LATENCY_MS", "50")) / 1000
+MOCK_RATE_LIMIT_RATE = float(os.environ.get("MOCK_RATE_LIMIT_RATE", "0"))
+MOCK_FAILURE_RATE = float(os.environ.get("MOCK_FAILURE_RATE", "0"))
+# Delivered addresses and idempotency replies the mock remembers (the oldest are dropped)
+MOCK_HISTORY = int(os.environ.get("MOCK_HISTORY_SIZE", "10000"))
+
+# SMTP replies that mean "slow down" rather than "this message is bad"
+SMTP_THROTTLE_CODES = (421, 450, 451, 454)
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+class Transport(ABC):
+    """Delivers Resend-style send params ({'from', 'to', 'subject', 'text', 'html'})"""
+    name = None
+    label = None
+    # Name of the rate limiter bucket shared by every sender using this provider
+    bucket = None
+
+    @abstractmethod
+    async def send(self, params, idempotency_key=None):
+        """Send one message and return {'id': provider_message_id}"""
+
+    @abstractmethod
+    async def send_batch(self, params_list, idempotency_key=None):
+        """Send several messages, returning {'data': [{'id'}...], 'errors': [{'index', 'message'}...]}"""
+
+    def send_now(self, params):
+        """Send one message from synchronous code, waiting for a rate limiter token first"""
+        rate_limiter.acquire(self.bucket)
+        return asyncio.run(self.send(params))
+
+
+class ResendTransport(Transport):
+    name = 'resend'
+    label = 'Resend API'
+    bucket = rate_limiter.DEFAULT_BUCKET
+
+    async def send(self, params, idempotency_key=None):
+        return await resend.Emails.send_async(params, {'idempotency_key': idempotency_key} if idempotency_key else None)
+
+    async def send_batch(self, params_list, idempotency_key=None):
+        # Permissive validation lets the valid messages through when some are rejected
+        options = {'batch_validation': 'permissive'}
+        if idempotency_key:
+            options['idempotency_key'] = idempotency_key
+        return await resend.Batch.send_async(params_list, options)
+
+
+class SmtpTransport(Transport):
+    """SMTP relay with a pool of persistent connections
+
+    A connection does EHLO/STARTTLS/AUTH once and then carries message after message, and a
+    batch goes out back to back over a single connection. SMTP has no idempotency keys and
+    mail servers don't deduplicate on Message-ID, so resuming a job is at-least-once: the
+    groups that were in flight when the worker died are sent again. The key still becomes
+    the Message-ID, so a repeat can be matched to the original in relay and mailbox logs.
+    """
+    name = 'smtp'
+    label = 'SMTP relay'
+    bucket = 'smtp'
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, username=SMTP_USERNAME, password=SMTP_PASSWORD,
+                 starttls=SMTP_STARTTLS, pool_size=SMTP_POOL_SIZE):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    def _connect(self):
+        connection = smtplib.SMTP(timeout=SMTP_TIMEOUT)
+        self._handshake(connection)
+        return connection
+
+    def _handshake(self, connection):
+        connection.connect(self.host, self.port)
+        connection.ehlo()
+        if self.starttls:
+            connection.starttls(context=ssl.create_default_context())
+            connection.ehlo()
+        if self.username:
+            connection.login(self.username, self.password)
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def _deliver(self, messages):
+        """Send MIME messages over one pooled connection; return an exception or None per message"""
+        errors = []
+        with self._slots:
+            connection = self._checkout()
+            try:
+                for message in messages:
+                    errors.append(self._deliver_one(connection, message))
+                    if isinstance(errors[-1], smtplib.SMTPServerDisconnected):
+                        connection.close()
+                        connection = self._connect()
+            except Exception:
+                connection.close()
+                raise
+            self._idle.put(connection)
+        return errors
+
+    def _deliver_one(self, connection, message):
+        try:
+            try:
+                connection.send_message(message)
+            except smtplib.SMTPServerDisconnected:
+                # Idle pooled connections get dropped by the server; reconnect once
+                self._handshake(connection)
+                connection.send_message(message)
+            return None
+        except smtplib.SMTPRecipientsRefused as e:
+            return Exception(f"Invalid email: recipient refused by SMTP relay ({e.recipients})")
+        except smtplib.SMTPResponseException as e:
+            if e.smtp_code in SMTP_THROTTLE_CODES:
+                return Exception(f"Too many requests: SMTP relay deferred the message ({e.smtp_code} {e.smtp_error!r})")
+            return Exception(f"SMTP error {e.smtp_code}: {e.smtp_error!r}")
+        except smtplib.SMTPServerDisconnected as e:
+            return e
+
+    def _mime(self, params, idempotency_key):
+        message = EmailMessage()
+        message['From'] = params['from']
+        message['To'] = ', '.join(params['to'])
+        message['Subject'] = params['subject']
+        domain = params['from'].rsplit('@', 1)[-1].strip('> ')
+        # Stable across attempts, for tracing only; receiving servers don't deduplicate on it
+        message['Message-ID'] = f"<{idempotency_key or uuid.uuid4().hex}@{domain}>"
+        if params.get('text'):
+            message.set_content(params['text'])
+            if params.get('html'):
+                message.add_alternative(params['html'], subtype='html')
+        else:
+            message.set_content(params.get('html', ''), subtype='html')
+        return message
+
+    async def send(self, params, idempotency_key=None):
+        message = self._mime(params, idempotency_key)
+        error = (await asyncio.to_thread(self._deliver, [message]))[0]
+        if error:
+            raise error
+        return {'id': message['Message-ID']}
+
+    async def send_batch(self, params_list, idempotency_key=None):
+        messages = [
+            self._mime(params, batch_message_key(idempotency_key, params['to'][0]) if idempotency_key else None)
+            for params in params_list
+        ]
+        results = await asyncio.to_thread(self._deliver, messages)
+        return {
+            'data': [{'id': message['Message-ID']} for message, error in zip(messages, results) if not error],
+            'errors': [{'index': index, 'message': str(error)} for index, error in enumerate(results) if error]
+        }
+
+
+def batch_message_key(idempotency_key, address):
+    """Derive a batch recipient's Message-ID key from the batch key and its address
+
+    A resumed batch is re-sent without the recipients that already went out, so positions
+    shift; the address keeps each recipient's Message-ID the same across attempts.
+    """
+    digest = hashlib.blake2b(address.strip().lower().encode('utf-8'), digest_size=8).hexdigest()
+    return f"{idempotency_key}-{digest}"
+
+
+class MockTransport(Transport):
+    """In-process provider simulating latency, 429s and failures (see mock_provider.py)"""
+    name = 'mock'
+    label = 'Mock provider (no emails leave the server)'
+    bucket = 'mock'
+
+    def __init__(self, latency=MOCK_LATENCY, rate_limit_rate=MOCK_RATE_LIMIT_RATE, failure_rate=MOCK_FAILURE_RATE,
+                 history=MOCK_HISTORY):
+        self.simulator = Simulator(latency, rate_limit_rate, failure_rate, history=history)
+
+    async def _request(self, path, body, idempotency_key):
+        await asyncio.sleep(self.simulator.latency)
+        status, payload, headers = self.simulator.respond(path, body, idempotency_key)
+        if status != 200:
+            # Raise exactly what the Resend SDK would, so retries and error categories match
+            raise_for_code_and_type(code=status, error_type=payload['name'], message=payload['message'], headers=headers)
+        return payload
+
+    async def send(self, params, idempotency_key=None):
+        return await self._request('/emails', params, idempotency_key)
+
+    async def send_batch(self, params_list, idempotency_key=None):
+        return await self._request('/emails/batch', params_list, idempotency_key)
+
+
+TRANSPORTS = {transport.name: transport for transport in (ResendTransport, SmtpTransport, MockTransport)}
+
+
+def get_transport(name=None):
+    """Return the shared transport instance for a provider name (default: EMAIL_TRANSPORT)"""
+    name = name or DEFAULT_TRANSPORT
+    if name not in TRANSPORTS:
+        raise ValueError(f"Unknown email transport '{name}'")
+    with _transports_lock:
+        if name not in _transports:
+            _transports[name] = TRANSPORTS[name]()
+        return _transports[name]
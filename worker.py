@@ -0,0 +1,16 @@
+import os
+
+# The web app must not start its own worker threads inside this process
+os.environ.setdefault("SEND_QUEUE_INPROCESS", "0")
+
+import metrics
+import send_queue
+from app import app  # noqa: F401 - registers the send job handlers
+
+# Port for this process's Prometheus metrics (provider, render and job timings); unset to disable
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+
+if __name__ == '__main__':
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT)
+    send_queue.run_forever()